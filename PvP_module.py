@@ -31,7 +31,10 @@ from models import (
     ActiveEffect, Recipe, RecipeIngredient, ChestTemplate,
     ChestReward, GameEvent, EventTrigger, EventReward,
     ResourceTemplate, ResourceSpawn, MobSpawn, MobDrop,
-    ProfessionType, ResourceType, EventType, EventActivationType
+    ProfessionType, ResourceType, EventType, EventActivationType,
+    UserCounters, Leaderboard, PvPChallengeStatus, REFRESH_LEADERBOARD,
+    GET_BATTLE_LOG, GET_USER_BY_TELEGRAM, new_battle_log_entry,
+    DailyStatKind, ADD_DAILY_STAT
 )
 
 # ============ КОНСТАНТЫ И КОНФИГУРАЦИЯ ============
@@ -168,6 +171,25 @@ class PvPManager:
         self.db_session_factory = db_session_factory
         self.active_battles = {}  # {battle_id: battle_data}
         self.active_challenges = {}  # {challenge_id: challenge_data}
+        self._background_tasks: List[asyncio.Task] = []
+    
+    def start_background_tasks(self):
+        """Запуск фоновых задач модуля"""
+        # Снимок рейтинга (leaderboard) для show_pvp_ranking
+        task = asyncio.create_task(self.leaderboard_refresh_task())
+        self._background_tasks.append(task)
+    
+    async def leaderboard_refresh_task(self, interval: int = 60):
+        """Фоновая задача: обновлять снимок рейтинга раз в interval секунд"""
+        while True:
+            try:
+                async with self.db_session_factory() as db:
+                    await db.execute(REFRESH_LEADERBOARD)
+                    await db.commit()
+            except Exception as e:
+                print(f"❌ Ошибка обновления рейтинга: {e}")
+            
+            await asyncio.sleep(interval)
     
     async def restore_state(self):
         """Восстановить все активные PvP состояния при запуске бота"""
@@ -176,14 +198,14 @@ class PvPManager:
                 # 1. Восстановить активные вызовы
                 result = await db.execute(
                     select(PvPChallenge).where(
-                        PvPChallenge.status.in_(["pending", "accepted"])
+                        PvPChallenge.status.in_([PvPChallengeStatus.PENDING, PvPChallengeStatus.ACCEPTED])
                     )
                 )
                 challenges = result.scalars().all()
                 
                 for challenge in challenges:
                     if challenge.expires_at < datetime.utcnow():
-                        challenge.status = "expired"
+                        challenge.status = PvPChallengeStatus.EXPIRED
                         await self.redis.delete(f"pvp_challenge:{challenge.id}")
                     else:
                         challenge_key = f"pvp_challenge:{challenge.id}"
@@ -192,7 +214,7 @@ class PvPManager:
                             "challenger_id": str(challenge.challenger_id),
                             "target_id": str(challenge.target_id),
                             "bet_amount": challenge.bet_amount,
-                            "status": challenge.status,
+                            "status": challenge.status.value,
                             "expires_at": challenge.expires_at.isoformat(),
                         }
                         await self.redis.setex(
@@ -233,7 +255,6 @@ class PvPManager:
                         "started_at": battle.started_at.isoformat(),
                         "last_action_at": battle.last_action_at.isoformat(),
                         "bet_amount": battle.bet_amount,
-                        "battle_log": battle.battle_log or [],
                     }
                     
                     await self.redis.setex(
@@ -268,7 +289,7 @@ class PvPManager:
     async def restore_battle_from_snapshot(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить битву из снапшота"""
         try:
-            snapshot_data = snapshot.snapshot_data
+            snapshot_data = snapshot.payload
             
             # Создаем новую битву на основе снапшота
             battle = ActiveBattle(
@@ -282,8 +303,7 @@ class PvPManager:
                 target_max_hp=snapshot_data.get("target_max_hp", 100),
                 bet_amount=snapshot_data.get("bet_amount", 0),
                 started_at=datetime.fromisoformat(snapshot_data.get("started_at")),
-                last_action_at=datetime.utcnow(),
-                battle_log=snapshot_data.get("battle_log", [])
+                last_action_at=datetime.utcnow()
             )
             
             db.add(battle)
@@ -305,7 +325,6 @@ class PvPManager:
                 "started_at": battle.started_at.isoformat(),
                 "last_action_at": battle.last_action_at.isoformat(),
                 "bet_amount": battle.bet_amount,
-                "battle_log": battle.battle_log or [],
             }
             
             await self.redis.setex(
@@ -452,7 +471,7 @@ class PvPManager:
                 challenger_id=challenger_id,
                 target_id=target_id,
                 bet_amount=bet_amount,
-                status="pending",
+                status=PvPChallengeStatus.PENDING,
                 expires_at=datetime.utcnow() + timedelta(minutes=5)
             )
             
@@ -479,7 +498,7 @@ class PvPManager:
                 "challenger_id": str(challenger_id),
                 "target_id": str(target_id),
                 "bet_amount": bet_amount,
-                "status": "pending",
+                "status": PvPChallengeStatus.PENDING.value,
                 "expires_at": challenge.expires_at.isoformat(),
             }
             
@@ -501,11 +520,11 @@ class PvPManager:
             if not challenge:
                 raise ValueError("Вызов не найден")
             
-            if challenge.status != "pending":
+            if challenge.status != PvPChallengeStatus.PENDING:
                 raise ValueError("Вызов уже обработан")
             
             if challenge.expires_at < datetime.utcnow():
-                challenge.status = "expired"
+                challenge.status = PvPChallengeStatus.EXPIRED
                 await db.commit()
                 raise ValueError("Вызов истек")
             
@@ -531,14 +550,13 @@ class PvPManager:
                 target_max_hp=await self.calculate_max_hp(db, target),
                 bet_amount=challenge.bet_amount * 2,  # Ставка удваивается
                 started_at=datetime.utcnow(),
-                last_action_at=datetime.utcnow(),
-                battle_log=[]
+                last_action_at=datetime.utcnow()
             )
             
             db.add(battle)
             
             # Обновляем статус вызова
-            challenge.status = "accepted"
+            challenge.status = PvPChallengeStatus.ACCEPTED
             
             # Логируем
             audit_log = AuditLog(
@@ -567,7 +585,6 @@ class PvPManager:
                 "started_at": battle.started_at.isoformat(),
                 "last_action_at": battle.last_action_at.isoformat(),
                 "bet_amount": battle.bet_amount,
-                "battle_log": battle.battle_log or [],
             }
             
             await self.redis.setex(
@@ -714,9 +731,9 @@ class PvPManager:
                     }
             
             # Обновляем лог битвы
-            current_log = battle.battle_log or []
-            current_log.append(battle_log_entry)
-            battle.battle_log = current_log
+            db.add(new_battle_log_entry(
+                battle, "player" if is_player_attacking else "target", battle_log_entry
+            ))
             battle.last_action_at = datetime.utcnow()
             
             # Проверяем окончание битвы
@@ -739,7 +756,6 @@ class PvPManager:
                 "started_at": battle.started_at.isoformat(),
                 "last_action_at": battle.last_action_at.isoformat(),
                 "bet_amount": battle.bet_amount,
-                "battle_log": battle.battle_log or [],
             }
             
             await self.redis.setex(
@@ -778,6 +794,9 @@ class PvPManager:
         await self.update_pvp_stats(db, winner_id, loser_id, True)
         await self.update_pvp_stats(db, loser_id, winner_id, False)
         
+        # Собираем лог битвы одним запросом для архивной записи матча
+        battle_log = list((await db.scalars(GET_BATTLE_LOG, {"battle_id": battle.id})).all())
+        
         # Создаем запись о матче
         pvp_match = PvPMatch(
             player1_id=battle.user_id,
@@ -787,10 +806,10 @@ class PvPManager:
             loser_id=loser_id,
             player1_hp_lost=battle.player_max_hp - battle.player_hp if battle.player_hp > 0 else battle.player_max_hp,
             player2_hp_lost=battle.target_max_hp - battle.target_hp if battle.target_hp > 0 else battle.target_max_hp,
-            rounds_count=len(battle.battle_log or []),
+            rounds_count=len(battle_log),
             started_at=battle.started_at,
             ended_at=datetime.utcnow(),
-            battle_log=battle.battle_log
+            battle_log=battle_log
         )
         
         db.add(pvp_match)
@@ -849,9 +868,12 @@ class PvPManager:
         player_stat = player_stat.scalar_one_or_none()
         
         if player_stat:
-            if won:
-                player_stat.daily_players_killed += 1
             player_stat.last_pvp_time = datetime.utcnow()
+        
+        if won:
+            await db.execute(ADD_DAILY_STAT, {
+                "user_id": player_id, "kind": DailyStatKind.PLAYERS_KILLED, "amount": 1
+            })
 
 # ============ ХЭНДЛЕРЫ ДЛЯ АДМИН-ПАНЕЛИ ============
 
@@ -969,10 +991,7 @@ async def show_pvp_menu(callback: CallbackQuery):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -983,7 +1002,7 @@ async def show_pvp_menu(callback: CallbackQuery):
             select(PvPChallenge).where(
                 and_(
                     PvPChallenge.target_id == user.id,
-                    PvPChallenge.status == "pending"
+                    PvPChallenge.status == PvPChallengeStatus.PENDING
                 )
             )
         )
@@ -1018,9 +1037,11 @@ async def show_pvp_ranking(callback: CallbackQuery):
     from database import get_db_session
     
     async with get_db_session() as db:
-        # Получаем топ игроков по убийствам
+        # Получаем топ игроков по убийствам из снимка рейтинга
         top_players = await db.execute(
-            select(User).order_by(desc(User.players_killed)).limit(10)
+            select(Leaderboard)
+            .order_by(desc(Leaderboard.players_killed))
+            .limit(10)
         )
         top_players = top_players.scalars().all()
         
@@ -1071,6 +1092,7 @@ async def init_pvp_module(redis_client, db_session_factory):
     """Инициализировать модуль PvP"""
     pvp_manager = PvPManager(redis_client, db_session_factory)
     await pvp_manager.restore_state()
+    pvp_manager.start_background_tasks()
     return pvp_manager
 
 # Экспортируемые объекты
@@ -37,7 +37,8 @@ from models import (
     Recipe, RecipeIngredient, ProfessionType, ActiveAction, ActionType,
     ActiveBattle, BattleStatus, PvPChallenge, PvPMatch, SystemSettings,
     AuditLog, PlayerStat, ActiveEffect, Inventory, Discovery, BackupLog,
-    StateSnapshot, LocationType, MobType
+    StateSnapshot, LocationType, MobType, UserCounters,
+    DailyStatKind, GET_TODAY_STATS, maintain_snapshot_partitions
 )
 
 # ============ КОНСТАНТЫ ============
@@ -161,10 +162,31 @@ class AdminManager:
         self.redis = redis_client
         self.engine = engine
         self.backup_dir = "backups"
+        self._background_tasks: List[asyncio.Task] = []
         
         # Создаем директорию для бэкапов
         os.makedirs(self.backup_dir, exist_ok=True)
     
+    def start_background_tasks(self):
+        """Запуск фоновых задач обслуживания БД"""
+        # Секции state_snapshots: новые дни вперед, истекшие удаляются целиком
+        task = asyncio.create_task(self.snapshot_partitions_task())
+        self._background_tasks.append(task)
+    
+    async def snapshot_partitions_task(self, interval: int = 3600):
+        """Фоновая задача: обслуживание секций снапшотов раз в interval секунд"""
+        while True:
+            try:
+                async with self.db_session_factory() as db:
+                    dropped = await maintain_snapshot_partitions(db)
+                    await db.commit()
+                if dropped:
+                    print(f"✅ Удалено секций истекших снапшотов: {dropped}")
+            except Exception as e:
+                print(f"❌ Ошибка обслуживания секций снапшотов: {e}")
+            
+            await asyncio.sleep(interval)
+    
     async def check_admin_access(self, telegram_id: int) -> bool:
         """Проверить доступ к админ-панели"""
         async with self.db_session_factory() as db:
@@ -275,7 +297,7 @@ class AdminManager:
         stats['active_events'] = active_events.scalar()
         
         # Общее золото в экономике
-        total_gold = await db.execute(select(func.sum(User.gold)))
+        total_gold = await db.execute(select(func.sum(UserCounters.gold)))
         stats['total_gold'] = total_gold.scalar() or 0
         
         # Средний уровень игроков
@@ -288,7 +310,7 @@ class AdminManager:
         
         # Последний бэкап
         last_backup = await db.execute(
-            select(BackupLog).order_by(BackupLog.created_at.desc()).limit(1)
+            select(BackupLog).order_by(BackupLog.id.desc()).limit(1)
         )
         last_backup = last_backup.scalar_one_or_none()
         stats['last_backup'] = last_backup.created_at if last_backup else None
@@ -379,6 +401,10 @@ class AdminManager:
         )
         player_stat = stats.scalar_one_or_none()
         
+        # Дневные счетчики за сегодня
+        today_stats = await db.execute(GET_TODAY_STATS, {"user_id": player_id})
+        daily_stats = {DailyStatKind(kind).name.lower(): amount for kind, amount in today_stats}
+        
         # Получаем инвентарь
         inventory_result = await db.execute(
             select(Inventory)
@@ -390,35 +416,8 @@ class AdminManager:
         )
         inventory = inventory_result.scalar_one_or_none()
         
-        # Получаем экипировку с деталями
-        equipped_items = {}
-        if player.weapon_id:
-            weapon_result = await db.execute(
-                select(Item)
-                .where(Item.id == player.weapon_id)
-                .options(selectinload(Item.template))
-            )
-            weapon = weapon_result.scalar_one_or_none()
-            if weapon and weapon.template:
-                equipped_items['weapon'] = {
-                    'name': weapon.template.name,
-                    'icon': weapon.template.icon,
-                    'damage': f"{weapon.template.damage_min}-{weapon.template.damage_max}"
-                }
-        
-        if player.armor_id:
-            armor_result = await db.execute(
-                select(Item)
-                .where(Item.id == player.armor_id)
-                .options(selectinload(Item.template))
-            )
-            armor = armor_result.scalar_one_or_none()
-            if armor and armor.template:
-                equipped_items['armor'] = {
-                    'name': armor.template.name,
-                    'icon': armor.template.icon,
-                    'defense': armor.template.defense
-                }
+        # Экипировка берется из денормализованного снимка, без JOIN к items
+        equipped_items = dict(player.equipped or {})
         
         # Получаем последние 5 битв
         last_battles = await db.execute(
@@ -486,6 +485,7 @@ class AdminManager:
         return {
             'player': player,
             'stats': player_stat,
+            'daily_stats': daily_stats,
             'inventory': inventory,
             'equipped_items': equipped_items,
             'last_battles': last_battles,
@@ -1509,7 +1509,7 @@ class AdminManager:
         """Получить список бэкапов"""
         result = await db.execute(
             select(BackupLog)
-            .order_by(desc(BackupLog.created_at))
+            .order_by(desc(BackupLog.id))
             .limit(limit)
         )
         return result.scalars().all()
@@ -2923,6 +2923,8 @@ async def init_admin_module(db_session_factory, redis_client=None, engine=None):
                     uuid.UUID('00000000-0000-0000-0000-000000000000')  # Системный ID
                 )
     
+    admin_manager.start_background_tasks()
+    
     print("✅ Админ-модуль инициализирован")
     return admin_manager
 
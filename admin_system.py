@@ -49,6 +49,9 @@ class AdminSystem:
         self._is_initialized = False
         self._background_tasks: List[asyncio.Task] = []
         
+        # Общий клиент Redis (пул хранилища FSM), None без Redis
+        self.redis = None
+        
         # Инициализация менеджеров
         self.database: Optional[DatabaseManager] = None
         self.security: Optional[SecurityManager] = None
@@ -120,6 +123,7 @@ class AdminSystem:
         if self.config.database.use_redis:
             from aiogram.fsm.storage.redis import RedisStorage
             storage = RedisStorage.from_url(self.config.database.redis_url)
+            self.redis = storage.redis
         else:
             from aiogram.fsm.storage.memory import MemoryStorage
             storage = MemoryStorage()
@@ -358,6 +362,19 @@ class AdminSystem:
             task = asyncio.create_task(self._statistics_task())
             self._background_tasks.append(task)
         
+        # Пакетная запись логов действий
+        task = asyncio.create_task(self.security.action_log_writer_task())
+        self._background_tasks.append(task)
+        
+        # Пакетная вставка жалоб
+        if "reports" in self.config.enabled_modules:
+            task = asyncio.create_task(self.reports.report_insert_writer_task())
+            self._background_tasks.append(task)
+            
+            # Уведомления о мерах по жалобам в рамках лимитов Telegram
+            task = asyncio.create_task(self.reports.notification_sender_task())
+            self._background_tasks.append(task)
+        
         # Задача очистки старых данных
         task = asyncio.create_task(self._cleanup_task())
         self._background_tasks.append(task)
@@ -371,6 +388,10 @@ class AdminSystem:
         if "rating" in self.config.enabled_modules:
             task = asyncio.create_task(self._rating_decay_task())
             self._background_tasks.append(task)
+            
+            # Отложенная запись начислений рейтинга
+            task = asyncio.create_task(self.rating.flush_loop())
+            self._background_tasks.append(task)
         
         # Задача создания бэкапов
         if "backup" in self.config.enabled_modules:
@@ -586,6 +607,17 @@ class AdminSystem:
         if self._background_tasks:
             await asyncio.gather(*self._background_tasks, return_exceptions=True)
         
+        # Дописываем буферы. Порядок важен: созданные жалобы и начисления пишут логи действий,
+        # поэтому логи - последними
+        if self.reports and self.database:
+            await self.reports.flush_report_inserts()
+            # Ожидающие create_report продолжаются и ставят REPORT_SUBMITTED в буфер логов
+            await asyncio.sleep(0)
+        if self.rating and self.database:
+            await self.rating.flush_pending()
+        if self.security and self.database:
+            await self.security.flush_action_logs()
+        
         # Закрытие соединения с БД
         if self.database:
             await self.database.close()
@@ -19,7 +19,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQu
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select, update, and_, or_, desc, func, delete
+from sqlalchemy import select, insert, update, and_, or_, desc, func, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload, joinedload
 
@@ -27,7 +27,9 @@ from models import (
     User, ActiveBattle, BattleStatus, MobTemplate, MobDrop,
     Item, ItemTemplate, ActiveAction, ActionType, StateSnapshot,
     AuditLog, PlayerStat, ActiveEffect, Inventory, Location,
-    SystemSettings, Discovery, ItemRarity, ItemType, MobType
+    SystemSettings, Discovery, ItemRarity, ItemType, MobType,
+    GET_ACTIVE_BATTLE, GET_USER_BY_TELEGRAM, new_battle_log_entry,
+    DailyStatKind, ADD_DAILY_STAT
 )
 
 # ============ КОНСТАНТЫ И КОНФИГУРАЦИЯ ============
@@ -99,6 +101,18 @@ class BattleEffect:
     source: str
     target_id: uuid.UUID
 
+@dataclass(frozen=True)
+class CachedDrop:
+    """Строка таблицы дропа моба, закэшированная в памяти"""
+    item_template_id: uuid.UUID
+    drop_chance: float
+    min_quantity: int
+    max_quantity: int
+    stack_size: int
+    name: str
+    icon: str
+    rarity: str
+
 # ============ МЕНЕДЖЕР ФОРМУЛ ============
 
 class BattleFormulaManager:
@@ -174,6 +188,7 @@ class BattleManager:
         self.db_session_factory = db_session_factory
         self.active_battles = {}  # {battle_id: battle_data}
         self.mob_cache = {}  # {mob_id: mob_data}
+        self.drop_tables: Dict[uuid.UUID, List[CachedDrop]] = {}  # {mob_template_id: [CachedDrop]}
         self.skills = self._load_skills()
         self.battle_effects = {}  # {battle_id: [BattleEffect]}
     
@@ -238,10 +253,58 @@ class BattleManager:
             )
         }
     
+    @staticmethod
+    def _drop_table_stmt():
+        """Запрос строк дропа вместе с нужными полями шаблона предмета"""
+        return select(
+            MobDrop.mob_template_id, MobDrop.item_template_id,
+            MobDrop.drop_chance, MobDrop.min_quantity, MobDrop.max_quantity,
+            ItemTemplate.stack_size, ItemTemplate.name, ItemTemplate.icon,
+            ItemTemplate.rarity
+        ).join(ItemTemplate, MobDrop.item_template_id == ItemTemplate.id)
+    
+    @staticmethod
+    def _to_cached_drop(row) -> CachedDrop:
+        return CachedDrop(
+            item_template_id=row.item_template_id,
+            drop_chance=row.drop_chance,
+            min_quantity=row.min_quantity,
+            max_quantity=row.max_quantity,
+            stack_size=row.stack_size,
+            name=row.name,
+            icon=row.icon,
+            rarity=row.rarity.value
+        )
+    
+    async def load_drop_tables(self, db: AsyncSession):
+        """Загрузить таблицы дропа всех мобов одним запросом"""
+        result = await db.execute(self._drop_table_stmt())
+        
+        drop_tables: Dict[uuid.UUID, List[CachedDrop]] = {}
+        for row in result:
+            drop_tables.setdefault(row.mob_template_id, []).append(self._to_cached_drop(row))
+        
+        self.drop_tables = drop_tables
+        print(f"✅ Загружены таблицы дропа для {len(drop_tables)} мобов")
+    
+    async def get_mob_drops(self, db: AsyncSession, mob_template_id: uuid.UUID) -> List[CachedDrop]:
+        """Получить таблицу дропа моба из памяти (догружает мобов, созданных после старта)"""
+        drops = self.drop_tables.get(mob_template_id)
+        if drops is None:
+            result = await db.execute(
+                self._drop_table_stmt().where(MobDrop.mob_template_id == mob_template_id)
+            )
+            drops = [self._to_cached_drop(row) for row in result]
+            self.drop_tables[mob_template_id] = drops
+        return drops
+    
     async def restore_state(self):
         """Восстановить все активные битвы при запуске бота"""
         async with self.db_session_factory() as db:
             try:
+                # 0. Загрузить таблицы дропа в память
+                await self.load_drop_tables(db)
+                
                 # 1. Восстановить активные битвы
                 result = await db.execute(
                     select(ActiveBattle).where(
@@ -273,8 +336,7 @@ class BattleManager:
                         "status": battle.status.value,
                         "started_at": battle.started_at.isoformat(),
                         "last_action_at": battle.last_action_at.isoformat(),
-                        "battle_log": battle.battle_log or [],
-                        "turn": len(battle.battle_log or []) + 1,
+                        "turn": battle.log_size + 1,
                         "effects": []
                     }
                     
@@ -312,21 +374,20 @@ class BattleManager:
     
     async def restore_battle_from_snapshot(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить битву из снапшота"""
-        snapshot_data = snapshot.snapshot_data
+        snapshot_data = snapshot.payload
         
         # Создаем новую битву на основе снапшота
         battle = ActiveBattle(
             id=uuid.uuid4(),
             user_id=snapshot.user_id,
-            mob_template_id=uuid.UUID(snapshot_data.get("mob_template_id")),
+            mob_template_id=snapshot.target_id,
             status=BattleStatus.ACTIVE,
             player_hp=snapshot_data.get("player_hp", 100),
             player_max_hp=snapshot_data.get("player_max_hp", 100),
             target_hp=snapshot_data.get("target_hp", 100),
             target_max_hp=snapshot_data.get("target_max_hp", 100),
             started_at=datetime.fromisoformat(snapshot_data.get("started_at")),
-            last_action_at=datetime.utcnow(),
-            battle_log=snapshot_data.get("battle_log", [])
+            last_action_at=datetime.utcnow()
         )
         
         db.add(battle)
@@ -347,8 +408,7 @@ class BattleManager:
             "status": battle.status.value,
             "started_at": battle.started_at.isoformat(),
             "last_action_at": battle.last_action_at.isoformat(),
-            "battle_log": battle.battle_log or [],
-            "turn": len(battle.battle_log or []) + 1,
+            "turn": 1,
             "effects": []
         }
         
@@ -402,14 +462,7 @@ class BattleManager:
             return {"error": f"Слишком низкий уровень. Моб: {mob_template.level}"}
         
         # Проверяем есть ли активный бой
-        result = await db.execute(
-            select(ActiveBattle).where(
-                and_(
-                    ActiveBattle.user_id == user_id,
-                    ActiveBattle.status == BattleStatus.ACTIVE
-                )
-            )
-        )
+        result = await db.execute(GET_ACTIVE_BATTLE, {"user_id": user_id})
         active_battle = result.scalar_one_or_none()
         
         if active_battle:
@@ -435,8 +488,7 @@ class BattleManager:
             target_hp=mob_hp,
             target_max_hp=mob_hp,
             started_at=datetime.utcnow(),
-            last_action_at=datetime.utcnow(),
-            battle_log=[]
+            last_action_at=datetime.utcnow()
         )
         
         db.add(battle)
@@ -447,15 +499,14 @@ class BattleManager:
             user_id=user_id,
             entity_id=battle.id,
             entity_type="active_battle",
-            snapshot_data={
-                "mob_template_id": str(mob_template_id),
+            target_id=mob_template_id,
+            **StateSnapshot.pack_payload({
                 "player_hp": player_max_hp,
                 "player_max_hp": player_max_hp,
                 "target_hp": mob_hp,
                 "target_max_hp": mob_hp,
-                "started_at": battle.started_at.isoformat(),
-                "battle_log": []
-            },
+                "started_at": battle.started_at.isoformat()
+            }),
             expires_at=datetime.utcnow() + timedelta(hours=2)
         )
         db.add(snapshot)
@@ -491,7 +542,6 @@ class BattleManager:
             "started_at": battle.started_at.isoformat(),
             "last_action_at": battle.last_action_at.isoformat(),
             "battle_type": "boss" if mob_template.is_boss else "elite" if mob_template.level > user.level + 5 else "mob",
-            "battle_log": [],
             "turn": 1,
             "effects": [],
             "skill_cooldowns": {}
@@ -853,16 +903,12 @@ class BattleManager:
                     }
                     mob_log.update(mob_result.get("log", {}))
                     
-                    current_log = battle.battle_log or []
-                    current_log.append(mob_log)
-                    battle.battle_log = current_log
+                    db.add(new_battle_log_entry(battle, "mob", mob_log))
                     
                     result["mob_turn"] = mob_result
             
             # Обновляем лог битвы
-            current_log = battle.battle_log or []
-            current_log.append(battle_log_entry)
-            battle.battle_log = current_log
+            db.add(new_battle_log_entry(battle, "player", battle_log_entry))
             battle.last_action_at = datetime.utcnow()
             
             # Обновляем кд навыков
@@ -1257,15 +1303,14 @@ class BattleManager:
         rewards["gold"] = int(gold)
         user.gold += int(gold)
         user.total_gold_earned += int(gold)
+        await db.execute(ADD_DAILY_STAT, {
+            "user_id": user.id, "kind": DailyStatKind.GOLD_EARNED, "amount": int(gold)
+        })
         
         # Дроп предметов
-        result = await db.execute(
-            select(MobDrop).where(MobDrop.mob_template_id == mob_template.id).options(
-                selectinload(MobDrop.item_template)
-            )
-        )
-        drops = result.scalars().all()
+        drops = await self.get_mob_drops(db, mob_template.id)
         
+        dropped: List[Tuple[CachedDrop, int]] = []
         for drop in drops:
             drop_chance = await BattleFormulaManager.calculate_formula(db, "drop_chance", {
                 "base_chance": drop.drop_chance,
@@ -1275,17 +1320,18 @@ class BattleManager:
             
             if random.random() < drop_chance:
                 quantity = random.randint(drop.min_quantity, drop.max_quantity)
-                
-                # Добавляем предмет в инвентарь
-                await self._add_item_to_inventory(db, user.id, drop.item_template, quantity)
+                dropped.append((drop, quantity))
                 
                 rewards["items"].append({
-                    "name": drop.item_template.name,
-                    "icon": drop.item_template.icon,
+                    "name": drop.name,
+                    "icon": drop.icon,
                     "quantity": quantity,
-                    "rarity": drop.item_template.rarity.value
+                    "rarity": drop.rarity
                 })
         
+        # Добавляем весь дроп в инвентарь разом
+        await self._add_items_to_inventory(db, user.id, dropped)
+        
         # Проверяем повышение уровня
         await self._check_level_up(db, user)
         
@@ -1338,9 +1384,12 @@ class BattleManager:
         
         return penalty
     
-    async def _add_item_to_inventory(self, db: AsyncSession, user_id: uuid.UUID, 
-                                    item_template: ItemTemplate, quantity: int):
-        """Добавить предмет в инвентарь"""
+    async def _add_items_to_inventory(self, db: AsyncSession, user_id: uuid.UUID,
+                                     dropped: List[Tuple[CachedDrop, int]]) -> List[uuid.UUID]:
+        """Добавить выпавшие предметы в инвентарь (новые предметы - одним INSERT)"""
+        if not dropped:
+            return []
+        
         # Ищем инвентарь
         result = await db.execute(
             select(Inventory).where(Inventory.user_id == user_id)
@@ -1352,28 +1401,49 @@ class BattleManager:
             db.add(inventory)
             await db.flush()
         
-        # Проверяем есть ли такой предмет в инвентаре
+        # Уже имеющиеся у игрока стаки этих предметов - одним запросом
         result = await db.execute(
             select(Item).where(
                 and_(
                     Item.owner_id == user_id,
-                    Item.template_id == item_template.id
+                    Item.template_id.in_([drop.item_template_id for drop, _ in dropped])
                 )
             )
         )
-        existing_item = result.scalar_one_or_none()
-        
-        if existing_item and item_template.stack_size > 1:
-            # Увеличиваем количество
-            existing_item.quantity += quantity
-        else:
+        existing_items: Dict[uuid.UUID, Item] = {}
+        for item in result.scalars():
+            existing_items.setdefault(item.template_id, item)
+        
+        new_rows: List[Dict[str, Any]] = []
+        new_stacks: Dict[uuid.UUID, Dict[str, Any]] = {}
+        for drop, quantity in dropped:
+            if drop.stack_size > 1:
+                existing_item = existing_items.get(drop.item_template_id)
+                if existing_item:
+                    # Увеличиваем количество
+                    existing_item.quantity += quantity
+                    continue
+                if drop.item_template_id in new_stacks:
+                    new_stacks[drop.item_template_id]["quantity"] += quantity
+                    continue
+            
             # Создаем новый предмет
-            new_item = Item(
-                template_id=item_template.id,
-                owner_id=user_id,
-                quantity=quantity
-            )
-            db.add(new_item)
+            row = {
+                "template_id": drop.item_template_id,
+                "owner_id": user_id,
+                "quantity": quantity
+            }
+            new_rows.append(row)
+            if drop.stack_size > 1:
+                new_stacks[drop.item_template_id] = row
+        
+        if not new_rows:
+            return []
+        
+        result = await db.execute(
+            insert(Item).values(new_rows).returning(Item.id)
+        )
+        return list(result.scalars().all())
     
     async def _check_level_up(self, db: AsyncSession, user: User):
         """Проверить повышение уровня"""
@@ -1422,7 +1492,9 @@ class BattleManager:
             await db.flush()
         
         if victory:
-            player_stat.daily_mobs_killed += 1
+            await db.execute(ADD_DAILY_STAT, {
+                "user_id": user_id, "kind": DailyStatKind.MOBS_KILLED, "amount": 1
+            })
         
         player_stat.last_battle_time = datetime.utcnow()
     
@@ -1444,7 +1516,6 @@ class BattleManager:
             "target_max_hp": battle.target_max_hp,
             "status": battle.status.value,
             "last_action_at": battle.last_action_at.isoformat(),
-            "battle_log": battle.battle_log or [],
             "turn": battle_data.get("turn", 1) + 1
         })
         
@@ -1461,14 +1532,8 @@ class BattleManager:
         """Получить активный бой игрока"""
         async with self.db_session_factory() as db:
             result = await db.execute(
-                select(ActiveBattle).where(
-                    and_(
-                        ActiveBattle.user_id == user_id,
-                        ActiveBattle.status == BattleStatus.ACTIVE
-                    )
-                ).options(
-                    selectinload(ActiveBattle.mob_template)
-                )
+                GET_ACTIVE_BATTLE.options(selectinload(ActiveBattle.mob_template)),
+                {"user_id": user_id}
             )
             battle = result.scalar_one_or_none()
             
@@ -1768,10 +1833,7 @@ async def show_battle_menu(callback: CallbackQuery):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1823,10 +1885,7 @@ async def show_available_mobs(callback: CallbackQuery):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1897,10 +1956,7 @@ async def start_battle_handler(callback: CallbackQuery, mob_id: uuid.UUID):
     from main import battle_manager
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1937,10 +1993,7 @@ async def show_active_battle(callback: CallbackQuery):
     from main import battle_manager
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2119,10 +2172,7 @@ async def show_player_skills(callback: CallbackQuery):
     from main import battle_manager
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -113,6 +113,10 @@ class AdminConfig:
     default_language: str = "ru"
     timezone: str = "Europe/Moscow"
     
+    # Служебный чат/канал для сообщений из жалоб (бот должен быть в нем админом).
+    # Сообщение пересылается туда один раз и остается доступным админам после удаления оригинала
+    reports_log_chat_id: Optional[int] = None
+    
     # Включенные модули
     enabled_modules: List[str] = field(default_factory=lambda: [
         "admin_panel", "user_management", "chat_management",
@@ -145,6 +149,7 @@ class AdminConfig:
             "main_admins": self.main_admins,
             "default_language": self.default_language,
             "timezone": self.timezone,
+            "reports_log_chat_id": self.reports_log_chat_id,
             "enabled_modules": self.enabled_modules,
             "database": {
                 "path": self.database.path,
@@ -38,6 +38,11 @@ class DatabaseManager:
             if self.connection is None:
                 self.connection = await aiosqlite.connect(self.db_path)
                 self.connection.row_factory = aiosqlite.Row
+                # WAL: читатели не ждут писателей, а commit не делает fsync журнала
+                # при synchronous=NORMAL (fsync - на контрольных точках)
+                await self.connection.execute("PRAGMA journal_mode=WAL")
+                await self.connection.execute("PRAGMA synchronous=NORMAL")
+                await self.connection.execute("PRAGMA temp_store=MEMORY")
                 await self._initialize_database()
                 await self._run_migrations()
     
@@ -191,7 +196,9 @@ class DatabaseManager:
                     handled_by INTEGER,
                     handled_at TIMESTAMP,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    bot_id INTEGER DEFAULT 0
+                    bot_id INTEGER DEFAULT 0,
+                    reporter_name TEXT,
+                    reported_name TEXT
                 )
             """,
             "giveaways": """
@@ -254,6 +261,15 @@ class DatabaseManager:
                     bot_id INTEGER DEFAULT 0,
                     PRIMARY KEY (poll_id, user_id, bot_id)
                 )
+            """,
+            "user_achievements": """
+                CREATE TABLE IF NOT EXISTS {} (
+                    user_id INTEGER,
+                    name TEXT,
+                    granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    bot_id INTEGER DEFAULT 0,
+                    PRIMARY KEY (user_id, bot_id, name)
+                )
             """
         }
         
@@ -313,6 +329,11 @@ class DatabaseManager:
             (2, "add_metadata_fields", self._migration_2_metadata),
             (3, "add_statistics_indexes", self._migration_3_indexes),
             (4, "add_chat_settings", self._migration_4_chat_settings),
+            (5, "add_users_bot_rating_index", self._migration_5_users_bot_rating),
+            (6, "cover_users_bot_rating_index", self._migration_6_users_top_cover),
+            (7, "add_reports_list_index", self._migration_7_reports_list),
+            (8, "add_reports_user_names", self._migration_8_reports_names),
+            (9, "add_reports_cleanup_index", self._migration_9_reports_cleanup),
         ]
         
         # Применение миграций
@@ -373,6 +394,71 @@ class DatabaseManager:
         # Уже есть в основной схеме
         pass
     
+    async def _migration_5_users_bot_rating(self):
+        """Составной индекс для топа и позиции в рейтинге внутри бота"""
+        index_name = "idx_users_bot_rating"
+        index_name_full = f"{self.prefix}_{index_name}" if self.prefix else index_name
+        await self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name_full} "
+            f"ON {self.get_table_name('users')} (bot_id, rating DESC)"
+        )
+    
+    async def _migration_6_users_top_cover(self):
+        """Покрывающий индекс для топа: запрос топа читает только индекс, без таблицы и сортировки"""
+        old_index = "idx_users_bot_rating"
+        index_name = "idx_users_top_cover"
+        old_index_full = f"{self.prefix}_{old_index}" if self.prefix else old_index
+        index_name_full = f"{self.prefix}_{index_name}" if self.prefix else index_name
+        await self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name_full} "
+            f"ON {self.get_table_name('users')} (bot_id, rating DESC, user_id, first_name, last_name)"
+        )
+        # Тот же префикс (bot_id, rating) - старый индекс больше не нужен и для get_rank_by_rating
+        await self.connection.execute(f"DROP INDEX IF EXISTS {old_index_full}")
+    
+    async def _migration_7_reports_list(self):
+        """Индекс для списка жалоб: (bot_id, status) + неявный rowid дает поиск по ключу id без сортировки"""
+        index_name = "idx_reports_bot_status"
+        index_name_full = f"{self.prefix}_{index_name}" if self.prefix else index_name
+        await self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name_full} "
+            f"ON {self.get_table_name('reports')} (bot_id, status)"
+        )
+    
+    async def _migration_8_reports_names(self):
+        """Имена участников жалобы в самой строке: список жалоб читается без JOIN с users"""
+        reports_table = self.get_table_name('reports')
+        users_table = self.get_table_name('users')
+        
+        cursor = await self.connection.execute(f"PRAGMA table_info({reports_table})")
+        columns = [row[1] for row in await cursor.fetchall()]
+        await cursor.close()
+        
+        for column in ("reporter_name", "reported_name"):
+            if column not in columns:
+                await self.connection.execute(
+                    f"ALTER TABLE {reports_table} ADD COLUMN {column} TEXT"
+                )
+        
+        # Заполнение для уже существующих жалоб - тем, что раньше давал JOIN
+        await self.connection.execute(
+            f"""
+            UPDATE {reports_table} SET
+                reporter_name = (SELECT first_name FROM {users_table} u WHERE u.user_id = reporter_id),
+                reported_name = (SELECT first_name FROM {users_table} u WHERE u.user_id = reported_user_id)
+            WHERE reporter_name IS NULL AND reported_name IS NULL
+            """
+        )
+    
+    async def _migration_9_reports_cleanup(self):
+        """Индекс для очистки старых жалоб: диапазон по created_at внутри (bot_id, status)"""
+        index_name = "idx_reports_bot_status_created"
+        index_name_full = f"{self.prefix}_{index_name}" if self.prefix else index_name
+        await self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name_full} "
+            f"ON {self.get_table_name('reports')} (bot_id, status, created_at)"
+        )
+    
     # === Методы для работы с пользователями ===
     
     async def add_user(self, user: User) -> bool:
@@ -401,12 +487,10 @@ class DatabaseManager:
         """Получение пользователя"""
         bot_id = bot_id or self.bot_id
         
-        cursor = await self.connection.execute(
+        row = await self.execute_fetchone(
             f"SELECT * FROM {self.get_table_name('users')} WHERE user_id = ? AND bot_id = ?",
             (user_id, bot_id)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
         
         if row:
             return User.from_dict(dict(row))
@@ -474,12 +558,10 @@ class DatabaseManager:
         where_sql = " AND ".join(where_clauses)
         
         # Получение общего количества
-        count_cursor = await self.connection.execute(
+        total = (await self.execute_fetchone(
             f"SELECT COUNT(*) FROM {self.get_table_name('users')} WHERE {where_sql}",
             params
-        )
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        ))[0]
         
         # Получение данных
         cursor = await self.connection.execute(
@@ -499,6 +581,198 @@ class DatabaseManager:
         await cursor.close()
         return users, total
     
+    async def get_top_by_rating(self, limit: int = 10, bot_id: Optional[int] = None) -> List[Tuple[int, str, Optional[str], int]]:
+        """Топ по рейтингу: (user_id, first_name, last_name, rating), читается из idx_users_top_cover"""
+        bot_id = bot_id or self.bot_id
+        
+        async with self.connection.execute(
+            f"""
+            SELECT user_id, first_name, last_name, rating
+            FROM {self.get_table_name('users')}
+            WHERE bot_id = ?
+            ORDER BY rating DESC
+            LIMIT ?
+            """,
+            (bot_id, limit)
+        ) as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+    
+    async def get_rank_by_rating(self, rating: int, bot_id: Optional[int] = None) -> int:
+        """Место в рейтинге для данного значения: 1 + число пользователей с большим рейтингом"""
+        bot_id = bot_id or self.bot_id
+        
+        row = await self.execute_fetchone(
+            f"SELECT COUNT(*) + 1 FROM {self.get_table_name('users')} WHERE bot_id = ? AND rating > ?",
+            (bot_id, rating)
+        )
+        
+        return row[0]
+    
+    async def apply_rating_deltas(self, deltas: List[Tuple[int, int]], bot_id: Optional[int] = None) -> bool:
+        """Применить накопленные изменения рейтинга (user_id, delta) в одной транзакции"""
+        bot_id = bot_id or self.bot_id
+        
+        try:
+            # Пользователи, которых еще нет в БД, создаются с рейтингом 0
+            await self.connection.executemany(
+                f"""
+                INSERT OR IGNORE INTO {self.get_table_name('users')} (user_id, first_name, bot_id)
+                VALUES (?, 'Пользователь', ?)
+                """,
+                [(user_id, bot_id) for user_id, _ in deltas]
+            )
+            await self.connection.executemany(
+                f"""
+                UPDATE {self.get_table_name('users')}
+                SET rating = MAX(0, rating + ?)
+                WHERE user_id = ? AND bot_id = ?
+                """,
+                [(delta, user_id, bot_id) for user_id, delta in deltas]
+            )
+            await self.connection.commit()
+            return True
+        except Exception as e:
+            await self.connection.rollback()
+            logger.error(f"Ошибка при применении изменений рейтинга: {e}")
+            return False
+    
+    async def get_period_top(
+        self,
+        start_date: datetime,
+        action_type: int,
+        limit: int = 10,
+        bot_id: Optional[int] = None
+    ) -> List[Tuple[User, int]]:
+        """Топ по очкам рейтинга, начисленным с start_date (агрегация по логам в SQLite)"""
+        bot_id = bot_id or self.bot_id
+        
+        cursor = await self.connection.execute(
+            f"""
+            SELECT u.*, p.points AS period_points
+            FROM (
+                SELECT user_id,
+                       SUM(CASE json_extract(action_data, '$.action')
+                               WHEN 'rating_added' THEN json_extract(action_data, '$.amount')
+                               ELSE -json_extract(action_data, '$.amount')
+                           END) AS points
+                FROM {self.get_table_name('action_logs')}
+                WHERE bot_id = ? AND action_type = ? AND timestamp >= ?
+                  AND json_extract(action_data, '$.action') IN ('rating_added', 'rating_removed')
+                GROUP BY user_id
+                ORDER BY points DESC
+                LIMIT ?
+            ) AS p
+            JOIN {self.get_table_name('users')} AS u ON u.user_id = p.user_id AND u.bot_id = ?
+            ORDER BY p.points DESC
+            """,
+            (bot_id, action_type, start_date.isoformat(), limit, bot_id)
+        )
+        
+        top = []
+        async for row in cursor:
+            data = dict(row)
+            points = data.pop("period_points")
+            top.append((User.from_dict(data), points))
+        
+        await cursor.close()
+        return top
+    
+    async def get_period_rank(
+        self,
+        user_id: int,
+        start_date: datetime,
+        action_type: int,
+        bot_id: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """Место и очки пользователя за период с start_date (та же агрегация, что в get_period_top)"""
+        bot_id = bot_id or self.bot_id
+        
+        row = await self.execute_fetchone(
+            f"""
+            WITH p AS (
+                SELECT user_id,
+                       SUM(CASE json_extract(action_data, '$.action')
+                               WHEN 'rating_added' THEN json_extract(action_data, '$.amount')
+                               ELSE -json_extract(action_data, '$.amount')
+                           END) AS points
+                FROM {self.get_table_name('action_logs')}
+                WHERE bot_id = ? AND action_type = ? AND timestamp >= ?
+                  AND json_extract(action_data, '$.action') IN ('rating_added', 'rating_removed')
+                GROUP BY user_id
+            ),
+            me AS (
+                SELECT COALESCE((SELECT points FROM p WHERE user_id = ?), 0) AS points
+            )
+            SELECT (SELECT COUNT(*) + 1 FROM p WHERE p.points > me.points), me.points
+            FROM me
+            """,
+            (bot_id, action_type, start_date.isoformat(), user_id)
+        )
+        
+        return row[0], row[1]
+    
+    async def get_achievements(self, user_id: int, names: List[str], bot_id: Optional[int] = None) -> set:
+        """Какие из names уже выданы пользователю (один запрос)"""
+        if not names:
+            return set()
+        
+        bot_id = bot_id or self.bot_id
+        placeholders = ", ".join("?" for _ in names)
+        
+        cursor = await self.connection.execute(
+            f"""
+            SELECT name FROM {self.get_table_name('user_achievements')}
+            WHERE user_id = ? AND bot_id = ? AND name IN ({placeholders})
+            """,
+            (user_id, bot_id, *names)
+        )
+        held = {row[0] for row in await cursor.fetchall()}
+        await cursor.close()
+        
+        return held
+    
+    async def grant_achievements(self, user_id: int, names: List[str], bot_id: Optional[int] = None) -> bool:
+        """Выдать пользователю достижения одним executemany"""
+        if not names:
+            return True
+        
+        bot_id = bot_id or self.bot_id
+        
+        try:
+            await self.connection.executemany(
+                f"""
+                INSERT OR IGNORE INTO {self.get_table_name('user_achievements')} (user_id, name, bot_id)
+                VALUES (?, ?, ?)
+                """,
+                [(user_id, name, bot_id) for name in names]
+            )
+            await self.connection.commit()
+            return True
+        except Exception as e:
+            await self.connection.rollback()
+            logger.error(f"Ошибка при выдаче достижений: {e}")
+            return False
+    
+    async def bulk_decay_rating(self, cutoff_date: datetime, amount: int, bot_id: Optional[int] = None) -> int:
+        """Снижение рейтинга всех неактивных с cutoff_date пользователей одним UPDATE"""
+        bot_id = bot_id or self.bot_id
+        
+        try:
+            cursor = await self.connection.execute(
+                f"""
+                UPDATE {self.get_table_name('users')}
+                SET rating = MAX(0, rating - ?)
+                WHERE bot_id = ? AND last_activity < ? AND rating > 0
+                """,
+                (amount, bot_id, cutoff_date.isoformat())
+            )
+            await self.connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            await self.connection.rollback()
+            logger.error(f"Ошибка при снижении рейтинга: {e}")
+            return 0
+    
     # === Методы для работы с чатами ===
     
     async def add_chat(self, chat: Chat) -> bool:
@@ -526,12 +800,10 @@ class DatabaseManager:
         """Получение чата"""
         bot_id = bot_id or self.bot_id
         
-        cursor = await self.connection.execute(
+        row = await self.execute_fetchone(
             f"SELECT * FROM {self.get_table_name('chats')} WHERE chat_id = ? AND bot_id = ?",
             (chat_id, bot_id)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
         
         if row:
             return Chat.from_dict(dict(row))
@@ -557,12 +829,10 @@ class DatabaseManager:
         where_sql = " AND ".join(where_clauses)
         
         # Получение общего количества
-        count_cursor = await self.connection.execute(
+        total = (await self.execute_fetchone(
             f"SELECT COUNT(*) FROM {self.get_table_name('chats')} WHERE {where_sql}",
             params
-        )
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        ))[0]
         
         # Получение данных
         cursor = await self.connection.execute(
@@ -607,12 +877,10 @@ class DatabaseManager:
         """Получение админа бота"""
         bot_id = bot_id or self.bot_id
         
-        cursor = await self.connection.execute(
+        row = await self.execute_fetchone(
             f"SELECT * FROM {self.get_table_name('bot_admins')} WHERE user_id = ? AND bot_id = ?",
             (user_id, bot_id)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
         
         if row:
             return BotAdmin.from_dict(dict(row))
@@ -679,15 +947,13 @@ class DatabaseManager:
         """Получение админа чата"""
         bot_id = bot_id or self.bot_id
         
-        cursor = await self.connection.execute(
+        row = await self.execute_fetchone(
             f"""
             SELECT * FROM {self.get_table_name('chat_admins')}
             WHERE chat_id = ? AND user_id = ? AND bot_id = ?
             """,
             (chat_id, user_id, bot_id)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
         
         if row:
             return ChatAdmin.from_dict(dict(row))
@@ -767,6 +1033,59 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка при добавлении лога: {e}")
     
+    async def add_action_logs(self, logs: List[ActionLog]):
+        """Добавление пачки логов действий одним executemany"""
+        if not logs:
+            return
+        
+        try:
+            await self.connection.executemany(
+                f"""
+                INSERT INTO {self.get_table_name('action_logs')}
+                (user_id, chat_id, action_type, action_data, timestamp, bot_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        log.user_id, log.chat_id, log.action_type.value,
+                        json.dumps(log.action_data, ensure_ascii=False),
+                        log.timestamp.isoformat(), log.bot_id
+                    )
+                    for log in logs
+                ]
+            )
+            await self.connection.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении логов: {e}")
+    
+    async def add_reports(self, rows: List[Tuple]) -> List[int]:
+        """Добавление пачки жалоб в одной транзакции (один commit на пачку).
+        
+        Строки вставляются по одной, чтобы получить lastrowid каждой жалобы,
+        но фиксируются вместе. При ошибке откатывается вся пачка.
+        """
+        if not rows:
+            return []
+        
+        query = f"""
+            INSERT INTO {self.get_table_name('reports')}
+            (reporter_id, reported_user_id, chat_id, message_id,
+             report_type, reason, status, created_at, bot_id,
+             reporter_name, reported_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        
+        try:
+            report_ids = []
+            for row in rows:
+                cursor = await self.connection.execute(query, row)
+                report_ids.append(cursor.lastrowid)
+            await self.connection.commit()
+            return report_ids
+        except Exception:
+            await self.connection.rollback()
+            raise
+    
     async def get_action_logs(
         self,
         user_id: Optional[int] = None,
@@ -807,12 +1126,10 @@ class DatabaseManager:
         where_sql = " AND ".join(where_clauses)
         
         # Получение общего количества
-        count_cursor = await self.connection.execute(
+        total = (await self.execute_fetchone(
             f"SELECT COUNT(*) FROM {self.get_table_name('action_logs')} WHERE {where_sql}",
             params
-        )
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        ))[0]
         
         # Получение данных
         cursor = await self.connection.execute(
@@ -914,12 +1231,10 @@ class DatabaseManager:
         where_sql = " AND ".join(where_clauses)
         
         # Получение общего количества
-        count_cursor = await self.connection.execute(
+        total = (await self.execute_fetchone(
             f"SELECT COUNT(*) FROM {self.get_table_name('broadcasts')} WHERE {where_sql}",
             params
-        )
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        ))[0]
         
         # Получение данных
         cursor = await self.connection.execute(
@@ -980,12 +1295,10 @@ class DatabaseManager:
         """Получение кастомной команды"""
         bot_id = bot_id or self.bot_id
         
-        cursor = await self.connection.execute(
+        row = await self.execute_fetchone(
             f"SELECT * FROM {self.get_table_name('custom_commands')} WHERE name = ? AND bot_id = ?",
             (name, bot_id)
         )
-        row = await cursor.fetchone()
-        await cursor.close()
         
         if row:
             return CustomCommand.from_dict(dict(row))
@@ -1024,12 +1337,10 @@ class DatabaseManager:
         where_sql = " AND ".join(where_clauses)
         
         # Получение общего количества
-        count_cursor = await self.connection.execute(
+        total = (await self.execute_fetchone(
             f"SELECT COUNT(*) FROM {self.get_table_name('custom_commands')} WHERE {where_sql}",
             params
-        )
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        ))[0]
         
         # Получение данных
         cursor = await self.connection.execute(
@@ -1244,6 +1555,11 @@ class DatabaseManager:
             logger.error(f"Ошибка при выполнении запроса: {e}")
             return []
     
+    async def execute_fetchone(self, query: str, params=()) -> Optional[aiosqlite.Row]:
+        """Первая строка результата запроса; курсор закрывается контекстным менеджером"""
+        async with self.connection.execute(query, params) as cursor:
+            return await cursor.fetchone()
+    
     async def execute_update(self, query: str, params: tuple = ()) -> int:
         """Выполнение запроса на обновление"""
         try:
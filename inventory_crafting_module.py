@@ -22,7 +22,8 @@ from aiogram.types import (
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select, update, and_, or_, desc, func, delete
+from sqlalchemy import select, update, and_, or_, desc, func, delete, cast
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload, joinedload
 
@@ -30,7 +31,7 @@ from models import (
     User, Item, ItemTemplate, ItemType, ItemRarity, Inventory,
     Recipe, RecipeIngredient, ProfessionType, ActiveAction, ActionType,
     StateSnapshot, AuditLog, SystemSettings, Location, ResourceType,
-    ActiveEffect
+    ActiveEffect, GET_USER_BY_TELEGRAM
 )
 
 # ============ КОНСТАНТЫ ============
@@ -235,7 +236,7 @@ class InventoryManager:
     async def restore_from_snapshot(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить из снапшота"""
         try:
-            snapshot_data = snapshot.snapshot_data
+            snapshot_data = snapshot.payload
             snapshot_type = snapshot.snapshot_type
             
             if snapshot_type == "crafting":
@@ -250,11 +251,11 @@ class InventoryManager:
     
     async def restore_crafting(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить крафт"""
-        snapshot_data = snapshot.snapshot_data
+        snapshot_data = snapshot.payload
         user_id = snapshot.user_id
         
         # Проверяем не завершился ли крафт
-        end_time = datetime.fromisoformat(snapshot_data.get("end_time"))
+        end_time = snapshot.ends_at
         if end_time < datetime.utcnow():
             return
         
@@ -263,7 +264,7 @@ class InventoryManager:
             id=uuid.uuid4(),
             user_id=user_id,
             action_type=ActionType.CRAFTING,
-            target_id=uuid.UUID(snapshot_data.get("recipe_id")),
+            target_id=snapshot.target_id,
             start_time=datetime.fromisoformat(snapshot_data.get("start_time")),
             end_time=end_time,
             progress=snapshot_data.get("progress", 0),
@@ -594,6 +595,7 @@ class InventoryManager:
         # Экипируем новый предмет
         item.is_equipped = True
         setattr(user, f"{slot}_id", item.id)
+        await self._set_equipped_snapshot(db, user_id, slot, self._equipped_snapshot(item, template))
         
         # Обновляем характеристики игрока
         await self._update_player_stats_from_equipment(db, user)
@@ -638,6 +640,7 @@ class InventoryManager:
         # Снимаем предмет
         item.is_equipped = False
         setattr(user, f"{slot}_id", None)
+        await self._set_equipped_snapshot(db, user_id, slot, None)
         
         # Обновляем характеристики игрока
         await self._update_player_stats_from_equipment(db, user)
@@ -658,6 +661,33 @@ class InventoryManager:
         
         return True, f"Предмет снят", item
     
+    def _equipped_snapshot(self, item: Item, template: ItemTemplate) -> Dict[str, Any]:
+        """Денормализованные поля предмета для отображения экипировки"""
+        return {
+            "id": str(item.id),
+            "name": template.name,
+            "icon": template.icon,
+            "damage_min": template.damage_min,
+            "damage_max": template.damage_max,
+            "defense": template.defense
+        }
+    
+    async def _set_equipped_snapshot(self, db: AsyncSession, user_id: uuid.UUID,
+                                     slot: str, snapshot: Optional[Dict[str, Any]]):
+        """Атомарно обновить слот в users.equipped"""
+        current = func.coalesce(User.equipped, cast({}, JSONB))
+        if snapshot is None:
+            value = current.op("-")(slot)
+        else:
+            value = func.jsonb_set(current, [slot], cast(snapshot, JSONB))
+        
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(equipped=value)
+            .execution_options(synchronize_session=False)
+        )
+    
     def _get_item_slot(self, item_type: ItemType) -> Optional[str]:
         """Получить слот для типа предмета"""
         if item_type == ItemType.WEAPON:
@@ -1009,13 +1039,19 @@ class InventoryManager:
     
     async def get_recipe_details(self, db: AsyncSession, recipe_id: uuid.UUID) -> Dict[str, Any]:
         """Получить детали рецепта"""
-        recipe = await db.get(Recipe, recipe_id)
+        # Рецепт вместе со связанными данными (item_template - lazy="raise")
+        result = await db.execute(
+            select(Recipe)
+            .where(Recipe.id == recipe_id)
+            .options(
+                selectinload(Recipe.result_item),
+                selectinload(Recipe.ingredients).selectinload(RecipeIngredient.item_template)
+            )
+        )
+        recipe = result.scalar_one_or_none()
         if not recipe:
             return {}
         
-        # Загружаем связанные данные
-        await db.refresh(recipe, ['result_item', 'ingredients'])
-        
         # Получаем ингредиенты с деталями
         ingredients_details = []
         for ingredient in recipe.ingredients:
@@ -1162,13 +1198,13 @@ class InventoryManager:
             user_id=user_id,
             entity_id=craft_action.id,
             entity_type="active_action",
-            snapshot_data={
-                "recipe_id": str(recipe_id),
+            target_id=recipe_id,
+            ends_at=end_time,
+            **StateSnapshot.pack_payload({
                 "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat(),
                 "progress": 0.0,
                 "craft_data": craft_action.data
-            },
+            }),
             expires_at=end_time + timedelta(hours=1)
         )
         db.add(snapshot)
@@ -2064,10 +2100,7 @@ async def handle_inventory_menu(callback: CallbackQuery, state: FSMContext):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2124,10 +2157,7 @@ async def handle_inventory_view(callback: CallbackQuery, state: FSMContext):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2286,10 +2316,7 @@ async def handle_item_equip(callback: CallbackQuery, state: FSMContext):
     item_id = uuid.UUID(callback.data.replace("item_equip_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2330,10 +2357,7 @@ async def handle_item_use(callback: CallbackQuery, state: FSMContext):
     item_id = uuid.UUID(callback.data.replace("item_use_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2381,10 +2405,7 @@ async def handle_item_sell(callback: CallbackQuery, state: FSMContext):
     item_id = uuid.UUID(callback.data.replace("item_sell_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2451,10 +2472,7 @@ async def handle_item_sell_quantity(message: Message, state: FSMContext):
         return
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": message.from_user.id})
         
         if not user:
             await message.answer("Игрок не найден.")
@@ -2509,10 +2527,7 @@ async def handle_item_sell_confirm(callback: CallbackQuery, state: FSMContext):
     quantity = int(parts[1])
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2543,10 +2558,7 @@ async def handle_crafting_menu(callback: CallbackQuery, state: FSMContext):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2621,10 +2633,7 @@ async def handle_crafting_profession(callback: CallbackQuery, state: FSMContext)
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2705,10 +2714,7 @@ async def handle_recipe_view(callback: CallbackQuery, state: FSMContext):
         text += f"💰 Стоимость: {requirements['gold_cost']} золота\n\n"
         
         # Проверяем возможность крафта
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if user:
             can_craft, errors = await inventory_manager.can_craft_recipe(db, user.id, recipe_id)
@@ -2745,10 +2751,7 @@ async def handle_recipe_craft(callback: CallbackQuery, state: FSMContext):
     recipe_id = uuid.UUID(callback.data.replace("recipe_craft_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2804,10 +2807,7 @@ async def handle_storage_menu(callback: CallbackQuery, state: FSMContext):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -2858,10 +2858,7 @@ async def handle_repair_menu(callback: CallbackQuery, state: FSMContext):
     from database import get_db_session
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
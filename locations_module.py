@@ -20,15 +20,17 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select, update, and_, or_, desc, func, delete
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import selectinload, joinedload, raiseload
 
+from database import get_db_session
 from models import (
     User, Location, TravelRoute, MobSpawn, ResourceSpawn, 
     ActiveAction, ActionType, StateSnapshot, MobTemplate,
     ResourceTemplate, GameEvent, EventTrigger, ChestTemplate,
-    SystemSettings, AuditLog, Discovery, ItemTemplate,
+    SystemSettings, AuditLog, Discovery, ItemTemplate, EventReward,
     LocationType, EventType, EventActivationType, ResourceType,
-    Item, Inventory
+    Item, Inventory, GET_USER_BY_TELEGRAM, get_user_actions_stmt,
+    ADD_USER_DISCOVERY, BUMP_DISCOVERY_COUNTER, DailyStatKind, ADD_DAILY_STAT
 )
 
 # ============ КОНСТАНТЫ ============
@@ -39,6 +41,29 @@ class TravelStatus(str, Enum):
     INTERRUPTED = "interrupted"
     EVENT_TRIGGERED = "event_triggered"
 
+# Наборы типов действий для кэшированных запросов
+_TRAVEL_ACTIONS = (ActionType.TRAVEL,)
+_GATHERING_ACTIONS = (ActionType.MINING, ActionType.WOODCUTTING, ActionType.HERBALISM)
+
+# Общая строка клавиатуры "Назад" в меню локации
+_BACK_TO_MENU_ROW = [InlineKeyboardButton(text="⬅️ Назад", callback_data="locations_menu")]
+
+# Фоновые задачи модуля: ссылки держатся до завершения, иначе задачу может собрать GC
+_background_tasks: set = set()
+
+def _on_background_task_done(task: asyncio.Task):
+    """Убрать завершенную задачу из набора и сообщить об ошибке"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"❌ Ошибка в фоновой задаче локаций: {task.exception()!r}")
+
+def _spawn(coro) -> asyncio.Task:
+    """Запустить корутину в фоне с удержанием ссылки и логированием ошибок"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
 # ============ РОУТЕР И СОСТОЯНИЯ ============
 
 locations_router = Router()
@@ -246,7 +271,7 @@ class LocationManager:
     async def restore_from_snapshot(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить из снапшота"""
         try:
-            snapshot_data = snapshot.snapshot_data
+            snapshot_data = snapshot.payload
             snapshot_type = snapshot.snapshot_type
             
             if snapshot_type == "travel":
@@ -263,11 +288,11 @@ class LocationManager:
     
     async def restore_travel(self, db: AsyncSession, snapshot: StateSnapshot):
         """Восстановить путешествие"""
-        snapshot_data = snapshot.snapshot_data
+        snapshot_data = snapshot.payload
         user_id = snapshot.user_id
         
         # Проверяем не завершилось ли путешествие
-        end_time = datetime.fromisoformat(snapshot_data.get("end_time"))
+        end_time = snapshot.ends_at
         if end_time < datetime.utcnow():
             return
         
@@ -276,7 +301,7 @@ class LocationManager:
             id=uuid.uuid4(),
             user_id=user_id,
             action_type=ActionType.TRAVEL,
-            target_id=uuid.UUID(snapshot_data.get("target_location_id")),
+            target_id=snapshot.target_id,
             start_time=datetime.fromisoformat(snapshot_data.get("start_time")),
             end_time=end_time,
             progress=snapshot_data.get("progress", 0),
@@ -305,6 +330,12 @@ class LocationManager:
         )
         self.active_travels[str(user_id)] = travel_data
     
+    async def acquire_callback_lock(self, telegram_id: int, callback_data: str, ttl: int = 2) -> bool:
+        """Взять короткую блокировку на повторное нажатие той же кнопки"""
+        return bool(await self.redis.set(
+            f"lock:{telegram_id}:{callback_data}", "1", nx=True, ex=ttl
+        ))
+    
     # ============ ОСНОВНЫЕ МЕТОДЫ ЛОКАЦИЙ ============
     
     async def get_location_by_id(self, db: AsyncSession, location_id: uuid.UUID) -> Optional[Location]:
@@ -313,7 +344,8 @@ class LocationManager:
             select(Location).where(Location.id == location_id).options(
                 selectinload(Location.mob_spawns).selectinload(MobSpawn.mob_template),
                 selectinload(Location.resource_spawns).selectinload(ResourceSpawn.resource_template),
-                selectinload(Location.event_triggers).selectinload(EventTrigger.game_event)
+                selectinload(Location.event_triggers).selectinload(EventTrigger.game_event),
+                raiseload('*', sql_only=True)
             )
         )
         return result.scalar_one_or_none()
@@ -336,7 +368,8 @@ class LocationManager:
         mob_spawns = []
         result = await db.execute(
             select(MobSpawn).where(MobSpawn.location_id == location.id).options(
-                selectinload(MobSpawn.mob_template)
+                selectinload(MobSpawn.mob_template).raiseload('*', sql_only=True),
+                raiseload('*', sql_only=True)
             )
         )
         spawns = result.scalars().all()
@@ -356,7 +389,8 @@ class LocationManager:
         resources = []
         result = await db.execute(
             select(ResourceSpawn).where(ResourceSpawn.location_id == location.id).options(
-                selectinload(ResourceSpawn.resource_template)
+                selectinload(ResourceSpawn.resource_template),
+                raiseload('*', sql_only=True)
             )
         )
         resource_spawns = result.scalars().all()
@@ -390,7 +424,8 @@ class LocationManager:
                     EventTrigger.game_event.has(GameEvent.is_active == True)
                 )
             ).options(
-                selectinload(EventTrigger.game_event)
+                selectinload(EventTrigger.game_event).raiseload('*', sql_only=True),
+                raiseload('*', sql_only=True)
             )
         )
         event_triggers = result.scalars().all()
@@ -494,13 +529,13 @@ class LocationManager:
             user_id=user_id,
             entity_id=travel_action.id,
             entity_type="active_action",
-            snapshot_data={
-                "target_location_id": str(to_location_id),
+            target_id=to_location_id,
+            ends_at=end_time,
+            **StateSnapshot.pack_payload({
                 "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat(),
                 "progress": 0.0,
                 "travel_data": travel_action.data
-            },
+            }),
             expires_at=end_time + timedelta(hours=1)
         )
         db.add(snapshot)
@@ -541,7 +576,7 @@ class LocationManager:
         self.active_travels[str(user_id)] = travel_data
         
         # Запускаем таймер для проверки путешествия
-        asyncio.create_task(self._monitor_travel(travel_action.id, route.travel_time))
+        _spawn(self._monitor_travel(travel_action.id, route.travel_time))
         
         return {
             "success": True,
@@ -598,21 +633,11 @@ class LocationManager:
     
     async def _check_location_discovery(self, db: AsyncSession, user_id: uuid.UUID, location_id: uuid.UUID):
         """Проверить открытие новой локации"""
-        discovery = await db.execute(
-            select(Discovery).where(Discovery.user_id == user_id)
-        )
-        discovery = discovery.scalar_one_or_none()
+        params = {"user_id": user_id, "kind": "location", "entity_id": location_id}
+        inserted = await db.execute(ADD_USER_DISCOVERY, params)
         
-        if not discovery:
-            discovery = Discovery(
-                user_id=user_id,
-                discovered_locations=[str(location_id)],
-                total_discoveries=1
-            )
-            db.add(discovery)
-        elif str(location_id) not in discovery.discovered_locations:
-            discovery.discovered_locations.append(str(location_id))
-            discovery.total_discoveries += 1
+        if inserted.first():
+            await db.execute(BUMP_DISCOVERY_COUNTER, {"user_id": user_id})
         
         await db.commit()
     
@@ -630,7 +655,11 @@ class LocationManager:
                         )
                     )
                 )
-            ).options(selectinload(EventTrigger.game_event))
+            ).options(
+                selectinload(EventTrigger.game_event)
+                .selectinload(GameEvent.rewards)
+                .joinedload(EventReward.item_template)
+            )
         )
         event_triggers = result.scalars().all()
         
@@ -716,14 +745,14 @@ class LocationManager:
             user_id=user_id,
             entity_id=gathering_action.id,
             entity_type="active_action",
-            snapshot_data={
-                "resource_id": str(resource_id),
+            target_id=resource_id,
+            ends_at=end_time,
+            **StateSnapshot.pack_payload({
                 "action_type": action_type.value,
                 "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat(),
                 "progress": 0.0,
                 "gathering_data": gathering_action.data
-            },
+            }),
             expires_at=end_time + timedelta(hours=1)
         )
         db.add(snapshot)
@@ -751,7 +780,7 @@ class LocationManager:
         self.active_gathering[str(user_id)] = gathering_data
         
         # Запускаем таймер
-        asyncio.create_task(self._monitor_gathering(gathering_action.id, resource.gather_time))
+        _spawn(self._monitor_gathering(gathering_action.id, resource.gather_time))
         
         return {
             "success": True,
@@ -797,13 +826,10 @@ class LocationManager:
             # Добавляем предмет в инвентарь
             await self._add_resource_to_inventory(db, user.id, resource, quantity)
             
-            # Обновляем статистику
-            stats = await db.execute(
-                select(PlayerStat).where(PlayerStat.user_id == user.id)
-            )
-            stats = stats.scalar_one_or_none()
-            if stats:
-                stats.daily_items_found += quantity
+            # Обновляем дневную статистику
+            await db.execute(ADD_DAILY_STAT, {
+                "user_id": user.id, "kind": DailyStatKind.ITEMS_FOUND, "amount": quantity
+            })
         
         await db.commit()
         
@@ -1213,8 +1239,6 @@ async def handle_admin_locations(callback: CallbackQuery, state: FSMContext):
 
 async def show_admin_locations_menu(callback: CallbackQuery):
     """Показать меню админ-панели локаций"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
         # Получаем статистику
         locations_count = await db.execute(select(func.count(Location.id)))
@@ -1254,8 +1278,6 @@ async def show_admin_locations_menu(callback: CallbackQuery):
 
 async def show_locations_list(callback: CallbackQuery):
     """Показать список локаций"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
         locations = await db.execute(
             select(Location).order_by(Location.min_level)
@@ -1287,8 +1309,6 @@ async def show_locations_list(callback: CallbackQuery):
 
 async def show_resources_list(callback: CallbackQuery):
     """Показать список ресурсов"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
         resources = await db.execute(
             select(ResourceTemplate).order_by(ResourceTemplate.level)
@@ -1320,8 +1340,6 @@ async def show_resources_list(callback: CallbackQuery):
 
 async def show_events_list(callback: CallbackQuery):
     """Показать список событий"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
         events = await db.execute(
             select(GameEvent).order_by(GameEvent.name)
@@ -1383,13 +1401,8 @@ async def handle_player_locations(callback: CallbackQuery, state: FSMContext):
 
 async def show_location_menu(callback: CallbackQuery):
     """Показать меню локации"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1403,28 +1416,12 @@ async def show_location_menu(callback: CallbackQuery):
         
         # Проверяем активные действия
         active_travel = await db.execute(
-            select(ActiveAction).where(
-                and_(
-                    ActiveAction.user_id == user.id,
-                    ActiveAction.action_type == ActionType.TRAVEL,
-                    ActiveAction.is_completed == False
-                )
-            )
+            get_user_actions_stmt(_TRAVEL_ACTIONS), {"user_id": user.id}
         )
         active_travel = active_travel.scalar_one_or_none()
         
         active_gathering = await db.execute(
-            select(ActiveAction).where(
-                and_(
-                    ActiveAction.user_id == user.id,
-                    ActiveAction.action_type.in_([
-                        ActionType.MINING, 
-                        ActionType.WOODCUTTING, 
-                        ActionType.HERBALISM
-                    ]),
-                    ActiveAction.is_completed == False
-                )
-            )
+            get_user_actions_stmt(_GATHERING_ACTIONS), {"user_id": user.id}
         )
         active_gathering = active_gathering.scalar_one_or_none()
         
@@ -1476,14 +1473,10 @@ async def show_location_menu(callback: CallbackQuery):
 
 async def explore_location_handler(callback: CallbackQuery):
     """Обработчик осмотра локации"""
-    from database import get_db_session
-    from main import location_manager
+    location_manager = _get_location_manager()
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1564,13 +1557,8 @@ async def explore_location_handler(callback: CallbackQuery):
 
 async def show_travel_locations(callback: CallbackQuery):
     """Показать доступные для путешествия локации"""
-    from database import get_db_session
-    
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1581,7 +1569,8 @@ async def show_travel_locations(callback: CallbackQuery):
             select(TravelRoute).where(
                 TravelRoute.from_location_id == user.current_location_id
             ).options(
-                selectinload(TravelRoute.to_location)
+                selectinload(TravelRoute.to_location).raiseload('*', sql_only=True),
+                raiseload('*', sql_only=True)
             )
         )
         routes = routes.scalars().all()
@@ -1597,23 +1586,20 @@ async def show_travel_locations(callback: CallbackQuery):
         
         text = "🗺️ КУДА ОТПРАВИТЬСЯ?\n\n"
         
-        keyboard_buttons = []
         for route in routes:
             if route.to_location:
                 text += f"{route.to_location.icon} {route.to_location.name}\n"
                 text += f"• Время: {route.travel_time // 60}:{route.travel_time % 60:02d}\n"
                 text += f"• Уровень: {route.min_level}+ | Цена: {route.gold_cost} золота\n\n"
-                
-                keyboard_buttons.append([
-                    InlineKeyboardButton(
-                        text=f"{route.to_location.icon} {route.to_location.name}",
-                        callback_data=f"travel_to_{route.to_location_id}"
-                    )
-                ])
         
-        keyboard_buttons.append([
-            InlineKeyboardButton(text="⬅️ Назад", callback_data="locations_menu")
-        ])
+        keyboard_buttons = [
+            [InlineKeyboardButton(
+                text=f"{route.to_location.icon} {route.to_location.name}",
+                callback_data=f"travel_to_{route.to_location_id}"
+            )]
+            for route in routes if route.to_location
+        ]
+        keyboard_buttons.append(_BACK_TO_MENU_ROW)
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
         
@@ -1621,14 +1607,10 @@ async def show_travel_locations(callback: CallbackQuery):
 
 async def mine_location_handler(callback: CallbackQuery):
     """Обработчик шахты"""
-    from database import get_db_session
-    from main import location_manager
+    location_manager = _get_location_manager()
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
             await callback.answer("Игрок не найден")
@@ -1654,24 +1636,21 @@ async def mine_location_handler(callback: CallbackQuery):
         text = f"⛏️ ШАХТА УРОВНЯ {location.mine_level}\n\n"
         text += "Доступные руды:\n\n"
         
-        keyboard_buttons = []
         for resource in resources:
             text += f"[{resource.icon}] {resource.name}\n"
             text += f"• Уровень: {resource.level}\n"
             text += f"• Шанс: {resource.gather_chance*100:.0f}%\n"
             text += f"• Количество: {resource.min_quantity}-{resource.max_quantity}\n"
             text += f"• Время: {resource.gather_time // 60}:{resource.gather_time % 60:02d}\n\n"
-            
-            keyboard_buttons.append([
-                InlineKeyboardButton(
-                    text=f"⛏️ Добывать {resource.name}",
-                    callback_data=f"locations_mine_resource_{resource.id}"
-                )
-            ])
         
-        keyboard_buttons.append([
-            InlineKeyboardButton(text="⬅️ Назад", callback_data="locations_menu")
-        ])
+        keyboard_buttons = [
+            [InlineKeyboardButton(
+                text=f"⛏️ Добывать {resource.name}",
+                callback_data=f"locations_mine_resource_{resource.id}"
+            )]
+            for resource in resources
+        ]
+        keyboard_buttons.append(_BACK_TO_MENU_ROW)
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
         
@@ -1705,10 +1684,23 @@ def create_location_keyboard() -> InlineKeyboardMarkup:
 
 # ============ ИНИЦИАЛИЗАЦИЯ ============
 
+# Ссылка на менеджер локаций, устанавливается в init_locations_module
+_lm_ref: Optional[LocationManager] = None
+
+def _get_location_manager() -> LocationManager:
+    """Получить менеджер локаций без импорта на каждый вызов хэндлера"""
+    global _lm_ref
+    if _lm_ref is None:
+        from main import location_manager
+        _lm_ref = location_manager
+    return _lm_ref
+
 async def init_locations_module(redis_client, db_session_factory):
     """Инициализировать модуль локаций"""
+    global _lm_ref
     location_manager = LocationManager(redis_client, db_session_factory)
     await location_manager.restore_state()
+    _lm_ref = location_manager
     return location_manager
 
 # ============ ХЭНДЛЕРЫ КОМАНД ============
@@ -1721,35 +1713,45 @@ async def handle_locations_menu(callback: CallbackQuery):
 @locations_router.callback_query(F.data.startswith("travel_to_"))
 async def handle_travel_to(callback: CallbackQuery):
     """Обработчик путешествия"""
-    from database import get_db_session
-    from main import location_manager
+    # Повторные нажатия той же кнопки не запускают работу второй раз
+    location_manager = _get_location_manager()
+    if not await location_manager.acquire_callback_lock(callback.from_user.id, callback.data):
+        await callback.answer("Подождите...")
+        return
+    
+    # Сразу снимаем "часики" с кнопки, тяжелую работу выполняем в фоне
+    _spawn(callback.answer())
+    _spawn(_process_travel_to(callback))
+
+async def _process_travel_to(callback: CallbackQuery):
+    """Фоновая обработка путешествия (callback уже отвечен)"""
+    location_manager = _get_location_manager()
     
     location_id = uuid.UUID(callback.data.replace("travel_to_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
-            await callback.answer("Игрок не найден")
+            await callback.message.answer("Игрок не найден")
             return
         
         result = await location_manager.travel_to_location(db, user.id, location_id)
         
         if "error" in result:
-            await callback.answer(result["error"])
+            await callback.message.answer(result["error"])
             return
         
         travel_time = result["travel_time"]
         minutes = travel_time // 60
         seconds = travel_time % 60
+        end_time = result["end_time"]
+        end_hms = f"{end_time.hour:02d}:{end_time.minute:02d}:{end_time.second:02d}"
         
         await callback.message.edit_text(
             f"🛤️ ВЫ ОТПРАВИЛИСЬ В ПУТЬ!\n\n"
             f"Время в пути: {minutes}:{seconds:02d}\n"
-            f"Прибытие: <code>{result['end_time'].strftime('%H:%M:%S')}</code>\n\n"
+            f"Прибытие: <code>{end_hms}</code>\n\n"
             f"Вы получите уведомление по прибытии.",
             parse_mode="HTML",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -1760,36 +1762,46 @@ async def handle_travel_to(callback: CallbackQuery):
 @locations_router.callback_query(F.data.startswith("locations_mine_resource_"))
 async def handle_mine_resource(callback: CallbackQuery):
     """Обработчик добычи ресурса"""
-    from database import get_db_session
-    from main import location_manager
+    # Повторные нажатия той же кнопки не запускают работу второй раз
+    location_manager = _get_location_manager()
+    if not await location_manager.acquire_callback_lock(callback.from_user.id, callback.data):
+        await callback.answer("Подождите...")
+        return
+    
+    # Сразу снимаем "часики" с кнопки, тяжелую работу выполняем в фоне
+    _spawn(callback.answer())
+    _spawn(_process_mine_resource(callback))
+
+async def _process_mine_resource(callback: CallbackQuery):
+    """Фоновая обработка добычи ресурса (callback уже отвечен)"""
+    location_manager = _get_location_manager()
     
     resource_id = uuid.UUID(callback.data.replace("locations_mine_resource_", ""))
     
     async with get_db_session() as db:
-        user = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = user.scalar_one_or_none()
+        user = await db.scalar(GET_USER_BY_TELEGRAM, {"tid": callback.from_user.id})
         
         if not user:
-            await callback.answer("Игрок не найден")
+            await callback.message.answer("Игрок не найден")
             return
         
         result = await location_manager.gather_resource(db, user.id, resource_id, ActionType.MINING)
         
         if "error" in result:
-            await callback.answer(result["error"])
+            await callback.message.answer(result["error"])
             return
         
         gather_time = result["gather_time"]
         minutes = gather_time // 60
         seconds = gather_time % 60
+        end_time = result["end_time"]
+        end_hms = f"{end_time.hour:02d}:{end_time.minute:02d}:{end_time.second:02d}"
         
         await callback.message.edit_text(
             f"⛏️ ВЫ НАЧАЛИ ДОБЫВАТЬ РУДУ!\n\n"
             f"Ресурс: {result['resource_name']}\n"
             f"Время: {minutes}:{seconds:02d}\n"
-            f"Завершение: <code>{result['end_time'].strftime('%H:%M:%S')}</code>\n\n"
+            f"Завершение: <code>{end_hms}</code>\n\n"
             f"Вы получите уведомление по завершении.",
             parse_mode="HTML",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
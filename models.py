@@ -1,17 +1,67 @@
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
-from enum import Enum
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, date
+from typing import Optional, List, Dict, Any, Tuple
+from functools import lru_cache
+from contextlib import contextmanager
+from enum import Enum, IntEnum
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Boolean, Float, 
-    DateTime, ForeignKey, Text, JSON, BigInteger, Numeric,
-    Table, Index, CheckConstraint, UniqueConstraint, Enum as SQLEnum
+    create_engine, select, func, bindparam, and_, Integer, SmallInteger, String, Boolean, Float, 
+    DateTime, Date, ForeignKey, Text, BigInteger, Numeric, LargeBinary,
+    Table, Index, CheckConstraint, UniqueConstraint, Enum as SQLEnum, text, event,
+    Identity, DDL
 )
-from sqlalchemy.orm import declarative_base, relationship, Session, sessionmaker
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, Session, sessionmaker
+from sqlalchemy.ext.associationproxy import association_proxy, AssociationProxy
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import UUID, JSONB, insert as pg_insert
 import json
+import time
 import uuid
 
-Base = declarative_base()
+try:
+    import ormsgpack
+except ImportError:  # Необязательная зависимость: без нее снапшоты пишутся в JSONB
+    ormsgpack = None
+
+class Base(DeclarativeBase):
+    pass
+
+# Расширение для триграммных индексов должно существовать до создания таблиц
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+# UUIDv7: 48 бит миллисекунд + случайная часть, вставки идут в правый край B-tree первичного ключа
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("""
+        CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+            SELECT encode(
+                set_bit(set_bit(
+                    overlay(uuid_send(gen_random_uuid())
+                            placing substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+                            FROM 1 FOR 6),
+                    52, 1), 53, 1),
+                'hex')::uuid
+        $$ LANGUAGE sql VOLATILE
+    """).execute_if(dialect="postgresql")
+)
+
+def uuid7() -> uuid.UUID:
+    """UUIDv7 на стороне клиента - та же раскладка, что у uuid_generate_v7().
+    
+    Для таблиц, где id нового объекта читается до flush.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)   # версия 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)   # вариант RFC 4122
+    return uuid.UUID(int=value)
 
 # ============ ПЕРЕЧИСЛЕНИЯ ============
 
@@ -93,183 +143,254 @@ class BattleStatus(str, Enum):
     PLAYER_LOST = "player_lost"
     FLED = "fled"
 
+class PvPChallengeStatus(str, Enum):
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    DECLINED = "declined"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+class DailyStatKind(IntEnum):
+    """Вид дневного счетчика (SMALLINT в player_daily_events)"""
+    MOBS_KILLED = 1
+    PLAYERS_KILLED = 2
+    GOLD_EARNED = 3
+    ITEMS_FOUND = 4
+
 class EventActivationType(str, Enum):
     CHANCE = "chance"
     TIME = "time"
     MANUAL = "manual"
     SCHEDULED = "scheduled"
 
+def native_enum(enum_cls) -> SQLEnum:
+    """Нативный ENUM PostgreSQL (4 байта на значение) без дублирующего CHECK"""
+    return SQLEnum(enum_cls, native_enum=True, create_constraint=False)
+
 # ============ МОДЕЛИ ПОЛЬЗОВАТЕЛЕЙ ============
 
 class User(Base):
     __tablename__ = 'users'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
-    username = Column(String(100), nullable=True)
-    first_name = Column(String(100), nullable=True)
-    last_name = Column(String(100), nullable=True)
-    role = Column(SQLEnum(UserRole), default=UserRole.PLAYER)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    last_active = Column(DateTime, default=datetime.utcnow)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False)
+    username: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    first_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    last_name: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    role: Mapped[Optional[UserRole]] = mapped_column(native_enum(UserRole), default=UserRole.PLAYER)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    last_active: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
     
     # Статистика игрока
-    level = Column(Integer, default=1)
-    experience = Column(BigInteger, default=0)
-    gold = Column(BigInteger, default=100)
-    crystals = Column(BigInteger, default=0)
+    level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    crystals: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
     
     # Основные характеристики
-    strength = Column(Integer, default=10)
-    agility = Column(Integer, default=10)
-    intelligence = Column(Integer, default=10)
-    constitution = Column(Integer, default=10)
-    free_points = Column(Integer, default=0)
+    strength: Mapped[Optional[int]] = mapped_column(Integer, default=10)
+    agility: Mapped[Optional[int]] = mapped_column(Integer, default=10)
+    intelligence: Mapped[Optional[int]] = mapped_column(Integer, default=10)
+    constitution: Mapped[Optional[int]] = mapped_column(Integer, default=10)
+    free_points: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Профессии
-    mining_level = Column(Integer, default=1)
-    mining_exp = Column(Integer, default=0)
-    woodcutting_level = Column(Integer, default=1)
-    woodcutting_exp = Column(Integer, default=0)
-    herbalism_level = Column(Integer, default=1)
-    herbalism_exp = Column(Integer, default=0)
-    blacksmithing_level = Column(Integer, default=1)
-    blacksmithing_exp = Column(Integer, default=0)
-    alchemy_level = Column(Integer, default=1)
-    alchemy_exp = Column(Integer, default=0)
+    mining_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    mining_exp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    woodcutting_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    woodcutting_exp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    herbalism_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    herbalism_exp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    blacksmithing_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    blacksmithing_exp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    alchemy_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    alchemy_exp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Текущее состояние
-    current_hp = Column(Integer, default=100)
-    max_hp = Column(Integer, default=100)
-    current_mp = Column(Integer, default=50)
-    max_mp = Column(Integer, default=50)
-    stamina = Column(Integer, default=100)
+    max_hp: Mapped[Optional[int]] = mapped_column(Integer, default=100)
+    max_mp: Mapped[Optional[int]] = mapped_column(Integer, default=50)
     
     # Экипировка
-    weapon_id = Column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
-    armor_id = Column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
-    helmet_id = Column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
-    gloves_id = Column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
-    boots_id = Column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    weapon_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    armor_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    helmet_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    gloves_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    boots_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('items.id'), nullable=True)
+    # Снимок экипировки для отображения: {"weapon": {"id": ..., "name": ..., "icon": ...}, ...}
+    equipped: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, default=dict)
     
     # Локация
-    current_location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=True)
+    current_location_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=True)
     
     # Статистика
-    mobs_killed = Column(Integer, default=0)
-    players_killed = Column(Integer, default=0)
-    deaths = Column(Integer, default=0)
-    total_gold_earned = Column(BigInteger, default=0)
-    total_gold_spent = Column(BigInteger, default=0)
-    total_damage_dealt = Column(BigInteger, default=0)
-    total_damage_taken = Column(BigInteger, default=0)
+    total_gold_earned: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    total_gold_spent: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
     
     # Настройки
-    notifications_enabled = Column(Boolean, default=True)
-    language = Column(String(10), default='ru')
+    notifications_enabled: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    language: Mapped[Optional[str]] = mapped_column(String(10), default='ru')
     
     # Связи
-    current_location = relationship("Location", foreign_keys=[current_location_id])
-    weapon = relationship("Item", foreign_keys=[weapon_id])
-    armor = relationship("Item", foreign_keys=[armor_id])
-    helmet = relationship("Item", foreign_keys=[helmet_id])
-    gloves = relationship("Item", foreign_keys=[gloves_id])
-    boots = relationship("Item", foreign_keys=[boots_id])
+    current_location: Mapped[Optional["Location"]] = relationship("Location", foreign_keys=[current_location_id], lazy="selectin")
+    weapon: Mapped[Optional["Item"]] = relationship("Item", foreign_keys=[weapon_id])
+    armor: Mapped[Optional["Item"]] = relationship("Item", foreign_keys=[armor_id])
+    helmet: Mapped[Optional["Item"]] = relationship("Item", foreign_keys=[helmet_id])
+    gloves: Mapped[Optional["Item"]] = relationship("Item", foreign_keys=[gloves_id])
+    boots: Mapped[Optional["Item"]] = relationship("Item", foreign_keys=[boots_id])
+    counters: Mapped["UserCounters"] = relationship(
+        "UserCounters", back_populates="user", lazy="joined", uselist=False,
+        cascade="all, delete-orphan"
+    )
+    
+    # Часто изменяемые счетчики живут в user_counters, доступ как к полям User
+    experience: AssociationProxy[Optional[int]] = association_proxy("counters", "experience", creator=lambda v: UserCounters(experience=v))
+    gold: AssociationProxy[Optional[int]] = association_proxy("counters", "gold", creator=lambda v: UserCounters(gold=v))
+    current_hp: AssociationProxy[Optional[int]] = association_proxy("counters", "current_hp", creator=lambda v: UserCounters(current_hp=v))
+    current_mp: AssociationProxy[Optional[int]] = association_proxy("counters", "current_mp", creator=lambda v: UserCounters(current_mp=v))
+    stamina: AssociationProxy[Optional[int]] = association_proxy("counters", "stamina", creator=lambda v: UserCounters(stamina=v))
+    mobs_killed: AssociationProxy[Optional[int]] = association_proxy("counters", "mobs_killed", creator=lambda v: UserCounters(mobs_killed=v))
+    players_killed: AssociationProxy[Optional[int]] = association_proxy("counters", "players_killed", creator=lambda v: UserCounters(players_killed=v))
+    deaths: AssociationProxy[Optional[int]] = association_proxy("counters", "deaths", creator=lambda v: UserCounters(deaths=v))
+    total_damage_dealt: AssociationProxy[Optional[int]] = association_proxy("counters", "total_damage_dealt", creator=lambda v: UserCounters(total_damage_dealt=v))
+    total_damage_taken: AssociationProxy[Optional[int]] = association_proxy("counters", "total_damage_taken", creator=lambda v: UserCounters(total_damage_taken=v))
     
     # Индексы
     __table_args__ = (
-        Index('idx_user_telegram_id', 'telegram_id'),
         Index('idx_user_role', 'role'),
         Index('idx_user_level', 'level'),
+        # Триграммные индексы для поиска ILIKE '%...%' в админ-панели
+        Index('idx_user_username_trgm', 'username', postgresql_using='gin',
+              postgresql_ops={'username': 'gin_trgm_ops'}),
+        Index('idx_user_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        Index('idx_user_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}),
     )
 
+class UserCounters(Base):
+    """Узкая таблица часто обновляемых счетчиков игрока (1:1 с users)"""
+    __tablename__ = 'user_counters'
+    
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True)
+    
+    # Текущее состояние
+    current_hp: Mapped[Optional[int]] = mapped_column(Integer, default=100)
+    current_mp: Mapped[Optional[int]] = mapped_column(Integer, default=50)
+    stamina: Mapped[Optional[int]] = mapped_column(Integer, default=100)
+    
+    # Прогресс
+    experience: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    gold: Mapped[Optional[int]] = mapped_column(BigInteger, default=100)
+    
+    # Статистика
+    mobs_killed: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    players_killed: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    deaths: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    total_damage_dealt: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    total_damage_taken: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    
+    # Связи
+    user: Mapped["User"] = relationship("User", back_populates="counters")
+
+@event.listens_for(User, "init")
+def _init_user_counters(target, args, kwargs):
+    """Каждый новый игрок сразу получает строку счетчиков с дефолтами"""
+    if target.counters is None:
+        target.counters = UserCounters(
+            current_hp=100, current_mp=50, stamina=100,
+            experience=0, gold=100,
+            mobs_killed=0, players_killed=0, deaths=0,
+            total_damage_dealt=0, total_damage_taken=0
+        )
+
 # ============ МОДЕЛИ ПРЕДМЕТОВ ============
 
 class ItemTemplate(Base):
     __tablename__ = 'item_templates'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(200), nullable=False)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    item_type = Column(SQLEnum(ItemType), nullable=False)
-    rarity = Column(SQLEnum(ItemRarity), default=ItemRarity.COMMON)
-    level_requirement = Column(Integer, default=1)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    item_type: Mapped[ItemType] = mapped_column(native_enum(ItemType), nullable=False)
+    rarity: Mapped[Optional[ItemRarity]] = mapped_column(native_enum(ItemRarity), default=ItemRarity.COMMON)
+    level_requirement: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Статистика (для оружия/брони)
-    damage_min = Column(Integer, default=0)
-    damage_max = Column(Integer, default=0)
-    defense = Column(Integer, default=0)
-    health_bonus = Column(Integer, default=0)
-    mana_bonus = Column(Integer, default=0)
-    strength_bonus = Column(Integer, default=0)
-    agility_bonus = Column(Integer, default=0)
-    intelligence_bonus = Column(Integer, default=0)
-    constitution_bonus = Column(Integer, default=0)
+    damage_min: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    damage_max: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    defense: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    health_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    mana_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    strength_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    agility_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    intelligence_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    constitution_bonus: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Для зелий
-    potion_effect = Column(JSON, nullable=True)  # {"heal": 50, "duration": 300}
+    potion_effect: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)  # {"heal": 50, "duration": 300}
     
     # Для ресурсов
-    resource_type = Column(SQLEnum(ResourceType), nullable=True)
-    weight = Column(Float, default=0.1)
+    resource_type: Mapped[Optional[ResourceType]] = mapped_column(native_enum(ResourceType), nullable=True)
+    weight: Mapped[Optional[float]] = mapped_column(Float, default=0.1)
     
     # Экономика
-    base_price = Column(Integer, nullable=False)
-    sell_price = Column(Integer, nullable=False)
-    stack_size = Column(Integer, default=1)
+    base_price: Mapped[int] = mapped_column(Integer, nullable=False)
+    sell_price: Mapped[int] = mapped_column(Integer, nullable=False)
+    stack_size: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Флаги
-    is_tradable = Column(Boolean, default=True)
-    is_droppable = Column(Boolean, default=True)
-    is_consumable = Column(Boolean, default=False)
-    is_equippable = Column(Boolean, default=False)
+    is_tradable: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    is_droppable: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    is_consumable: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    is_equippable: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
     # Для крафта
-    craftable = Column(Boolean, default=False)
-    craft_profession = Column(SQLEnum(ProfessionType), nullable=True)
-    craft_level = Column(Integer, default=1)
-    craft_time = Column(Integer, default=60)  # в секундах
+    craftable: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    craft_profession: Mapped[Optional[ProfessionType]] = mapped_column(native_enum(ProfessionType), nullable=True)
+    craft_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    craft_time: Mapped[Optional[int]] = mapped_column(Integer, default=60)  # в секундах
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     __table_args__ = (
         Index('idx_item_template_type', 'item_type'),
         Index('idx_item_template_rarity', 'rarity'),
         Index('idx_item_template_level', 'level_requirement'),
+        Index('idx_item_template_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}),
     )
 
 class Item(Base):
     __tablename__ = 'items'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    template_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
-    owner_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=func.gen_random_uuid())
+    template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    owner_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
     
     # Модификации
-    current_durability = Column(Integer, nullable=True)
-    max_durability = Column(Integer, nullable=True)
-    enchantments = Column(JSON, nullable=True)  # [{"type": "fire", "value": 10}]
+    current_durability: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    max_durability: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    enchantments: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSONB, nullable=True)  # [{"type": "fire", "value": 10}]
     
     # Для ресурсов
-    quantity = Column(Integer, default=1)
+    quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Позиция в инвентаре
-    slot = Column(Integer, nullable=True)
+    slot: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     
     # Флаги
-    is_equipped = Column(Boolean, default=False)
+    is_equipped: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
     
     # Связи
-    template = relationship("ItemTemplate")
-    owner = relationship("User", foreign_keys=[owner_id])
+    template: Mapped["ItemTemplate"] = relationship("ItemTemplate", lazy="joined")
+    owner: Mapped[Optional["User"]] = relationship("User", foreign_keys=[owner_id])
     
     __table_args__ = (
         Index('idx_item_owner', 'owner_id'),
         Index('idx_item_template', 'template_id'),
+        Index('idx_item_equipped', 'owner_id', postgresql_where=text('is_equipped = true')),
     )
 
 # ============ МОДЕЛИ ИНВЕНТАРЯ ============
@@ -277,57 +398,57 @@ class Item(Base):
 class Inventory(Base):
     __tablename__ = 'inventories'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), unique=True, nullable=False)
-    capacity = Column(Integer, default=50)
-    max_capacity = Column(Integer, default=100)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), unique=True, nullable=False)
+    capacity: Mapped[Optional[int]] = mapped_column(Integer, default=50)
+    max_capacity: Mapped[Optional[int]] = mapped_column(Integer, default=100)
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id], backref="inventory")
-    items = relationship("Item", backref="inventory_ref")
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], backref="inventory")
+    items: Mapped[List["Item"]] = relationship("Item", backref="inventory_ref", lazy="selectin")
 
 # ============ МОДЕЛИ ЛОКАЦИЙ ============
 
 class Location(Base):
     __tablename__ = 'locations'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False, unique=True)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    location_type = Column(SQLEnum(LocationType), nullable=False)
-    min_level = Column(Integer, default=1)
-    max_level = Column(Integer, default=100)
-    base_xp_reward = Column(Integer, default=10)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    location_type: Mapped[LocationType] = mapped_column(native_enum(LocationType), nullable=False)
+    min_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_level: Mapped[Optional[int]] = mapped_column(Integer, default=100)
+    base_xp_reward: Mapped[Optional[int]] = mapped_column(Integer, default=10)
     
     # Флаги
-    has_mine = Column(Boolean, default=False)
-    mine_level = Column(Integer, default=0)
-    has_forest = Column(Boolean, default=False)
-    has_herbs = Column(Boolean, default=False)
+    has_mine: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    mine_level: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    has_forest: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    has_herbs: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     # Связи
-    travel_routes = relationship("TravelRoute", foreign_keys="TravelRoute.from_location_id")
-    mob_spawns = relationship("MobSpawn", back_populates="location")
-    resource_spawns = relationship("ResourceSpawn", back_populates="location")
-    event_triggers = relationship("EventTrigger", back_populates="location")
+    travel_routes: Mapped[List["TravelRoute"]] = relationship("TravelRoute", foreign_keys="TravelRoute.from_location_id")
+    mob_spawns: Mapped[List["MobSpawn"]] = relationship("MobSpawn", back_populates="location")
+    resource_spawns: Mapped[List["ResourceSpawn"]] = relationship("ResourceSpawn", back_populates="location")
+    event_triggers: Mapped[List["EventTrigger"]] = relationship("EventTrigger", back_populates="location")
 
 class TravelRoute(Base):
     __tablename__ = 'travel_routes'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    from_location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
-    to_location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
-    travel_time = Column(Integer, nullable=False)  # в секундах
-    min_level = Column(Integer, default=1)
-    gold_cost = Column(Integer, default=0)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    from_location_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
+    to_location_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
+    travel_time: Mapped[int] = mapped_column(Integer, nullable=False)  # в секундах
+    min_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    gold_cost: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Связи
-    from_location = relationship("Location", foreign_keys=[from_location_id])
-    to_location = relationship("Location", foreign_keys=[to_location_id])
+    from_location: Mapped["Location"] = relationship("Location", foreign_keys=[from_location_id])
+    to_location: Mapped["Location"] = relationship("Location", foreign_keys=[to_location_id])
     
     __table_args__ = (
         UniqueConstraint('from_location_id', 'to_location_id', name='unique_route'),
@@ -340,38 +461,38 @@ class TravelRoute(Base):
 class MobTemplate(Base):
     __tablename__ = 'mob_templates'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    mob_type = Column(SQLEnum(MobType), nullable=False)
-    level = Column(Integer, default=1)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    mob_type: Mapped[MobType] = mapped_column(native_enum(MobType), nullable=False)
+    level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Характеристики
-    health = Column(Integer, nullable=False)
-    damage_min = Column(Integer, nullable=False)
-    damage_max = Column(Integer, nullable=False)
-    defense = Column(Integer, default=0)
-    attack_speed = Column(Float, default=1.0)
+    health: Mapped[int] = mapped_column(Integer, nullable=False)
+    damage_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    damage_max: Mapped[int] = mapped_column(Integer, nullable=False)
+    defense: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    attack_speed: Mapped[Optional[float]] = mapped_column(Float, default=1.0)
     
     # Шансы
-    crit_chance = Column(Float, default=0.05)
-    dodge_chance = Column(Float, default=0.05)
+    crit_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.05)
+    dodge_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.05)
     
     # Награды
-    base_xp = Column(Integer, nullable=False)
-    gold_min = Column(Integer, default=0)
-    gold_max = Column(Integer, default=0)
+    base_xp: Mapped[int] = mapped_column(Integer, nullable=False)
+    gold_min: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    gold_max: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Флаги
-    is_boss = Column(Boolean, default=False)
-    respawn_time = Column(Integer, default=300)  # в секундах
+    is_boss: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    respawn_time: Mapped[Optional[int]] = mapped_column(Integer, default=300)  # в секундах
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     # Связи
-    drops = relationship("MobDrop", back_populates="mob_template")
+    drops: Mapped[List["MobDrop"]] = relationship("MobDrop", back_populates="mob_template", lazy="selectin")
     
     __table_args__ = (
         Index('idx_mob_template_level', 'level'),
@@ -381,62 +502,62 @@ class MobTemplate(Base):
 class MobDrop(Base):
     __tablename__ = 'mob_drops'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    mob_template_id = Column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=False)
-    item_template_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    mob_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=False)
+    item_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
     
-    drop_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    min_quantity = Column(Integer, default=1)
-    max_quantity = Column(Integer, default=1)
+    drop_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    min_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Связи
-    mob_template = relationship("MobTemplate", back_populates="drops")
-    item_template = relationship("ItemTemplate")
+    mob_template: Mapped["MobTemplate"] = relationship("MobTemplate", back_populates="drops")
+    item_template: Mapped["ItemTemplate"] = relationship("ItemTemplate", lazy="raise")
 
 class MobSpawn(Base):
     __tablename__ = 'mob_spawns'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
-    mob_template_id = Column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    location_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
+    mob_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=False)
     
-    spawn_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    min_level = Column(Integer, default=1)
-    max_level = Column(Integer, default=100)
-    max_count = Column(Integer, default=10)
+    spawn_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    min_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_level: Mapped[Optional[int]] = mapped_column(Integer, default=100)
+    max_count: Mapped[Optional[int]] = mapped_column(Integer, default=10)
     
     # Связи
-    location = relationship("Location", back_populates="mob_spawns")
-    mob_template = relationship("MobTemplate")
+    location: Mapped["Location"] = relationship("Location", back_populates="mob_spawns")
+    mob_template: Mapped["MobTemplate"] = relationship("MobTemplate", lazy="raise")
 
 # ============ МОДЕЛИ РЕСУРСОВ ============
 
 class ResourceTemplate(Base):
     __tablename__ = 'resource_templates'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    resource_type = Column(SQLEnum(ResourceType), nullable=False)
-    level = Column(Integer, default=1)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    resource_type: Mapped[ResourceType] = mapped_column(native_enum(ResourceType), nullable=False)
+    level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Параметры сбора
-    gather_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    min_quantity = Column(Integer, default=1)
-    max_quantity = Column(Integer, default=1)
-    gather_time = Column(Integer, default=60)  # в секундах
+    gather_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    min_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    gather_time: Mapped[Optional[int]] = mapped_column(Integer, default=60)  # в секундах
     
     # Требования
-    required_strength = Column(Integer, default=0)
-    required_profession_level = Column(Integer, default=1)
+    required_strength: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    required_profession_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Свойства
-    weight = Column(Float, default=0.1)
-    base_price = Column(Integer, nullable=False)
+    weight: Mapped[Optional[float]] = mapped_column(Float, default=0.1)
+    base_price: Mapped[int] = mapped_column(Integer, nullable=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     __table_args__ = (
         Index('idx_resource_type', 'resource_type'),
@@ -446,59 +567,59 @@ class ResourceTemplate(Base):
 class ResourceSpawn(Base):
     __tablename__ = 'resource_spawns'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
-    resource_template_id = Column(UUID(as_uuid=True), ForeignKey('resource_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    location_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=False)
+    resource_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('resource_templates.id'), nullable=False)
     
-    spawn_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    respawn_time = Column(Integer, default=600)  # в секундах
-    max_count = Column(Integer, default=100)
+    spawn_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    respawn_time: Mapped[Optional[int]] = mapped_column(Integer, default=600)  # в секундах
+    max_count: Mapped[Optional[int]] = mapped_column(Integer, default=100)
     
     # Связи
-    location = relationship("Location", back_populates="resource_spawns")
-    resource_template = relationship("ResourceTemplate")
+    location: Mapped["Location"] = relationship("Location", back_populates="resource_spawns")
+    resource_template: Mapped["ResourceTemplate"] = relationship("ResourceTemplate", lazy="raise")
 
 # ============ МОДЕЛИ СОБЫТИЙ ============
 
 class GameEvent(Base):
     __tablename__ = 'game_events'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    event_type = Column(SQLEnum(EventType), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    event_type: Mapped[EventType] = mapped_column(native_enum(EventType), nullable=False)
     
     # Активация
-    activation_type = Column(SQLEnum(EventActivationType), default=EventActivationType.CHANCE)
-    base_chance = Column(Float, default=0.2)  # 20%
-    min_player_level = Column(Integer, default=1)
-    max_player_level = Column(Integer, default=100)
+    activation_type: Mapped[Optional[EventActivationType]] = mapped_column(native_enum(EventActivationType), default=EventActivationType.CHANCE)
+    base_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.2)  # 20%
+    min_player_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_player_level: Mapped[Optional[int]] = mapped_column(Integer, default=100)
     
     # Время активации
-    start_time = Column(DateTime, nullable=True)
-    end_time = Column(DateTime, nullable=True)
-    duration = Column(Integer, default=3600)  # в секундах
+    start_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    end_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    duration: Mapped[Optional[int]] = mapped_column(Integer, default=3600)  # в секундах
     
     # Модификаторы
-    mob_power_modifier = Column(Float, default=1.0)
-    resource_spawn_modifier = Column(Float, default=1.0)
+    mob_power_modifier: Mapped[Optional[float]] = mapped_column(Float, default=1.0)
+    resource_spawn_modifier: Mapped[Optional[float]] = mapped_column(Float, default=1.0)
     
     # Награды
-    reward_gold_min = Column(Integer, default=0)
-    reward_gold_max = Column(Integer, default=0)
-    reward_xp = Column(Integer, default=0)
+    reward_gold_min: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    reward_gold_max: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    reward_xp: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Флаги
-    is_active = Column(Boolean, default=False)
-    is_repeatable = Column(Boolean, default=True)
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    is_repeatable: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     # Связи
-    triggers = relationship("EventTrigger", back_populates="game_event")
-    rewards = relationship("EventReward", back_populates="game_event")
+    triggers: Mapped[List["EventTrigger"]] = relationship("EventTrigger", back_populates="game_event")
+    rewards: Mapped[List["EventReward"]] = relationship("EventReward", back_populates="game_event")
     
     __table_args__ = (
         Index('idx_event_active', 'is_active'),
@@ -508,64 +629,64 @@ class GameEvent(Base):
 class EventTrigger(Base):
     __tablename__ = 'event_triggers'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    event_id = Column(UUID(as_uuid=True), ForeignKey('game_events.id'), nullable=False)
-    location_id = Column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    event_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('game_events.id'), nullable=False)
+    location_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('locations.id'), nullable=True)
     
-    trigger_chance = Column(Float, default=1.0)
+    trigger_chance: Mapped[Optional[float]] = mapped_column(Float, default=1.0)
     
     # Связи
-    game_event = relationship("GameEvent", back_populates="triggers")
-    location = relationship("Location", back_populates="event_triggers")
+    game_event: Mapped["GameEvent"] = relationship("GameEvent", back_populates="triggers")
+    location: Mapped[Optional["Location"]] = relationship("Location", back_populates="event_triggers")
 
 class EventReward(Base):
     __tablename__ = 'event_rewards'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    event_id = Column(UUID(as_uuid=True), ForeignKey('game_events.id'), nullable=False)
-    item_template_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    event_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('game_events.id'), nullable=False)
+    item_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
     
-    drop_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    min_quantity = Column(Integer, default=1)
-    max_quantity = Column(Integer, default=1)
+    drop_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    min_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Связи
-    game_event = relationship("GameEvent", back_populates="rewards")
-    item_template = relationship("ItemTemplate")
+    game_event: Mapped["GameEvent"] = relationship("GameEvent", back_populates="rewards")
+    item_template: Mapped["ItemTemplate"] = relationship("ItemTemplate", lazy="raise")
 
 # ============ МОДЕЛИ СУНДУКОВ ============
 
 class ChestTemplate(Base):
     __tablename__ = 'chest_templates'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    description = Column(Text, nullable=True)
-    icon = Column(String(50), nullable=False)
-    rarity = Column(SQLEnum(ItemRarity), nullable=False)
-    level = Column(Integer, default=1)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    icon: Mapped[str] = mapped_column(String(50), nullable=False)
+    rarity: Mapped[ItemRarity] = mapped_column(native_enum(ItemRarity), nullable=False)
+    level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Распределение
-    spawn_chance = Column(Float, default=0.05)  # 5%
-    min_player_level = Column(Integer, default=1)
-    max_player_level = Column(Integer, default=100)
+    spawn_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.05)  # 5%
+    min_player_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_player_level: Mapped[Optional[int]] = mapped_column(Integer, default=100)
     
     # Опасности
-    trap_chance = Column(Float, default=0.0)
-    trap_type = Column(String(50), nullable=True)
-    trap_damage = Column(Integer, default=0)
+    trap_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.0)
+    trap_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    trap_damage: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Требования для открытия
-    required_key_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=True)
-    required_lockpicking = Column(Integer, default=0)
-    required_strength = Column(Integer, default=0)
+    required_key_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=True)
+    required_lockpicking: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    required_strength: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     # Связи
-    required_key = relationship("ItemTemplate", foreign_keys=[required_key_id])
-    rewards = relationship("ChestReward", back_populates="chest_template")
+    required_key: Mapped[Optional["ItemTemplate"]] = relationship("ItemTemplate", foreign_keys=[required_key_id])
+    rewards: Mapped[List["ChestReward"]] = relationship("ChestReward", back_populates="chest_template", lazy="selectin")
     
     __table_args__ = (
         Index('idx_chest_rarity', 'rarity'),
@@ -575,48 +696,48 @@ class ChestTemplate(Base):
 class ChestReward(Base):
     __tablename__ = 'chest_rewards'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    chest_template_id = Column(UUID(as_uuid=True), ForeignKey('chest_templates.id'), nullable=False)
-    item_template_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    chest_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('chest_templates.id'), nullable=False)
+    item_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
     
-    drop_chance = Column(Float, nullable=False)  # 0.0 - 1.0
-    min_quantity = Column(Integer, default=1)
-    max_quantity = Column(Integer, default=1)
-    is_guaranteed = Column(Boolean, default=False)
+    drop_chance: Mapped[float] = mapped_column(Float, nullable=False)  # 0.0 - 1.0
+    min_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    max_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    is_guaranteed: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
     # Связи
-    chest_template = relationship("ChestTemplate", back_populates="rewards")
-    item_template = relationship("ItemTemplate")
+    chest_template: Mapped["ChestTemplate"] = relationship("ChestTemplate", back_populates="rewards")
+    item_template: Mapped["ItemTemplate"] = relationship("ItemTemplate", lazy="raise")
 
 # ============ МОДЕЛИ КРАФТА ============
 
 class Recipe(Base):
     __tablename__ = 'recipes'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(200), nullable=False)
-    description = Column(Text, nullable=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
     # Результирующий предмет
-    result_item_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
-    result_quantity = Column(Integer, default=1)
+    result_item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    result_quantity: Mapped[Optional[int]] = mapped_column(Integer, default=1)
     
     # Требования
-    profession_type = Column(SQLEnum(ProfessionType), nullable=False)
-    profession_level = Column(Integer, default=1)
-    craft_time = Column(Integer, default=60)  # в секундах
-    gold_cost = Column(Integer, default=0)
+    profession_type: Mapped[ProfessionType] = mapped_column(native_enum(ProfessionType), nullable=False)
+    profession_level: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    craft_time: Mapped[Optional[int]] = mapped_column(Integer, default=60)  # в секундах
+    gold_cost: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Флаги
-    is_discovered = Column(Boolean, default=False)
-    discover_chance = Column(Float, default=0.0)
+    is_discovered: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    discover_chance: Mapped[Optional[float]] = mapped_column(Float, default=0.0)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
     
     # Связи
-    result_item = relationship("ItemTemplate", foreign_keys=[result_item_id])
-    ingredients = relationship("RecipeIngredient", back_populates="recipe")
+    result_item: Mapped["ItemTemplate"] = relationship("ItemTemplate", foreign_keys=[result_item_id])
+    ingredients: Mapped[List["RecipeIngredient"]] = relationship("RecipeIngredient", back_populates="recipe")
     
     __table_args__ = (
         Index('idx_recipe_profession', 'profession_type'),
@@ -626,84 +747,129 @@ class Recipe(Base):
 class RecipeIngredient(Base):
     __tablename__ = 'recipe_ingredients'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    recipe_id = Column(UUID(as_uuid=True), ForeignKey('recipes.id'), nullable=False)
-    item_template_id = Column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    recipe_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('recipes.id'), nullable=False)
+    item_template_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('item_templates.id'), nullable=False)
     
-    quantity = Column(Integer, nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
     
     # Связи
-    recipe = relationship("Recipe", back_populates="ingredients")
-    item_template = relationship("ItemTemplate")
+    recipe: Mapped["Recipe"] = relationship("Recipe", back_populates="ingredients")
+    item_template: Mapped["ItemTemplate"] = relationship("ItemTemplate", lazy="raise")
 
 # ============ МОДЕЛИ АКТИВНЫХ ДЕЙСТВИЙ ============
 
 class ActiveAction(Base):
     __tablename__ = 'active_actions'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    action_type = Column(SQLEnum(ActionType), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, server_default=func.uuid_generate_v7())
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    action_type: Mapped[ActionType] = mapped_column(native_enum(ActionType), nullable=False)
     
     # Параметры действия
-    target_id = Column(UUID(as_uuid=True), nullable=True)  # mob_id, location_id, etc
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=False)
+    target_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)  # mob_id, location_id, etc
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     
     # Прогресс
-    progress = Column(Float, default=0.0)  # 0.0 - 1.0
-    is_completed = Column(Boolean, default=False)
+    progress: Mapped[Optional[float]] = mapped_column(Float, default=0.0)  # 0.0 - 1.0
+    is_completed: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
     # Дополнительные данные
-    data = Column(JSON, nullable=True)  # {"mob_hp": 100, "resources_gathered": []}
+    data: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)  # {"mob_hp": 100, "resources_gathered": []}
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id])
     
     __table_args__ = (
         Index('idx_active_action_user', 'user_id'),
         Index('idx_active_action_type', 'action_type'),
         Index('idx_active_action_end', 'end_time'),
+        # Покрывающий индекс для планировщика "просроченных" действий
+        Index(
+            'idx_action_due', 'end_time',
+            postgresql_where=text('is_completed = false'),
+            postgresql_include=['user_id', 'action_type']
+        ),
     )
 
 class ActiveBattle(Base):
     __tablename__ = 'active_battles'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    mob_template_id = Column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=True)
-    pvp_target_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=func.gen_random_uuid())
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    mob_template_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('mob_templates.id'), nullable=True)
+    pvp_target_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
     
     # Статус битвы
-    status = Column(SQLEnum(BattleStatus), default=BattleStatus.ACTIVE)
+    status: Mapped[Optional[BattleStatus]] = mapped_column(native_enum(BattleStatus), default=BattleStatus.ACTIVE)
     
     # Здоровье участников
-    player_hp = Column(Integer, nullable=False)
-    player_max_hp = Column(Integer, nullable=False)
-    target_hp = Column(Integer, nullable=False)
-    target_max_hp = Column(Integer, nullable=False)
+    player_hp: Mapped[int] = mapped_column(Integer, nullable=False)
+    player_max_hp: Mapped[int] = mapped_column(Integer, nullable=False)
+    target_hp: Mapped[int] = mapped_column(Integer, nullable=False)
+    target_max_hp: Mapped[int] = mapped_column(Integer, nullable=False)
     
     # Ставки (для PvP)
-    bet_amount = Column(BigInteger, default=0)
+    bet_amount: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
     
     # Время
-    started_at = Column(DateTime, default=datetime.utcnow)
-    last_action_at = Column(DateTime, default=datetime.utcnow)
-    ended_at = Column(DateTime, nullable=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    last_action_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
-    # Дополнительные данные
-    battle_log = Column(JSON, nullable=True)  # Массив действий в битве
+    # Лог битвы хранится построчно в battle_log_entries, здесь только счетчик записей
+    log_size: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
-    mob_template = relationship("MobTemplate")
-    pvp_target = relationship("User", foreign_keys=[pvp_target_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id])
+    mob_template: Mapped[Optional["MobTemplate"]] = relationship("MobTemplate")
+    pvp_target: Mapped[Optional["User"]] = relationship("User", foreign_keys=[pvp_target_id])
+    log_entries: Mapped[List["BattleLogEntry"]] = relationship(
+        "BattleLogEntry", back_populates="battle", order_by="BattleLogEntry.seq",
+        lazy="raise", cascade="all, delete-orphan", passive_deletes=True
+    )
     
     __table_args__ = (
         Index('idx_battle_user', 'user_id'),
-        Index('idx_battle_status', 'status'),
+        # SQLEnum хранит имена членов перечисления, поэтому 'ACTIVE'
+        Index('idx_battle_active', 'user_id', postgresql_where=text("status = 'ACTIVE'")),
+    )
+
+class BattleLogEntry(Base):
+    """Одна запись лога битвы: каждое действие - отдельный INSERT вместо перезаписи всего лога"""
+    __tablename__ = 'battle_log_entries'
+    
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    battle_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('active_battles.id', ondelete='CASCADE'), nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    actor: Mapped[str] = mapped_column(String(20), nullable=False)  # "player", "mob", "target"
+    action: Mapped[str] = mapped_column(String(50), nullable=False)
+    damage: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    details: Mapped[Dict[str, Any]] = mapped_column(JSONB, nullable=False)  # Полная запись хода
+    
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    
+    # Связи
+    battle: Mapped["ActiveBattle"] = relationship("ActiveBattle", back_populates="log_entries")
+    
+    __table_args__ = (
+        Index('idx_battlelog_battle_seq', 'battle_id', 'seq', unique=True),
+    )
+
+def new_battle_log_entry(battle: ActiveBattle, actor: str, entry: Dict[str, Any]) -> BattleLogEntry:
+    """Создать следующую запись лога битвы (добавляется в сессию вызывающим кодом)"""
+    battle.log_size = (battle.log_size or 0) + 1
+    return BattleLogEntry(
+        battle_id=battle.id,
+        seq=battle.log_size,
+        actor=actor,
+        action=entry.get("action", "unknown"),
+        damage=entry.get("damage"),
+        details=entry
     )
 
 # ============ МОДЕЛИ ЭФФЕКТОВ ============
@@ -711,29 +877,31 @@ class ActiveBattle(Base):
 class ActiveEffect(Base):
     __tablename__ = 'active_effects'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    # Append-only таблица: 8-байтовый монотонный ключ вместо UUID
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     
     # Эффект
-    effect_type = Column(String(100), nullable=False)  # "heal_over_time", "damage_buff", "poison"
-    effect_power = Column(Float, nullable=False)
+    effect_type: Mapped[str] = mapped_column(String(100), nullable=False)  # "heal_over_time", "damage_buff", "poison"
+    effect_power: Mapped[float] = mapped_column(Float, nullable=False)
     
     # Время действия
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     
     # Источник эффекта
-    source_type = Column(String(50), nullable=True)  # "potion", "enchantment", "skill"
-    source_id = Column(UUID(as_uuid=True), nullable=True)
+    source_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # "potion", "enchantment", "skill"
+    source_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id])
     
     __table_args__ = (
         Index('idx_effect_user', 'user_id'),
         Index('idx_effect_end', 'end_time'),
+        Index('idx_effect_due', 'end_time', postgresql_include=['user_id', 'effect_type']),
     )
 
 # ============ МОДЕЛИ PvP ============
@@ -741,61 +909,64 @@ class ActiveEffect(Base):
 class PvPChallenge(Base):
     __tablename__ = 'pvp_challenges'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    challenger_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    target_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, server_default=func.gen_random_uuid())
+    challenger_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    target_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     
     # Ставка
-    bet_amount = Column(BigInteger, nullable=False)
+    bet_amount: Mapped[int] = mapped_column(BigInteger, nullable=False)
     
     # Статус
-    status = Column(String(50), default='pending')  # pending, accepted, declined, cancelled
+    status: Mapped[Optional[PvPChallengeStatus]] = mapped_column(native_enum(PvPChallengeStatus), default=PvPChallengeStatus.PENDING)
     
     # Время
-    created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     
     # Связи
-    challenger = relationship("User", foreign_keys=[challenger_id])
-    target = relationship("User", foreign_keys=[target_id])
+    challenger: Mapped["User"] = relationship("User", foreign_keys=[challenger_id])
+    target: Mapped["User"] = relationship("User", foreign_keys=[target_id])
     
     __table_args__ = (
         Index('idx_pvp_challenger', 'challenger_id'),
         Index('idx_pvp_target', 'target_id'),
-        Index('idx_pvp_status', 'status'),
+        Index(
+            'idx_pvp_pending', 'target_id', 'expires_at',
+            postgresql_where=text("status = 'PENDING'")
+        ),
     )
 
 class PvPMatch(Base):
     __tablename__ = 'pvp_matches'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    player1_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    player2_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    player1_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    player2_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     
     # Ставка
-    bet_amount = Column(BigInteger, nullable=False)
+    bet_amount: Mapped[int] = mapped_column(BigInteger, nullable=False)
     
     # Результат
-    winner_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
-    loser_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    winner_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    loser_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
     
     # Статистика
-    player1_hp_lost = Column(Integer, default=0)
-    player2_hp_lost = Column(Integer, default=0)
-    rounds_count = Column(Integer, default=0)
+    player1_hp_lost: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    player2_hp_lost: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    rounds_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Время
-    started_at = Column(DateTime, default=datetime.utcnow)
-    ended_at = Column(DateTime, nullable=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
     # Лог боя
-    battle_log = Column(JSON, nullable=True)
+    battle_log: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSONB, nullable=True)
     
     # Связи
-    player1 = relationship("User", foreign_keys=[player1_id])
-    player2 = relationship("User", foreign_keys=[player2_id])
-    winner = relationship("User", foreign_keys=[winner_id])
-    loser = relationship("User", foreign_keys=[loser_id])
+    player1: Mapped["User"] = relationship("User", foreign_keys=[player1_id])
+    player2: Mapped["User"] = relationship("User", foreign_keys=[player2_id])
+    winner: Mapped[Optional["User"]] = relationship("User", foreign_keys=[winner_id])
+    loser: Mapped[Optional["User"]] = relationship("User", foreign_keys=[loser_id])
     
     __table_args__ = (
         Index('idx_pvp_players', 'player1_id', 'player2_id'),
@@ -808,185 +979,555 @@ class PvPMatch(Base):
 class SystemSettings(Base):
     __tablename__ = 'system_settings'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    key = Column(String(100), unique=True, nullable=False)
-    value = Column(JSON, nullable=False)
-    description = Column(Text, nullable=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    key: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+    value: Mapped[Any] = mapped_column(JSONB, nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    __table_args__ = (
-        Index('idx_settings_key', 'key'),
-    )
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()), onupdate=datetime.utcnow)
 
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
-    action = Column(String(200), nullable=False)
-    details = Column(JSON, nullable=True)
-    ip_address = Column(String(45), nullable=True)
+    # Append-only таблица: 8-байтовый монотонный ключ вместо UUID
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    user_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    action: Mapped[str] = mapped_column(String(200), nullable=False)
+    details: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    ip_address: Mapped[Optional[str]] = mapped_column(String(45), nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped[Optional["User"]] = relationship("User", foreign_keys=[user_id])
     
     __table_args__ = (
         Index('idx_audit_user', 'user_id'),
         Index('idx_audit_action', 'action'),
-        Index('idx_audit_date', 'created_at'),
+        # Append-only журнал: BRIN в сотни раз меньше B-tree и почти не пачкает страницы при вставке
+        Index('idx_audit_date_brin', 'created_at', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
+        Index('idx_audit_details_gin', 'details', postgresql_using='gin'),
     )
 
 class BackupLog(Base):
     __tablename__ = 'backup_logs'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    filename = Column(String(200), nullable=False)
-    size_bytes = Column(BigInteger, nullable=False)
-    success = Column(Boolean, default=True)
-    error_message = Column(Text, nullable=True)
-    
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Append-only таблица: 8-байтовый монотонный ключ вместо UUID (порядок id = порядок создания)
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    filename: Mapped[str] = mapped_column(String(200), nullable=False)
+    size_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    success: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
-    __table_args__ = (
-        Index('idx_backup_date', 'created_at'),
-    )
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+
+# Трейсбеки читаются редко: LZ4 (PG14+) сжимает и разжимает заметно быстрее PGLZ
+event.listen(
+    BackupLog.__table__,
+    "after_create",
+    DDL("ALTER TABLE backup_logs ALTER COLUMN error_message SET COMPRESSION lz4").execute_if(dialect="postgresql")
+)
+
+# ============ АСИНХРОННЫЙ COMMIT ДЛЯ ЖУРНАЛА АУДИТА ============
+# Транзакция, которая пишет только строки audit_logs, коммитится с synchronous_commit = off:
+# COMMIT не ждет fsync WAL, при сбое теряются лишь последние секунды журнала.
+# Если в транзакции есть любая другая запись, commit остается синхронным.
+
+def _track_pending_writes(session: Session):
+    """Отметить в session.info, что транзакция пишет: только аудит или что-то еще"""
+    if session.dirty or session.deleted or any(not isinstance(obj, AuditLog) for obj in session.new):
+        session.info["durable_writes"] = True
+    elif session.new:
+        session.info["audit_writes"] = True
+
+@event.listens_for(Session, "before_flush")
+def _audit_before_flush(session, flush_context, instances):
+    _track_pending_writes(session)
+
+@event.listens_for(Session, "do_orm_execute")
+def _audit_orm_execute(orm_execute_state):
+    # insert()/update()/delete() через session.execute идут мимо flush
+    if orm_execute_state.is_insert and orm_execute_state.statement.table.name == AuditLog.__tablename__:
+        orm_execute_state.session.info["audit_writes"] = True
+    elif orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["durable_writes"] = True
+
+@event.listens_for(Session, "before_commit")
+def _audit_before_commit(session):
+    _track_pending_writes(session)
+    if session.info.get("audit_writes") and not session.info.get("durable_writes"):
+        connection = session.connection()
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql("SET LOCAL synchronous_commit = off")
+
+@event.listens_for(Session, "after_transaction_end")
+def _audit_reset(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("audit_writes", None)
+        session.info.pop("durable_writes", None)
 
 # ============ ВСПОМОГАТЕЛЬНЫЕ МОДЕЛИ ============
 
 class PlayerStat(Base):
     __tablename__ = 'player_stats'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), unique=True, nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     
-    # Ежедневная статистика
-    daily_mobs_killed = Column(Integer, default=0)
-    daily_players_killed = Column(Integer, default=0)
-    daily_gold_earned = Column(BigInteger, default=0)
-    daily_items_found = Column(Integer, default=0)
+    # Ежедневная статистика хранится в player_daily_events
     
     # Сессии
-    current_session_start = Column(DateTime, nullable=True)
-    total_play_time = Column(Integer, default=0)  # в секундах
+    current_session_start: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    total_play_time: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # в секундах
     
     # Последние активности
-    last_battle_time = Column(DateTime, nullable=True)
-    last_travel_time = Column(DateTime, nullable=True)
-    last_craft_time = Column(DateTime, nullable=True)
-    last_pvp_time = Column(DateTime, nullable=True)
+    last_battle_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_travel_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_craft_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_pvp_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], lazy="raise")
     
     __table_args__ = (
-        Index('idx_stats_user', 'user_id'),
+        # Уникальность user_id и index-only scan для горячих полей одним индексом
+        Index('idx_stats_user_cover', 'user_id', unique=True,
+              postgresql_include=['last_battle_time', 'last_pvp_time']),
     )
 
+class PlayerDailyEvent(Base):
+    """Дневные счетчики игрока: узкая строка на (игрок, день, вид) вместо горячего UPDATE player_stats"""
+    __tablename__ = 'player_daily_events'
+    
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    kind: Mapped[int] = mapped_column(SmallInteger, primary_key=True)  # DailyStatKind
+    amount: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
 class Discovery(Base):
     __tablename__ = 'discoveries'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    
-    # Что открыто
-    discovered_locations = Column(ARRAY(UUID), default=[])
-    discovered_recipes = Column(ARRAY(UUID), default=[])
-    discovered_events = Column(ARRAY(UUID), default=[])
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     
-    # Статистика открытий
-    total_discoveries = Column(Integer, default=0)
+    # Статистика открытий (сами открытия - в user_discoveries)
+    total_discoveries: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], lazy="raise")
     
     __table_args__ = (
-        Index('idx_discovery_user', 'user_id'),
+        Index('idx_discovery_user', 'user_id', unique=True),
     )
 
+class UserDiscovery(Base):
+    """Одно открытие игрока: проверка членства - поиск по первичному ключу, добавление - одна строка"""
+    __tablename__ = 'user_discoveries'
+    
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)  # "location", "recipe", "event"
+    entity_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+
 # ============ СИСТЕМНЫЕ ТАБЛИЦЫ ДЛЯ ВОССТАНОВЛЕНИЯ ============
 
 class StateSnapshot(Base):
     __tablename__ = 'state_snapshots'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    snapshot_type = Column(String(50), nullable=False)  # 'active_action', 'battle', 'effect'
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, server_default=func.uuid_generate_v7())
+    snapshot_type: Mapped[str] = mapped_column(String(50), nullable=False)  # 'active_action', 'battle', 'effect'
     
     # Данные для восстановления
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    entity_id = Column(UUID(as_uuid=True), nullable=False)
-    entity_type = Column(String(100), nullable=False)
-    snapshot_data = Column(JSON, nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    entity_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    entity_type: Mapped[str] = mapped_column(String(100), nullable=False)
+    
+    # Часто читаемые поля вынесены из JSONB в типизированные колонки
+    target_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)  # Локация/ресурс/рецепт/моб
+    ends_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # Окончание действия
+    
+    # Полезная нагрузка: MessagePack в bytea (пишется часто, читается только при рестарте),
+    # JSONB - запасной вариант без ormsgpack
+    snapshot_blob: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    snapshot_data: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
     
     # Время
-    created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)  # Автоматическое удаление после восстановления
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.timezone('utc', func.now()))
+    # Ключ секционирования (по дням), поэтому входит в первичный ключ
+    expires_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
     
     # Флаги
-    is_restored = Column(Boolean, default=False)
+    is_restored: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
     # Связи
-    user = relationship("User", foreign_keys=[user_id])
+    user: Mapped["User"] = relationship("User", foreign_keys=[user_id], lazy="raise")
     
     __table_args__ = (
         Index('idx_snapshot_user', 'user_id'),
         Index('idx_snapshot_type', 'snapshot_type'),
-        Index('idx_snapshot_expires', 'expires_at'),
+        # Только невосстановленные снапшоты: их ищут при рестарте и чистит сборщик
+        Index('idx_snapshot_expires_active', 'expires_at', postgresql_where=text('is_restored = false')),
+        Index('idx_snapshot_user_active', 'user_id', postgresql_where=text('is_restored = false')),
+        Index('idx_snapshot_expires_brin', 'expires_at', postgresql_using='brin',
+              postgresql_with={'pages_per_range': 32}),
+        Index('idx_snapshot_data_gin', 'snapshot_data', postgresql_using='gin',
+              postgresql_ops={'snapshot_data': 'jsonb_path_ops'}),
+        # Истекшие снапшоты удаляются целыми секциями (DROP TABLE) вместо DELETE по строкам
+        {'postgresql_partition_by': 'RANGE (expires_at)'},
     )
+    
+    @staticmethod
+    def pack_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Аргументы конструктора для полезной нагрузки снапшота"""
+        if ormsgpack is not None:
+            return {"snapshot_blob": ormsgpack.packb(data)}
+        return {"snapshot_data": data}
+    
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """Распакованная полезная нагрузка снапшота"""
+        if self.snapshot_blob is not None:
+            return ormsgpack.unpackb(self.snapshot_blob)
+        return self.snapshot_data or {}
+
+SNAPSHOT_PARTITION_PREFIX = "state_snapshots_"
+
+def snapshot_partition_ddl(day: date) -> str:
+    """DDL суточной секции state_snapshots"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_PARTITION_PREFIX}{day:%Y%m%d} "
+        f"PARTITION OF state_snapshots "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+
+def snapshot_partitions_ddl(days_ahead: int = 7) -> List[str]:
+    """Секции на сегодня и days_ahead дней вперед плюс DEFAULT для всего, что дальше"""
+    today = datetime.utcnow().date()
+    statements = [snapshot_partition_ddl(today + timedelta(days=i)) for i in range(days_ahead + 1)]
+    statements.append(
+        f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_PARTITION_PREFIX}default PARTITION OF state_snapshots DEFAULT"
+    )
+    return statements
+
+LIST_SNAPSHOT_PARTITIONS = text("""
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'state_snapshots'::regclass
+""")
+
+async def maintain_snapshot_partitions(db: AsyncSession, days_ahead: int = 7) -> int:
+    """Создать секции снапшотов на days_ahead дней вперед и удалить полностью истекшие (commit - за вызывающим)"""
+    today = datetime.utcnow().date()
+    dropped = 0
+    
+    for statement in snapshot_partitions_ddl(days_ahead):
+        await db.execute(text(statement))
+    
+    result = await db.execute(LIST_SNAPSHOT_PARTITIONS)
+    for (name,) in result.all():
+        suffix = name[len(SNAPSHOT_PARTITION_PREFIX):]
+        if not suffix.isdigit():
+            continue
+        # Секция покрывает сутки day: все ее снапшоты истекли, если day < сегодня
+        if datetime.strptime(suffix, "%Y%m%d").date() < today:
+            await db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped += 1
+    
+    return dropped
+
+# ============ МАТЕРИАЛИЗОВАННЫЕ ПРЕДСТАВЛЕНИЯ ============
+
+class Leaderboard(Base):
+    """Снимок рейтинга игроков (materialized view, только чтение)"""
+    __tablename__ = 'leaderboard'
+    
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    username: Mapped[Optional[str]] = mapped_column(String(100))
+    level: Mapped[Optional[int]] = mapped_column(Integer)
+    experience: Mapped[Optional[int]] = mapped_column(BigInteger)
+    players_killed: Mapped[Optional[int]] = mapped_column(Integer)
+    deaths: Mapped[Optional[int]] = mapped_column(Integer)
+    
+    # Не создается через create_all, см. LEADERBOARD_DDL
+    __table_args__ = {'info': {'is_view': True}}
+
+LEADERBOARD_DDL = (
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+    SELECT u.id AS user_id, u.username, u.level,
+           c.experience, c.players_killed, c.deaths
+    FROM users u
+    JOIN user_counters c ON c.user_id = u.id
+    """,
+    # Уникальный индекс нужен для REFRESH ... CONCURRENTLY
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_user ON leaderboard (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_level ON leaderboard (level DESC, experience DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_kills ON leaderboard (players_killed DESC)",
+)
+
+# Обновление снимка без блокировки читателей (нужен уникальный индекс idx_leaderboard_user)
+REFRESH_LEADERBOARD = text("REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard")
+
+# ============ ЗАРАНЕЕ ПОСТРОЕННЫЕ ЗАПРОСЫ ============
+
+# Строятся один раз при импорте: скомпилированный SQL берется из кэша движка
+GET_USER_BY_TELEGRAM = select(User).where(User.telegram_id == bindparam("tid"))
+
+GET_ACTIVE_BATTLE = select(ActiveBattle).where(
+    and_(
+        ActiveBattle.user_id == bindparam("user_id"),
+        ActiveBattle.status == BattleStatus.ACTIVE
+    )
+)
+
+GET_BATTLE_LOG = (
+    select(BattleLogEntry.details)
+    .where(BattleLogEntry.battle_id == bindparam("battle_id"))
+    .order_by(BattleLogEntry.seq)
+)
+
+GET_DUE_ACTIONS = select(ActiveAction).where(
+    and_(
+        ActiveAction.is_completed == False,
+        ActiveAction.end_time <= bindparam("now")
+    )
+)
+
+# Новое открытие: возвращает строку только если его еще не было
+ADD_USER_DISCOVERY = (
+    pg_insert(UserDiscovery)
+    .values(user_id=bindparam("user_id"), kind=bindparam("kind"), entity_id=bindparam("entity_id"))
+    .on_conflict_do_nothing()
+    .returning(UserDiscovery.entity_id)
+)
+
+BUMP_DISCOVERY_COUNTER = (
+    pg_insert(Discovery)
+    .values(user_id=bindparam("user_id"), total_discoveries=1)
+    .on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={"total_discoveries": Discovery.total_discoveries + 1}
+    )
+)
+
+# Текущие сутки по UTC, как и остальные временные метки
+_UTC_TODAY = func.date(func.timezone('utc', func.now()))
+
+_add_daily_stat = pg_insert(PlayerDailyEvent).values(
+    user_id=bindparam("user_id"), day=_UTC_TODAY, kind=bindparam("kind"), amount=bindparam("amount")
+)
+ADD_DAILY_STAT = _add_daily_stat.on_conflict_do_update(
+    index_elements=['user_id', 'day', 'kind'],
+    set_={"amount": PlayerDailyEvent.amount + _add_daily_stat.excluded.amount}
+)
+
+GET_TODAY_STATS = select(PlayerDailyEvent.kind, PlayerDailyEvent.amount).where(
+    and_(
+        PlayerDailyEvent.user_id == bindparam("user_id"),
+        PlayerDailyEvent.day == _UTC_TODAY
+    )
+)
+
+@lru_cache(maxsize=256)
+def get_user_actions_stmt(action_types: Tuple[ActionType, ...]):
+    """Незавершенные действия игрока заданных типов (один объект запроса на набор типов)"""
+    return select(ActiveAction).where(
+        and_(
+            ActiveAction.user_id == bindparam("user_id"),
+            ActiveAction.action_type.in_(action_types),
+            ActiveAction.is_completed == False
+        )
+    )
+
+# ============ МИГРАЦИИ ДАННЫХ ============
+
+# user_counters для баз, где счетчики еще лежат в users: строки переносятся из старых
+# столбцов (только если они есть), остальные игроки получают строку с дефолтами.
+# Старые столбцы users не удаляются - повтор безопасен и ничего не теряет
+USER_COUNTERS_MIGRATION = (
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'users' AND column_name = 'gold'
+        ) THEN
+            INSERT INTO user_counters (
+                user_id, current_hp, current_mp, stamina, experience, gold,
+                mobs_killed, players_killed, deaths, total_damage_dealt, total_damage_taken
+            )
+            SELECT id, COALESCE(current_hp, 100), COALESCE(current_mp, 50), COALESCE(stamina, 100),
+                   COALESCE(experience, 0), COALESCE(gold, 100),
+                   COALESCE(mobs_killed, 0), COALESCE(players_killed, 0), COALESCE(deaths, 0),
+                   COALESCE(total_damage_dealt, 0), COALESCE(total_damage_taken, 0)
+            FROM users
+            ON CONFLICT (user_id) DO NOTHING;
+        END IF;
+    END
+    $$
+    """,
+    """
+    INSERT INTO user_counters (
+        user_id, current_hp, current_mp, stamina, experience, gold,
+        mobs_killed, players_killed, deaths, total_damage_dealt, total_damage_taken
+    )
+    SELECT id, 100, 50, 100, 0, 100, 0, 0, 0, 0, 0
+    FROM users
+    ON CONFLICT (user_id) DO NOTHING
+    """,
+)
+
+# users.equipped для баз, созданных до появления столбца: столбец и разовое заполнение
+# по надетым предметам (поля как у InventoryManager._equipped_snapshot); повтор безопасен
+USER_EQUIPPED_MIGRATION = (
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS equipped JSONB DEFAULT '{}'::jsonb",
+    """
+    UPDATE users u
+    SET equipped = COALESCE((
+        SELECT jsonb_object_agg(s.slot, jsonb_build_object(
+            'id', i.id::text,
+            'name', t.name,
+            'icon', t.icon,
+            'damage_min', t.damage_min,
+            'damage_max', t.damage_max,
+            'defense', t.defense
+        ))
+        FROM (VALUES ('weapon', u.weapon_id), ('armor', u.armor_id), ('helmet', u.helmet_id),
+                     ('gloves', u.gloves_id), ('boots', u.boots_id)) AS s(slot, item_id)
+        JOIN items i ON i.id = s.item_id AND i.is_equipped
+        JOIN item_templates t ON t.id = i.template_id
+    ), '{}'::jsonb)
+    WHERE (u.equipped IS NULL OR u.equipped = '{}'::jsonb)
+      AND COALESCE(u.weapon_id, u.armor_id, u.helmet_id, u.gloves_id, u.boots_id) IS NOT NULL
+    """,
+)
 
 # ============ ФУНКЦИЯ СОЗДАНИЯ ВСЕХ ТАБЛИЦ ============
 
+def _physical_tables():
+    """Таблицы без представлений"""
+    return [table for table in Base.metadata.sorted_tables if not table.info.get('is_view')]
+
 def create_all_tables(engine):
     """Создание всех таблиц в базе данных"""
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(engine, tables=_physical_tables())
+    
+    with engine.begin() as conn:
+        for statement in snapshot_partitions_ddl():
+            conn.execute(text(statement))
+        # Счетчики переносятся до создания leaderboard: представление соединяет users с user_counters
+        for statement in USER_COUNTERS_MIGRATION:
+            conn.execute(text(statement))
+        for statement in LEADERBOARD_DDL:
+            conn.execute(text(statement))
+        for statement in USER_EQUIPPED_MIGRATION:
+            conn.execute(text(statement))
 
 # ============ УТИЛИТЫ ДЛЯ РАБОТЫ С БД ============
 
 class DatabaseManager:
-    def __init__(self, database_url: str):
-        self.engine = create_engine(database_url, echo=False, pool_size=20, max_overflow=30)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+    def __init__(self, database_url: str, pool_size: Optional[int] = None,
+                 max_overflow: Optional[int] = None, pool_timeout: Optional[int] = None,
+                 pool_use_lifo: bool = True, pool_pre_ping: bool = True,
+                 pool_recycle: int = 1800, warmup: bool = True):
+        # Размеры пула по умолчанию берутся из окружения
+        pool_size = pool_size if pool_size is not None else int(os.getenv("DB_POOL_SIZE", "20"))
+        max_overflow = max_overflow if max_overflow is not None else int(os.getenv("DB_MAX_OVERFLOW", "30"))
+        pool_timeout = pool_timeout if pool_timeout is not None else int(os.getenv("DB_POOL_TIMEOUT", "30"))
+        
+        connect_args = {}
+        if make_url(database_url).drivername == "postgresql+psycopg":
+            # psycopg3: серверные prepared statements для запросов, выполненных 5+ раз
+            connect_args["prepare_threshold"] = 5
+        
+        # LIFO: горячее подмножество соединений переиспользуется, лишние простаивают и закрываются
+        self.engine = create_engine(
+            database_url,
+            echo=False,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_use_lifo=pool_use_lifo,
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
+            query_cache_size=1200,
+            connect_args=connect_args,
+            future=True
+        )
+        # expire_on_commit=False: после commit атрибуты не перечитываются отдельным SELECT
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
         
+        if warmup and pool_size > 0:
+            self._warmup(pool_size)
+    
+    def _warmup(self, connections: int):
+        """Открыть соединения пула заранее: первые запросы после старта не ждут TLS и авторизацию"""
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            opened = list(executor.map(lambda _: self.engine.connect(), range(connections)))
+        for connection in opened:
+            connection.close()  # Возвращается в пул, а не закрывается
+    
     def get_session(self):
-        """Получить сессию базы данных"""
+        """Получить сессию базы данных (закрывает вызывающий код)"""
         return self.SessionLocal()
     
+    @contextmanager
+    def session_scope(self):
+        """Сессия, которая всегда закрывается (с откатом при исключении)"""
+        session = self.SessionLocal()
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
     def create_tables(self):
         """Создать все таблицы"""
         create_all_tables(self.engine)
     
     def drop_tables(self):
         """Удалить все таблицы (для тестов)"""
-        Base.metadata.drop_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS leaderboard"))
+        Base.metadata.drop_all(self.engine, tables=_physical_tables())
     
-    def create_initial_data(self):
-        """Создать начальные данные"""
-        session = self.get_session()
-        try:
-            # Проверяем, есть ли уже начальные данные
-            user_count = session.query(User).count()
-            if user_count == 0:
+    def create_initial_data(self, seed_data: Optional[List[Tuple[type, List[Dict[str, Any]]]]] = None):
+        """Создать начальные данные.
+        
+        seed_data - пары (модель, список словарей колонок); каждая пара вставляется
+        одним executemany без учета объектов в identity map, все в одной транзакции.
+        """
+        with self.session_scope() as session:
+            # Проверяем, есть ли уже начальные данные (LIMIT 1 вместо подсчета всей таблицы)
+            has_users = session.query(User.id).limit(1).first() is not None
+            if not has_users:
                 # Создаем админа
-                admin_user = User(
-                    telegram_id=123456789,
-                    username="admin",
-                    first_name="Admin",
-                    role=UserRole.ADMIN,
-                    level=100,
-                    gold=999999,
-                    strength=100,
-                    agility=100,
-                    intelligence=100,
-                    constitution=100
-                )
-                session.add(admin_user)
+                admin_user = {
+                    "telegram_id": 123456789,
+                    "username": "admin",
+                    "first_name": "Admin",
+                    "role": UserRole.ADMIN,
+                    "level": 100,
+                    "strength": 100,
+                    "agility": 100,
+                    "intelligence": 100,
+                    "constitution": 100
+                }
+                # return_defaults: id генерирует сервер, он нужен для строки счетчиков
+                session.bulk_insert_mappings(User, [admin_user], return_defaults=True)
+                session.bulk_insert_mappings(UserCounters, [{"user_id": admin_user["id"], "gold": 999999}])
+                
+                for model, rows in seed_data or []:
+                    session.bulk_insert_mappings(model, rows)
+                
                 session.commit()
                 print("✅ Создан пользователь-администратор")
-        finally:
-            session.close()
 
 # Пример использования
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 import asyncio
+import bisect
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from collections import OrderedDict
+from datetime import datetime, date, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple, Any
 from enum import Enum
 
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramAPIError
 
 from .models import User, ActionType
 from .ui import create_keyboard, create_pagination_keyboard
@@ -14,6 +18,31 @@ from .database import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+# Уровни-достижения: пороги рейтинга по возрастанию (для bisect) и их названия
+_LEVEL_THRESHOLDS = (100, 500, 1000, 5000, 10000, 50000)
+_LEVEL_NAMES = (
+    "Новичок 🥉",
+    "Активный участник 🥈",
+    "Опытный пользователь 🥇",
+    "Ветеран 👑",
+    "Легенда 💎",
+    "Бог рейтинга ⭐"
+)
+
+# Аргументы /top: слово -> период топа
+_TOP_TYPE_ALIASES = {
+    "неделя": "week", "неделю": "week", "week": "week",
+    "месяц": "month", "month": "month",
+    "день": "today", "сегодня": "today", "day": "today", "today": "today",
+    "все": "all", "всё": "all", "all": "all"
+}
+
+# Медали для первых мест в топе
+_MEDALS = ("🥇", "🥈", "🥉")
+
+# Предел ожидания одной отправки уведомления (секунды)
+_TELEGRAM_TIMEOUT = 5
+
 class RatingAction(Enum):
     """Действия, за которые начисляется рейтинг"""
     MESSAGE_SENT = 1
@@ -56,32 +85,53 @@ class RatingManager:
         
         # Кэш для быстрого доступа
         self._user_rating_cache: Dict[int, int] = {}
-        self._top_cache: Dict[str, List[Tuple[int, str, int]]] = {}
-        self._cache_timestamp: Optional[datetime] = None
-        self._cache_ttl = 300  # 5 минут
         
-        self.setup_handlers()
+        # Кэш топа: в Redis (общий для процессов) или, без Redis, в памяти процесса.
+        # Ключ rating:top:{bot_id}:{period} - хэш, поле - limit
+        self._top_cache: "OrderedDict[str, Tuple[datetime, List[Tuple[int, str, int]]]]" = OrderedDict()
+        self._top_cache_max_entries = 32  # LRU: limit приходит из разных мест, ключи множатся
+        self._top_cache_ttl = {
+            "today": 60,   # 1 минута
+            "week": 300,   # 5 минут
+            "month": 600,  # 10 минут
+            "all": 300     # 5 минут, сбрасывается при изменении рейтинга
+        }
+        self._redis = admin_system.redis
         
-    def setup_handlers(self):
-        """Настройка обработчиков"""
+        # Период -> limit -> (рейтинг последнего места, участники) для закэшированных топов:
+        # по ним решается, сбрасывать ли кэш, без чтения самих топов
+        self._top_threshold: Dict[str, Dict[int, Tuple[int, Set[int]]]] = {}
+        
+        # Пользователь -> день, за который активный день уже проверен
+        self._active_day_checked: Dict[int, date] = {}
+        
+        # Снимок статистики для админки: rating:stats:{bot_id} (в памяти, если нет Redis)
+        self._stats_cache: Optional[Tuple[datetime, Dict[str, Any]]] = None
+        self._stats_cache_ttl = 60  # секунды
         
-        # Команда /rating
-        @self.router.message(Command("rating"))
-        async def show_rating(message: Message):
-            """Показать рейтинг"""
-            await self.handle_rating_command(message)
+        # Очки за сегодня: rating:daily:{bot_id}:{user_id}:{дата} (в памяти, если нет Redis)
+        self._daily_points: Dict[str, int] = {}
         
-        # Команда /top
-        @self.router.message(Command("top"))
-        async def show_top(message: Message, command: CommandObject):
-            """Показать топ пользователей"""
-            await self.handle_top_command(message, command)
+        # Уведомления рассылаются параллельно, но не больше 20 запросов к Telegram сразу
+        self._notify_semaphore = asyncio.Semaphore(20)
         
-        # Команда /leaderboard
-        @self.router.message(Command("leaderboard"))
-        async def show_leaderboard(message: Message):
-            """Показать таблицу лидеров"""
-            await self.handle_leaderboard_command(message)
+        # Отложенная запись: начисления копятся по пользователям и пишутся пачкой
+        self._pending_deltas: Dict[int, int] = {}
+        self._pending_lock = asyncio.Lock()
+        self._flush_interval = 0.5  # секунды
+        self._flush_max_pending = 500  # пользователей в пачке до внеочередной записи
+        
+        # Фоновые задачи: ссылки держатся до завершения, иначе задачу может собрать GC
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        self.setup_handlers()
+        
+    def setup_handlers(self):
+        """Настройка обработчиков"""
+        # Обработчики - методы экземпляра, без вложенных замыканий
+        self.router.message.register(self.handle_rating_command, Command("rating"))
+        self.router.message.register(self.handle_top_command, Command("top"))
+        self.router.message.register(self.handle_leaderboard_command, Command("leaderboard"))
     
     async def handle_rating_command(self, message: Message):
         """Обработка команды /rating"""
@@ -96,29 +146,29 @@ class RatingManager:
         # Получение статистики
         stats = await self.get_user_rating_stats(user_id)
         
-        text = f"⭐ Ваш рейтинг\n\n"
-        text += f"📊 Текущий рейтинг: {rating:,} очков\n"
-        text += f"🏆 Позиция в топе: {position}\n\n"
-        
-        text += "📈 Статистика:\n"
-        text += f"• За сегодня: +{stats.get('today', 0):,}\n"
-        text += f"• За неделю: +{stats.get('week', 0):,}\n"
-        text += f"• За месяц: +{stats.get('month', 0):,}\n"
-        text += f"• Всего заработано: {stats.get('total', 0):,}\n\n"
+        parts = [
+            "⭐ Ваш рейтинг\n\n",
+            f"📊 Текущий рейтинг: {rating:,} очков\n",
+            f"🏆 Позиция в топе: {position}\n\n",
+            "📈 Статистика:\n",
+            f"• За сегодня: +{stats.get('today', 0):,}\n",
+            f"• За неделю: +{stats.get('week', 0):,}\n",
+            f"• За месяц: +{stats.get('month', 0):,}\n",
+            f"• Всего заработано: {stats.get('total', 0):,}\n\n"
+        ]
         
         # Достижения
         achievements = await self.get_user_achievements(user_id)
         if achievements:
-            text += "🏅 Достижения:\n"
-            for achievement in achievements[:3]:  # Показываем 3 достижения
-                text += f"• {achievement}\n"
+            parts.append("🏅 Достижения:\n")
+            parts.extend(f"• {achievement}\n" for achievement in achievements[:3])  # Показываем 3 достижения
         
         # Следующий уровень
         next_level = await self.get_next_level_info(rating)
         if next_level:
-            text += f"\n📊 До следующего уровня: {next_level['points_needed']:,} очков"
+            parts.append(f"\n📊 До следующего уровня: {next_level['points_needed']:,} очков")
         
-        await message.answer(text)
+        await message.answer("".join(parts))
     
     async def handle_top_command(self, message: Message, command: CommandObject):
         """Обработка команды /top"""
@@ -126,15 +176,10 @@ class RatingManager:
         top_type = "rating"  # По умолчанию по рейтингу
         
         if command.args:
-            args = command.args.lower()
-            if "неделя" in args or "week" in args:
-                top_type = "week"
-            elif "месяц" in args or "month" in args:
-                top_type = "month"
-            elif "день" in args or "day" in args or "сегодня" in args:
-                top_type = "today"
-            elif "все" in args or "all" in args:
-                top_type = "all"
+            top_type = next(
+                (_TOP_TYPE_ALIASES[token] for token in command.args.lower().split() if token in _TOP_TYPE_ALIASES),
+                top_type
+            )
         
         # Получение топа
         top = await self.get_top_users(top_type, limit=10)
@@ -152,23 +197,27 @@ class RatingManager:
             "all": "🏆 Общий топ"
         }.get(top_type, "🏆 Топ")
         
-        text = f"{top_type_text}\n\n"
-        
-        for i, (user_id, user_name, points) in enumerate(top, 1):
-            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            text += f"{medal} {user_name} - {points:,} очков\n"
+        parts = [f"{top_type_text}\n\n"]
+        parts.extend(
+            f"{_MEDALS[i - 1] if i <= len(_MEDALS) else f'{i}.'} {user_name} - {points:,} очков\n"
+            for i, (_, user_name, points) in enumerate(top, 1)
+        )
         
         # Добавление позиции текущего пользователя
         if message.chat.type == "private":
             user_id = message.from_user.id
-            position = await self.get_user_position(user_id, top_type)
-            user_rating = await self.get_user_rating(user_id, top_type)
+            # Для периода место и очки берутся из одной агрегации, для общего топа - из рейтинга
+            period_rank = await self._get_period_rank(user_id, top_type)
+            if period_rank:
+                position, user_rating = period_rank
+            else:
+                position = await self.get_user_position(user_id)
+                user_rating = await self.get_user_rating(user_id)
             
             if position > 10:  # Если не в топ-10
-                text += f"\n...\n"
-                text += f"{position}. Вы - {user_rating:,} очков"
+                parts.append(f"\n...\n{position}. Вы - {user_rating:,} очков")
         
-        await message.answer(text)
+        await message.answer("".join(parts))
     
     async def handle_leaderboard_command(self, message: Message):
         """Обработка команды /leaderboard"""
@@ -190,76 +239,67 @@ class RatingManager:
         await message.answer(text, reply_markup=keyboard)
     
     async def add_rating_points(self, user_id: int, action: RatingAction, amount: Optional[int] = None, 
-                               details: Optional[Dict] = None) -> int:
-        """Добавить очки рейтинга пользователю"""
+                               details: Optional[Dict] = None, now: Optional[datetime] = None) -> int:
+        """Добавить очки рейтинга пользователю (now - момент события, локальное время)"""
         if not self.settings["enabled"]:
             return 0
         
-        # Получение текущего рейтинга
-        current_rating = await self.get_user_rating(user_id)
+        now = now or datetime.now()
         
-        # Определение количества очков
+        # Определение количества очков (текущий рейтинг нужен только после проверок)
         if amount is None:
             amount = self.settings["points"].get(action.value, 0)
         
         if amount <= 0:
-            return current_rating
+            return await self.get_user_rating(user_id)
         
         # Проверка дневного лимита
-        daily_points = await self.get_user_daily_points(user_id)
+        daily_points = await self.get_user_daily_points(user_id, now)
         if daily_points + amount > self.settings["daily_limit"]:
             amount = max(0, self.settings["daily_limit"] - daily_points)
         
         if amount <= 0:
-            return current_rating
-        
-        # Обновление рейтинга в БД
-        db = DatabaseManager.get_instance()
-        
-        # Получение пользователя
-        user = await db.get_user(user_id)
-        if not user:
-            # Создание записи пользователя
-            from .models import UserStatus
-            user = User(
-                user_id=user_id,
-                first_name="Пользователь",
-                status=UserStatus.ACTIVE
-            )
-            await db.add_user(user)
+            return await self.get_user_rating(user_id)
         
-        # Обновление рейтинга
-        user.rating += amount
-        await db.update_user(user)
+        await self._add_daily_points(user_id, amount, now)
         
-        # Обновление кэша
-        self._user_rating_cache[user_id] = user.rating
-        self._top_cache.clear()  # Сбрасываем кэш топа
-        
-        # Логирование действия
-        security = self.admin_system.security
-        await security.log_action(
+        # Изменение копится в памяти и пишется в БД пачкой (flush_pending).
+        # При попадании в кэш get_user_rating не уступает управление, чтение и запись атомарны
+        current_rating = await self.get_user_rating(user_id)
+        new_rating = current_rating + amount
+        self._pending_deltas[user_id] = self._pending_deltas.get(user_id, 0) + amount
+        self.admin_system.security.log_action_buffered(
             user_id=user_id,
-            action_type=8,  # COMMAND_USED
+            action_type=ActionType(8),  # COMMAND_USED
             action_data={
                 "action": "rating_added",
                 "rating_action": action.value,
                 "amount": amount,
-                "new_rating": user.rating,
+                "new_rating": new_rating,
                 "details": details
             }
         )
         
+        # Обновление кэша
+        self._user_rating_cache[user_id] = new_rating
+        await self._invalidate_top_cache(user_id, new_rating)  # Топ за периоды живет по TTL
+        
+        if len(self._pending_deltas) >= self._flush_max_pending:
+            self._spawn(self.flush_pending())
+        
         # Проверка достижений
-        await self.check_achievements(user_id, user.rating)
+        await self.check_achievements(user_id, new_rating)
         
-        return user.rating
+        return new_rating
     
     async def remove_rating_points(self, user_id: int, amount: int, reason: str = "") -> int:
         """Удалить очки рейтинга у пользователя"""
         if amount <= 0:
             return await self.get_user_rating(user_id)
         
+        # Сначала дописываем накопленные начисления, чтобы не перезаписать их
+        await self.flush_pending()
+        
         db = DatabaseManager.get_instance()
         
         # Получение пользователя
@@ -273,14 +313,13 @@ class RatingManager:
         
         # Обновление кэша
         self._user_rating_cache[user_id] = user.rating
-        self._top_cache.clear()
+        await self._invalidate_top_cache(user_id, user.rating)
         
         # Логирование
         if reason:
-            security = self.admin_system.security
-            await security.log_action(
+            self.admin_system.security.log_action_buffered(
                 user_id=user_id,
-                action_type=8,  # COMMAND_USED
+                action_type=ActionType(8),  # COMMAND_USED
                 action_data={
                     "action": "rating_removed",
                     "amount": amount,
@@ -300,9 +339,11 @@ class RatingManager:
         db = DatabaseManager.get_instance()
         
         if period == "all":
-            # Общий рейтинг
-            user = await db.get_user(user_id)
-            rating = user.rating if user else 0
+            # Общий рейтинг. Чтение под тем же замком, что и flush_pending: пока пачка пишется,
+            # ее изменений уже нет в _pending_deltas, а в БД они еще могут быть не видны
+            async with self._pending_lock:
+                user = await db.get_user(user_id)
+                rating = (user.rating if user else 0) + self._pending_deltas.get(user_id, 0)
             
             # Обновление кэша
             self._user_rating_cache[user_id] = rating
@@ -310,24 +351,71 @@ class RatingManager:
             return rating
         
         else:
-            # Рейтинг за период
-            start_date = self._get_period_start(period)
-            if not start_date:
-                return 0
+            # Рейтинг за период: сумма начислений из логов
+            period_rank = await self._get_period_rank(user_id, period)
+            return period_rank[1] if period_rank else 0
+    
+    async def flush_pending(self):
+        """Записать накопленные изменения рейтинга одной пачкой (логи пишет буфер security)"""
+        async with self._pending_lock:
+            if not self._pending_deltas:
+                return
             
-            # Здесь нужно получить рейтинг за период из статистики
-            # Для простоты возвращаем 0
-            return 0
+            deltas, self._pending_deltas = self._pending_deltas, {}
+            
+            db = DatabaseManager.get_instance()
+            if not await db.apply_rating_deltas(list(deltas.items())):
+                # Не записалось - возвращаем изменения в очередь до следующей попытки
+                for user_id, delta in deltas.items():
+                    self._pending_deltas[user_id] = self._pending_deltas.get(user_id, 0) + delta
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Запустить корутину в фоне с удержанием ссылки и логированием ошибок"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+        return task
+    
+    def _on_background_task_done(self, task: asyncio.Task):
+        """Убрать завершенную задачу из набора и записать ошибку в лог"""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Ошибка в фоновой задаче рейтинга: {task.exception()!r}")
+    
+    async def flush_loop(self):
+        """Фоновая задача: сброс накопленных изменений рейтинга каждые _flush_interval секунд"""
+        while True:
+            try:
+                await self.flush_pending()
+            except Exception as e:
+                logger.error(f"Ошибка при записи изменений рейтинга: {e}")
+            
+            await asyncio.sleep(self._flush_interval)
     
     async def get_user_position(self, user_id: int, period: str = "all") -> int:
         """Получить позицию пользователя в топе"""
-        top = await self.get_top_users(period, limit=1000)
+        period_rank = await self._get_period_rank(user_id, period)
+        if period_rank:
+            return period_rank[0]
         
-        for i, (top_user_id, _, _) in enumerate(top, 1):
-            if top_user_id == user_id:
-                return i
+        # Общий топ (и периоды без начала, как в get_top_users) - по рейтингу
+        rating = await self.get_user_rating(user_id)
         
-        return len(top) + 1
+        db = DatabaseManager.get_instance()
+        return await db.get_rank_by_rating(rating)
+    
+    async def _get_period_rank(self, user_id: int, period: str) -> Optional[Tuple[int, int]]:
+        """Место и очки пользователя за период или None, если у периода нет начала"""
+        start_date = self._get_period_start(period)
+        if not start_date:
+            return None
+        
+        # Как в get_top_users: начисления за последние _flush_interval секунд еще в памяти
+        await self.flush_pending()
+        await self.admin_system.security.flush_action_logs()
+        
+        db = DatabaseManager.get_instance()
+        return await db.get_period_rank(user_id, start_date, action_type=8)  # COMMAND_USED
     
     async def get_user_rating_stats(self, user_id: int) -> Dict[str, int]:
         """Получить статистику рейтинга пользователя"""
@@ -340,96 +428,233 @@ class RatingManager:
             "total": await self.get_user_rating(user_id)
         }
     
-    async def get_user_daily_points(self, user_id: int) -> int:
+    async def get_user_daily_points(self, user_id: int, now: Optional[datetime] = None) -> int:
         """Получить количество очков, заработанных сегодня"""
-        # Здесь нужно посчитать очки за сегодня из логов
-        # Для примеры возвращаем 0
-        return 0
+        key = self._daily_points_key(user_id, now)
+        
+        if self._redis:
+            try:
+                value = await self._redis.get(key)
+            except Exception as e:
+                logger.warning(f"Ошибка чтения дневных очков из Redis: {e}")
+                return 0
+            return int(value) if value else 0
+        
+        return self._daily_points.get(key, 0)
+    
+    def _daily_points_key(self, user_id: int, now: Optional[datetime] = None) -> str:
+        """Ключ счетчика очков пользователя за день"""
+        day = (now or datetime.now()).date()
+        return f"rating:daily:{self.admin_system.config.bot_id}:{user_id}:{day.isoformat()}"
+    
+    async def _add_daily_points(self, user_id: int, amount: int, now: Optional[datetime] = None):
+        """Увеличить счетчик дневных очков (в Redis ключ истекает в полночь)"""
+        now = now or datetime.now()
+        key = self._daily_points_key(user_id, now)
+        
+        if self._redis:
+            midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.incrby(key, amount)
+                    pipe.expireat(key, midnight)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Ошибка записи дневных очков в Redis: {e}")
+            return
+        
+        self._daily_points[key] = self._daily_points.get(key, 0) + amount
     
     async def get_top_users(self, period: str = "all", limit: int = 10) -> List[Tuple[int, str, int]]:
         """Получить топ пользователей"""
-        cache_key = f"{period}_{limit}"
-        
         # Проверка кэша
-        if cache_key in self._top_cache:
-            return self._top_cache[cache_key]
+        top = await self._get_cached_top(period, limit)
+        if top is not None:
+            return top
         
         db = DatabaseManager.get_instance()
         
         if period == "all":
-            # Общий топ по рейтингу
-            users, _ = await db.get_users(
-                limit=limit,
-                order_by="rating DESC"
-            )
+            # Топ должен учитывать еще не записанные начисления: по нему решается, сбрасывать ли кэш
+            await self.flush_pending()
             
-            top = []
-            for user in users:
-                top.append((user.user_id, user.full_name, user.rating))
+            # Общий топ по рейтингу: только нужные столбцы и без подсчета всех пользователей
+            top = [
+                (user_id, f"{first_name} {last_name}" if last_name else first_name, rating)
+                for user_id, first_name, last_name, rating in await db.get_top_by_rating(limit)
+            ]
             
             # Кэширование
-            self._top_cache[cache_key] = top
+            await self._set_cached_top(period, limit, top)
             
             return top
         
         else:
-            # Топ за период
-            # Здесь нужно реализовать подсчет за период
-            # Для простоты возвращаем общий топ
-            return await self.get_top_users("all", limit)
+            # Топ за период: сумма начислений из логов, агрегирует SQLite
+            start_date = self._get_period_start(period)
+            if not start_date:
+                return await self.get_top_users("all", limit)
+            
+            # Начисления за последние _flush_interval секунд еще в памяти
+            await self.flush_pending()
+            await self.admin_system.security.flush_action_logs()
+            
+            period_top = await db.get_period_top(
+                start_date,
+                action_type=8,  # COMMAND_USED
+                limit=limit
+            )
+            top = [(user.user_id, user.full_name, points) for user, points in period_top]
+            
+            # Кэширование
+            await self._set_cached_top(period, limit, top)
+            
+            return top
+    
+    def _top_cache_key(self, period: str) -> str:
+        """Ключ кэша топа за период"""
+        return f"rating:top:{self.admin_system.config.bot_id}:{period}"
+    
+    async def _get_cached_top(self, period: str, limit: int) -> Optional[List[Tuple[int, str, int]]]:
+        """Топ из кэша или None"""
+        key = self._top_cache_key(period)
+        
+        if self._redis:
+            try:
+                cached = await self._redis.hget(key, str(limit))
+            except Exception as e:
+                logger.warning(f"Ошибка чтения кэша топа из Redis: {e}")
+                return None
+            if not cached:
+                return None
+            top = [tuple(entry) for entry in json.loads(cached)]
+            # Топ мог положить другой процесс - запоминаем его порог и здесь
+            self._remember_top_threshold(period, limit, top)
+            return top
+        
+        cache_key = f"{key}:{limit}"
+        entry = self._top_cache.get(cache_key)
+        if not entry:
+            return None
+        
+        if entry[0] <= datetime.now():
+            del self._top_cache[cache_key]
+            return None
+        
+        self._top_cache.move_to_end(cache_key)
+        return entry[1]
+    
+    async def _set_cached_top(self, period: str, limit: int, top: List[Tuple[int, str, int]]):
+        """Сохранить топ в кэш с TTL периода"""
+        key = self._top_cache_key(period)
+        ttl = self._top_cache_ttl.get(period, 300)
+        self._remember_top_threshold(period, limit, top)
+        
+        if self._redis:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(key, str(limit), json.dumps(top, ensure_ascii=False))
+                    pipe.pttl(key)
+                    _, key_ttl = await pipe.execute()
+                # TTL ставится только при первом заполнении: новые limit не продлевают старые
+                # (PTTL -1 вместо PEXPIRE NX, который есть только с Redis 7)
+                if key_ttl < 0:
+                    await self._redis.pexpire(key, ttl * 1000)
+            except Exception as e:
+                logger.warning(f"Ошибка записи кэша топа в Redis: {e}")
+            return
+        
+        cache_key = f"{key}:{limit}"
+        self._top_cache[cache_key] = (datetime.now() + timedelta(seconds=ttl), top)
+        self._top_cache.move_to_end(cache_key)
+        while len(self._top_cache) > self._top_cache_max_entries:
+            self._top_cache.popitem(last=False)
+    
+    def _remember_top_threshold(self, period: str, limit: int, top: List[Tuple[int, str, int]]):
+        """Запомнить порог входа в топ: рейтинг последнего места (0, если топ короче limit)"""
+        threshold = top[-1][2] if len(top) >= limit else 0
+        self._top_threshold.setdefault(period, {})[limit] = (threshold, {entry[0] for entry in top})
+    
+    def _top_affected(self, period: str, user_id: int, new_rating: int) -> bool:
+        """Может ли новый рейтинг пользователя изменить хотя бы один из закэшированных топов"""
+        for threshold, members in self._top_threshold.get(period, {}).values():
+            if new_rating >= threshold or user_id in members:
+                return True
+        return False
+    
+    async def _invalidate_top_cache(self, user_id: Optional[int] = None, new_rating: Optional[int] = None):
+        """Сбросить общий топ (все limit) после изменения рейтинга.
+        
+        Если известны пользователь и его новый рейтинг, топ сбрасывается, только когда
+        изменение может его затронуть: пользователь уже в топе, догнал последнее место
+        или топ короче своего limit. Сравнение идет с порогами в памяти, без запросов к Redis;
+        топ, который этот процесс не читал, доживает до своего TTL.
+        """
+        if user_id is not None and not self._top_affected("all", user_id, new_rating):
+            return
+        
+        self._top_threshold.pop("all", None)
+        key = self._top_cache_key("all")
+        
+        if self._redis:
+            try:
+                await self._redis.delete(key)
+            except Exception as e:
+                logger.warning(f"Ошибка сброса кэша топа в Redis: {e}")
+            return
+        
+        for cache_key in [k for k in self._top_cache if k.startswith(f"{key}:")]:
+            del self._top_cache[cache_key]
     
     async def check_achievements(self, user_id: int, current_rating: int):
         """Проверить достижения пользователя"""
-        achievements = []
-        
-        # Проверка уровней
-        levels = [
-            (100, "Новичок 🥉"),
-            (500, "Активный участник 🥈"),
-            (1000, "Опытный пользователь 🥇"),
-            (5000, "Ветеран 👑"),
-            (10000, "Легенда 💎"),
-            (50000, "Бог рейтинга ⭐")
-        ]
+        # Все уровни не выше текущего рейтинга
+        eligible = list(_LEVEL_NAMES[:bisect.bisect_right(_LEVEL_THRESHOLDS, current_rating)])
+        if not eligible:
+            return
         
-        for required_rating, achievement_name in levels:
-            if current_rating >= required_rating:
-                # Проверяем, было ли уже это достижение
-                if not await self.has_achievement(user_id, achievement_name):
-                    achievements.append(achievement_name)
-                    await self.grant_achievement(user_id, achievement_name)
+        # Один запрос на уже выданные и одна вставка новых
+        db = DatabaseManager.get_instance()
+        held = await db.get_achievements(user_id, eligible)
+        achievements = [name for name in eligible if name not in held]
         
         # Уведомление о новых достижениях
-        if achievements:
-            await self.notify_about_achievements(user_id, achievements)
+        # (в фоне: обработчик не ждет ответа Telegram, отправки идут параллельно под семафором)
+        if achievements and await db.grant_achievements(user_id, achievements):
+            self._spawn(self.notify_about_achievements(user_id, achievements))
     
     async def has_achievement(self, user_id: int, achievement_name: str) -> bool:
         """Проверить, есть ли у пользователя достижение"""
-        # Здесь нужно проверять в БД
-        # Для простоты возвращаем False
-        return False
+        db = DatabaseManager.get_instance()
+        return achievement_name in await db.get_achievements(user_id, [achievement_name])
     
     async def grant_achievement(self, user_id: int, achievement_name: str):
         """Выдать достижение пользователю"""
-        # Здесь нужно сохранять в БД
-        pass
+        db = DatabaseManager.get_instance()
+        await db.grant_achievements(user_id, [achievement_name])
     
     async def notify_about_achievements(self, user_id: int, achievements: List[str]):
         """Уведомить о новых достижениях"""
-        try:
-            text = "🏆 Новые достижения!\n\n"
-            
-            for achievement in achievements:
-                text += f"• {achievement}\n"
-            
-            text += "\nПоздравляем! 🎉"
-            
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=text
-            )
-        except:
-            pass  # Пользователь может быть недоступен
+        parts = ["🏆 Новые достижения!\n\n"]
+        parts.extend(f"• {achievement}\n" for achievement in achievements)
+        parts.append("\nПоздравляем! 🎉")
+        
+        await self._send_notification(user_id, "".join(parts))
+    
+    async def _send_notification(self, user_id: int, text: str):
+        """Отправка с ограничением числа одновременных запросов к Telegram"""
+        async with self._notify_semaphore:
+            try:
+                await asyncio.wait_for(
+                    self.bot.send_message(
+                        chat_id=user_id,
+                        text=text
+                    ),
+                    timeout=_TELEGRAM_TIMEOUT
+                )
+            except (TelegramAPIError, asyncio.TimeoutError) as e:
+                # Пользователь может быть недоступен (заблокировал бота и т.п.)
+                logger.warning(f"Не удалось отправить уведомление о рейтинге пользователю {user_id}: {e}")
     
     async def get_user_achievements(self, user_id: int) -> List[str]:
         """Получить достижения пользователя"""
@@ -437,42 +662,23 @@ class RatingManager:
         # Для примера возвращаем фиктивные данные
         rating = await self.get_user_rating(user_id)
         
-        achievements = []
-        if rating >= 100:
-            achievements.append("Новичок 🥉")
-        if rating >= 500:
-            achievements.append("Активный участник 🥈")
-        if rating >= 1000:
-            achievements.append("Опытный пользователь 🥇")
-        if rating >= 5000:
-            achievements.append("Ветеран 👑")
-        
-        return achievements
+        return list(_LEVEL_NAMES[:bisect.bisect_right(_LEVEL_THRESHOLDS, rating)])
     
     async def get_next_level_info(self, current_rating: int) -> Optional[Dict[str, Any]]:
         """Получить информацию о следующем уровне"""
-        levels = [
-            (100, "Новичок 🥉"),
-            (500, "Активный участник 🥈"),
-            (1000, "Опытный пользователь 🥇"),
-            (5000, "Ветеран 👑"),
-            (10000, "Легенда 💎"),
-            (50000, "Бог рейтинга ⭐")
-        ]
-        
-        for required_rating, level_name in levels:
-            if current_rating < required_rating:
-                return {
-                    "level_name": level_name,
-                    "required_rating": required_rating,
-                    "points_needed": required_rating - current_rating
-                }
+        i = bisect.bisect_right(_LEVEL_THRESHOLDS, current_rating)
+        if i == len(_LEVEL_THRESHOLDS):
+            return None
         
-        return None
+        return {
+            "level_name": _LEVEL_NAMES[i],
+            "required_rating": _LEVEL_THRESHOLDS[i],
+            "points_needed": _LEVEL_THRESHOLDS[i] - current_rating
+        }
     
-    def _get_period_start(self, period: str) -> Optional[datetime]:
+    def _get_period_start(self, period: str, now: Optional[datetime] = None) -> Optional[datetime]:
         """Получить дату начала периода"""
-        now = datetime.now()
+        now = now or datetime.now()
         
         if period == "today":
             return now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -491,6 +697,7 @@ class RatingManager:
             return
         
         user_id = message.from_user.id
+        now = datetime.now()  # Один раз на сообщение, дальше передается вниз
         
         # Начисление очков за сообщение
         await self.add_rating_points(
@@ -500,14 +707,22 @@ class RatingManager:
                 "chat_id": message.chat.id,
                 "message_id": message.message_id,
                 "text_length": len(message.text or "")
-            }
+            },
+            now=now
         )
         
         # Проверка активного дня
-        await self.check_active_day(user_id)
+        await self.check_active_day(user_id, now)
     
-    async def check_active_day(self, user_id: int):
+    async def check_active_day(self, user_id: int, now: Optional[datetime] = None):
         """Проверить и начислить очки за активный день"""
+        now = now or datetime.now()
+        today = now.date()
+        
+        # Сегодня уже проверяли - БД не нужна (на каждое сообщение, кроме первого за день)
+        if self._active_day_checked.get(user_id) == today:
+            return
+        
         db = DatabaseManager.get_instance()
         
         # Получение последней активности
@@ -515,8 +730,9 @@ class RatingManager:
         if not user:
             return
         
+        self._active_day_checked[user_id] = today
+        
         # Проверяем, был ли сегодня уже начислен бонус за активность
-        today = datetime.now().date()
         last_activity_date = user.last_activity.date()
         
         if last_activity_date < today:
@@ -524,7 +740,8 @@ class RatingManager:
             await self.add_rating_points(
                 user_id=user_id,
                 action=RatingAction.ACTIVE_DAY,
-                details={"date": today.isoformat()}
+                details={"date": today.isoformat()},
+                now=now
             )
     
     async def process_poll_participation(self, user_id: int, poll_id: int):
@@ -562,34 +779,29 @@ class RatingManager:
         if not self.settings["decay_enabled"]:
             return
         
+        # Накопленные начисления пишутся до снижения: MAX(0, ...) считается от актуального рейтинга
+        await self.flush_pending()
+        
         db = DatabaseManager.get_instance()
         
-        # Получение неактивных пользователей
+        # Один UPDATE вместо выборки и обновления каждого пользователя
         cutoff_date = datetime.now() - timedelta(days=self.settings["decay_days"])
+        decayed = await db.bulk_decay_rating(cutoff_date, self.settings["decay_amount"])
         
-        users, _ = await db.get_users(
-            filters={"max_last_activity": cutoff_date},
-            limit=1000
-        )
-        
-        for user in users:
-            # Снижение рейтинга
-            user.rating = max(0, user.rating - self.settings["decay_amount"])
-            await db.update_user(user)
-            
-            # Обновление кэша
-            self._user_rating_cache[user.user_id] = user.rating
+        # Кэш рейтингов сбрасывается целиком: какие именно строки изменились, неизвестно
+        self._user_rating_cache.clear()
+        await self._invalidate_top_cache()
         
-        # Сброс кэша топа
-        self._top_cache.clear()
-        
-        logger.info(f"Применено снижение рейтинга для {len(users)} неактивных пользователей")
+        logger.info(f"Применено снижение рейтинга для {decayed} неактивных пользователей")
     
     async def reset_daily_limits(self):
         """Сбросить дневные лимиты"""
-        # Здесь нужно сбрасывать счетчики дневных очков
-        # В реальной системе это должно быть в БД
-        pass
+        self._active_day_checked.clear()
+        
+        # В Redis счетчики истекают сами; в памяти удаляем все, кроме сегодняшних
+        today_suffix = f":{datetime.now().date().isoformat()}"
+        for key in [k for k in self._daily_points if not k.endswith(today_suffix)]:
+            del self._daily_points[key]
     
     async def award_weekly_bonuses(self):
         """Начислить недельные бонусы"""
@@ -599,16 +811,12 @@ class RatingManager:
         # Находим топ пользователей за неделю
         top_users = await self.get_top_users("week", limit=10)
         
-        for i, (user_id, _, points) in enumerate(top_users):
-            bonus = self.settings["weekly_bonus"] // (i + 1)  # Уменьшаем бонус для нижних мест
-            
-            if bonus > 0:
-                await self.add_rating_points(
-                    user_id=user_id,
-                    action=RatingAction.ACTIVE_DAY,  # Используем существующее действие
-                    amount=bonus,
-                    details={"weekly_rank": i + 1, "weekly_points": points}
-                )
+        # Уменьшаем бонус для нижних мест
+        await self._award_bonuses([
+            (user_id, bonus, {"weekly_rank": i + 1, "weekly_points": points})
+            for i, (user_id, _, points) in enumerate(top_users)
+            if (bonus := self.settings["weekly_bonus"] // (i + 1)) > 0
+        ])
     
     async def award_monthly_bonuses(self):
         """Начислить месячные бонусы"""
@@ -618,34 +826,57 @@ class RatingManager:
         # Находим топ пользователей за месяц
         top_users = await self.get_top_users("month", limit=20)
         
-        for i, (user_id, _, points) in enumerate(top_users):
-            bonus = self.settings["monthly_bonus"] // (i // 2 + 1)  # Уменьшаем бонус
-            
-            if bonus > 0:
-                await self.add_rating_points(
-                    user_id=user_id,
-                    action=RatingAction.ACTIVE_DAY,  # Используем существующее действие
-                    amount=bonus,
-                    details={"monthly_rank": i + 1, "monthly_points": points}
-                )
+        # Уменьшаем бонус
+        await self._award_bonuses([
+            (user_id, bonus, {"monthly_rank": i + 1, "monthly_points": points})
+            for i, (user_id, _, points) in enumerate(top_users)
+            if (bonus := self.settings["monthly_bonus"] // (i // 2 + 1)) > 0
+        ])
+    
+    async def _award_bonuses(self, bonuses: List[Tuple[int, int, Dict]]):
+        """Начислить бонусы победителям параллельно и записать их одной пачкой"""
+        await asyncio.gather(*(
+            self.add_rating_points(
+                user_id=user_id,
+                action=RatingAction.ACTIVE_DAY,  # Используем существующее действие
+                amount=bonus,
+                details=details
+            )
+            for user_id, bonus, details in bonuses
+        ))
+        
+        # Все начисления уже в _pending_deltas: одна транзакция UPDATE + одна вставка логов
+        await self.flush_pending()
     
     async def get_rating_stats(self) -> Dict[str, Any]:
-        """Получить статистику системы рейтинга"""
-        db = DatabaseManager.get_instance()
-        
-        # Общая статистика
-        users, total_users = await db.get_users(limit=1)
-        
-        # Средний рейтинг
-        cursor = await db.connection.execute(
-            f"SELECT AVG(rating) as avg_rating FROM {db.get_table_name('users')} WHERE bot_id = ?",
-            (self.admin_system.config.bot_id,)
-        )
-        
-        row = await cursor.fetchone()
-        await cursor.close()
+        """Получить статистику системы рейтинга (снимок кэшируется на _stats_cache_ttl секунд)"""
+        key = f"rating:stats:{self.admin_system.config.bot_id}"
+        
+        if self._redis:
+            try:
+                cached = await self._redis.get(key)
+                if cached:
+                    return json.loads(cached)
+            except Exception as e:
+                logger.warning(f"Ошибка чтения статистики рейтинга из Redis: {e}")
+        elif self._stats_cache and self._stats_cache[0] > datetime.now():
+            return self._stats_cache[1]
+        
+        stats = await self._compute_rating_stats()
+        
+        if self._redis:
+            try:
+                await self._redis.set(key, json.dumps(stats, ensure_ascii=False), ex=self._stats_cache_ttl)
+            except Exception as e:
+                logger.warning(f"Ошибка записи статистики рейтинга в Redis: {e}")
+        else:
+            self._stats_cache = (datetime.now() + timedelta(seconds=self._stats_cache_ttl), stats)
         
-        avg_rating = row["avg_rating"] if row and row["avg_rating"] else 0
+        return stats
+    
+    async def _compute_rating_stats(self) -> Dict[str, Any]:
+        """Посчитать статистику системы рейтинга по БД"""
+        db = DatabaseManager.get_instance()
         
         # Распределение по уровням
         levels = [
@@ -657,36 +888,30 @@ class RatingManager:
             (10000, 999999999, "Легенды")
         ]
         
-        distribution = {}
-        for min_rating, max_rating, level_name in levels:
-            cursor = await db.connection.execute(
-                f"""
-                SELECT COUNT(*) as count 
-                FROM {db.get_table_name('users')} 
-                WHERE rating BETWEEN ? AND ? AND bot_id = ?
-                """,
-                (min_rating, max_rating, self.admin_system.config.bot_id)
-            )
-            
-            row = await cursor.fetchone()
-            await cursor.close()
-            
-            distribution[level_name] = row["count"] if row else 0
-        
-        # Топ донатеров (премиум пользователей)
-        cursor = await db.connection.execute(
+        # Все агрегаты одним проходом по таблице: по столбцу-счетчику на каждый уровень
+        level_columns = ",\n".join(
+            f"SUM(CASE WHEN rating BETWEEN {min_rating} AND {max_rating} THEN 1 ELSE 0 END) AS level_{i}"
+            for i, (min_rating, max_rating, _) in enumerate(levels)
+        )
+        row = await db.execute_fetchone(
             f"""
-            SELECT COUNT(*) as premium_count 
-            FROM {db.get_table_name('users')} 
-            WHERE is_premium = 1 AND bot_id = ?
+            SELECT COUNT(*) AS total_users,
+                   AVG(rating) AS avg_rating,
+                   SUM(CASE WHEN is_premium = 1 THEN 1 ELSE 0 END) AS premium_count,
+                   {level_columns}
+            FROM {db.get_table_name('users')}
+            WHERE bot_id = ?
             """,
             (self.admin_system.config.bot_id,)
         )
         
-        row = await cursor.fetchone()
-        await cursor.close()
-        
-        premium_count = row["premium_count"] if row else 0
+        total_users = row["total_users"] if row else 0
+        avg_rating = row["avg_rating"] if row and row["avg_rating"] else 0
+        premium_count = (row["premium_count"] or 0) if row else 0
+        distribution = {
+            level_name: (row[f"level_{i}"] or 0) if row else 0
+            for i, (_, _, level_name) in enumerate(levels)
+        }
         
         return {
             "total_users": total_users,
@@ -1,21 +1,38 @@
 import asyncio
 import logging
+import re
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Mapping, Optional, Tuple, Any
 from enum import Enum
+from types import MappingProxyType
 
+import aiosqlite
 from aiogram import Bot, F
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from .database import DatabaseManager
 from .models import User, Chat, ActionType, ReportType
 from .ui import create_keyboard, create_pagination_keyboard
 from .security import require_admin, require_chat_admin
 
 logger = logging.getLogger(__name__)
 
+# Предел ожидания одного вызова Bot API на пути пользователя (секунды)
+_TELEGRAM_TIMEOUT = 5
+
+# Лимиты Telegram на исходящие сообщения: (сообщений, окно в секундах)
+_GLOBAL_SEND_LIMIT = (30, 1)
+_CHAT_SEND_LIMIT = (20, 60)
+
+# Номер жалобы в тексте уведомления бота
+_REPORT_ID_RE = re.compile(r'ID жалобы:\s*(\d+)')
+
 class ReportStatus(Enum):
     """Статусы жалоб"""
     PENDING = "pending"
@@ -38,6 +55,41 @@ class ReportStates(StatesGroup):
     waiting_for_report_type = State()
     waiting_for_report_reason = State()
 
+# Неизменяемые справочники, собираются один раз при импорте
+_REPORT_TYPE_TEXT: Mapping[int, str] = MappingProxyType({
+    ReportType.SPAM.value: "📨 Спам",
+    ReportType.ABUSE.value: "😠 Оскорбление",
+    ReportType.SCAM.value: "🎭 Мошенничество",
+    ReportType.PORNOGRAPHY.value: "🔞 Непристойный контент",
+    ReportType.VIOLENCE.value: "⚡ Насилие/угрозы",
+    ReportType.OTHER.value: "❓ Другое"
+})
+
+_REPORT_TYPE_ENUM: Mapping[str, ReportType] = MappingProxyType({
+    "spam": ReportType.SPAM,
+    "abuse": ReportType.ABUSE,
+    "scam": ReportType.SCAM,
+    "pornography": ReportType.PORNOGRAPHY,
+    "violence": ReportType.VIOLENCE,
+    "other": ReportType.OTHER
+})
+
+# Раскладка кнопок уведомления о жалобе: (текст, шаблон callback_data)
+_REPORT_ACTION_ROWS = (
+    (("🗑️ Удалить", "report_action_delete:{rid}"), ("⚠️ Предупредить", "report_action_warn:{rid}")),
+    (("🔇 Мут", "report_action_mute:{rid}"), ("🚫 Бан", "report_action_ban:{rid}")),
+    (("✅ Решено", "report_action_resolved:{rid}"), ("❌ Игнорировать", "report_action_ignore:{rid}")),
+    (("📋 Подробнее", "report_details:{rid}"),),
+)
+
+_STATUS_TEXT: Mapping[str, str] = MappingProxyType({
+    ReportStatus.PENDING.value: "⏳ Ожидающие",
+    ReportStatus.IN_PROGRESS.value: "🔄 В работе",
+    ReportStatus.RESOLVED.value: "✅ Решенные",
+    ReportStatus.REJECTED.value: "❌ Отклоненные",
+    ReportStatus.DUPLICATE.value: "📋 Дубликаты"
+})
+
 class ReportsManager:
     """Менеджер системы жалоб"""
     
@@ -45,9 +97,45 @@ class ReportsManager:
         self.admin_system = admin_system
         self.bot = admin_system.bot
         
-        # Кэш для частых операций
-        self._reports_cache: Dict[int, Dict] = {}
+        self.redis = admin_system.redis
+        
+        # Кэш для частых операций: LRU с TTL, report_id -> (time.monotonic() записи, жалоба).
+        # Без границ кэш рос бы на каждую жалобу за всё время работы бота
+        self._reports_cache: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
         self._user_reports_cache: Dict[int, List] = {}
+        self._reports_cache_max_size = 5000
+        self._reports_cache_ttl = 600  # 10 минут
+        
+        # TTL-кэш справочных данных: (time.monotonic() записи, значение).
+        # Названия чатов, имена участников и список админов меняются редко,
+        # а запросы к Bot API на каждую жалобу - самая медленная часть уведомления
+        self._chat_title_cache: Dict[int, Tuple[float, str]] = {}
+        self._member_name_cache: Dict[Tuple[int, int], Tuple[float, str]] = {}
+        self._admins_cache: Optional[Tuple[float, List]] = None
+        self._chat_cache_ttl = 300  # 5 минут
+        self._admins_cache_ttl = 60  # 1 минута
+        
+        # Уведомления админам: параллельно, но в рамках лимитов Telegram
+        self._notify_semaphore = asyncio.Semaphore(20)
+        
+        # Количество жалоб по статусу для списка: status -> (time.monotonic(), total)
+        self._count_cache: Dict[str, Tuple[float, int]] = {}
+        self._count_cache_ttl = 30
+        
+        # Уведомления о мерах по жалобам (chat_id, текст): отправляет один
+        # notification_sender_task в рамках лимитов Telegram, без 429 и пауз у модераторов
+        self._notification_queue: asyncio.Queue = asyncio.Queue()
+        self._global_send_times: deque = deque()
+        self._chat_send_times: Dict[int, deque] = {}
+        
+        # Окно, в котором повторная жалоба считается дубликатом
+        self._duplicate_window_minutes = 5
+        
+        # Микропакетная вставка жалоб: (строка, future с id жалобы).
+        # При всплеске жалоб один commit приходится на пачку, а не на каждую
+        self._insert_queue: asyncio.Queue = asyncio.Queue()
+        self._insert_batch_size = 100
+        self._insert_max_wait = 0.05  # секунды
         
     async def setup_handlers(self, router):
         """Настройка обработчиков"""
@@ -65,7 +153,8 @@ class ReportsManager:
             replied_message = message.reply_to_message
             
             # Проверяем, является ли replied_message жалобой от бота
-            if replied_message.from_user.id == self.bot.id and "жалоб" in replied_message.text:
+            # (номер жалобы ищет handle_admin_report_response, отдельная проверка текста не нужна)
+            if replied_message.from_user.id == self.bot.id and replied_message.text:
                 await self.handle_admin_report_response(message, replied_message)
     
     async def handle_report_command(self, message: Message, state: FSMContext):
@@ -90,15 +179,18 @@ class ReportsManager:
         
         # Проверка, что пользователь не админ (чтобы не спамили)
         try:
-            chat_member = await self.bot.get_chat_member(
-                chat_id=message.chat.id,
-                user_id=message.from_user.id
+            chat_member = await asyncio.wait_for(
+                self.bot.get_chat_member(
+                    chat_id=message.chat.id,
+                    user_id=message.from_user.id
+                ),
+                timeout=_TELEGRAM_TIMEOUT
             )
             if chat_member.status in ["administrator", "creator"]:
                 await message.answer("👑 Админы могут использовать модерацию напрямую.")
                 return
-        except:
-            pass
+        except (TelegramAPIError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не удалось проверить статус {message.from_user.id} в чате {message.chat.id}: {e}")
         
         # Сохранение данных для жалобы
         await state.update_data(
@@ -143,14 +235,7 @@ class ReportsManager:
             return
         
         report_type = callback.data.replace("report_type_", "")
-        report_type_enum = {
-            "spam": ReportType.SPAM,
-            "abuse": ReportType.ABUSE,
-            "scam": ReportType.SCAM,
-            "pornography": ReportType.PORNOGRAPHY,
-            "violence": ReportType.VIOLENCE,
-            "other": ReportType.OTHER
-        }.get(report_type, ReportType.OTHER)
+        report_type_enum = _REPORT_TYPE_ENUM.get(report_type, ReportType.OTHER)
         
         await state.update_data(report_type=report_type_enum.value)
         
@@ -201,37 +286,13 @@ class ReportsManager:
     async def create_report(self, reporter_id: int, reported_user_id: int, chat_id: int,
                            message_id: int, report_type: int, reason: str) -> int:
         """Создание жалобы в БД"""
-        from .database import DatabaseManager
-        
-        db = DatabaseManager.get_instance()
-        
         # Проверка на дубликаты (такая же жалоба за последние 5 минут)
-        recent_reports = await self.get_recent_reports(
-            reporter_id=reporter_id,
-            reported_user_id=reported_user_id,
-            chat_id=chat_id,
-            minutes=5
-        )
-        
-        if recent_reports:
-            # Помечаем как дубликат
-            report_data = {
-                "reporter_id": reporter_id,
-                "reported_user_id": reported_user_id,
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "report_type": report_type,
-                "reason": reason,
-                "status": ReportStatus.DUPLICATE.value,
-                "created_at": datetime.now().isoformat(),
-                "bot_id": self.admin_system.config.bot_id
-            }
-            
+        if await self._is_duplicate_report(reporter_id, reported_user_id, chat_id):
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=reporter_id,
-                action_type=13,  # REPORT_SUBMITTED
+                action_type=ActionType(13),  # REPORT_SUBMITTED
                 action_data={
                     "report_type": report_type,
                     "status": "duplicate",
@@ -245,29 +306,29 @@ class ReportsManager:
         
         # Создание новой жалобы
         try:
-            # Вставка в БД
-            cursor = await db.connection.execute(
-                f"""
-                INSERT INTO {db.get_table_name('reports')}
-                (reporter_id, reported_user_id, chat_id, message_id, 
-                 report_type, reason, status, created_at, bot_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    reporter_id, reported_user_id, chat_id, message_id,
-                    report_type, reason, ReportStatus.PENDING.value,
-                    datetime.now().isoformat(), self.admin_system.config.bot_id
+            # Снимок имен для списка жалоб (заодно прогревает кэш для уведомления админов)
+            reporter_name, reported_name = (
+                None if isinstance(name, Exception) else name
+                for name in await asyncio.gather(
+                    self._get_member_name(chat_id, reporter_id),
+                    self._get_member_name(chat_id, reported_user_id),
+                    return_exceptions=True
                 )
             )
             
-            await db.connection.commit()
-            report_id = cursor.lastrowid
+            # Вставка в БД (пачкой вместе с другими жалобами)
+            report_id = await self._insert_report((
+                reporter_id, reported_user_id, chat_id, message_id,
+                report_type, reason, ReportStatus.PENDING.value,
+                datetime.now().isoformat(), self.admin_system.config.bot_id,
+                reporter_name, reported_name
+            ))
             
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=reporter_id,
-                action_type=13,  # REPORT_SUBMITTED
+                action_type=ActionType(13),  # REPORT_SUBMITTED
                 action_data={
                     "report_id": report_id,
                     "report_type": report_type,
@@ -292,11 +353,152 @@ class ReportsManager:
             logger.error(f"Ошибка при создании жалобы: {e}")
             return -1
     
+    async def _insert_report(self, row: Tuple) -> int:
+        """Поставить жалобу в очередь на вставку и дождаться её id"""
+        future = asyncio.get_running_loop().create_future()
+        self._insert_queue.put_nowait((row, future))
+        return await future
+    
+    async def _write_report_batch(self, batch: List):
+        """Вставить пачку жалоб одним commit и раздать id ожидающим"""
+        db = DatabaseManager.get_instance()
+        try:
+            report_ids = await db.add_reports([row for row, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), report_id in zip(batch, report_ids):
+            if not future.done():
+                future.set_result(report_id)
+    
+    async def flush_report_inserts(self):
+        """Вставить всё, что накопилось в очереди, пачками по _insert_batch_size"""
+        while not self._insert_queue.empty():
+            batch = []
+            while len(batch) < self._insert_batch_size and not self._insert_queue.empty():
+                batch.append(self._insert_queue.get_nowait())
+            await self._write_report_batch(batch)
+    
+    async def report_insert_writer_task(self):
+        """Фоновая задача: набирает до _insert_batch_size жалоб
+        (не дольше _insert_max_wait секунд) и вставляет их пачкой"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._insert_queue.get()]
+            deadline = loop.time() + self._insert_max_wait
+            
+            try:
+                while len(batch) < self._insert_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._insert_queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Набранная пачка возвращается в очередь: ее допишет flush_report_inserts при остановке
+                for item in batch:
+                    self._insert_queue.put_nowait(item)
+                raise
+            
+            try:
+                await self._write_report_batch(batch)
+            except asyncio.CancelledError:
+                # Пачка уже ушла в БД и исход неизвестен - ожидающие получают ошибку, а не висят вечно
+                error = RuntimeError("Вставка жалоб прервана остановкой системы")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при пакетной вставке жалоб: {e}")
+    
+    def _queue_notification(self, chat_id: int, text: str):
+        """Поставить уведомление в очередь отправки (не ждет Telegram)"""
+        self._notification_queue.put_nowait((chat_id, text))
+    
+    async def _wait_send_slot(self, chat_id: int):
+        """Дождаться, пока отправка в chat_id уложится в общий лимит и лимит чата"""
+        global_limit, global_window = _GLOBAL_SEND_LIMIT
+        chat_limit, chat_window = _CHAT_SEND_LIMIT
+        chat_times = self._chat_send_times.setdefault(chat_id, deque())
+        
+        while True:
+            now = time.monotonic()
+            while self._global_send_times and now - self._global_send_times[0] >= global_window:
+                self._global_send_times.popleft()
+            while chat_times and now - chat_times[0] >= chat_window:
+                chat_times.popleft()
+            
+            wait = 0.0
+            if len(self._global_send_times) >= global_limit:
+                wait = self._global_send_times[0] + global_window - now
+            if len(chat_times) >= chat_limit:
+                wait = max(wait, chat_times[0] + chat_window - now)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        
+        self._global_send_times.append(now)
+        chat_times.append(now)
+        
+        # Чаты без отправок за последнее окно больше не нужны
+        if len(self._chat_send_times) > 1000:
+            for stale_chat in [c for c, times in self._chat_send_times.items()
+                               if not times or now - times[-1] >= chat_window]:
+                del self._chat_send_times[stale_chat]
+    
+    async def notification_sender_task(self):
+        """Фоновая задача: отправка уведомлений из очереди с учетом лимитов и RetryAfter"""
+        while True:
+            chat_id, text = await self._notification_queue.get()
+            
+            while True:
+                await self._wait_send_slot(chat_id)
+                try:
+                    await asyncio.wait_for(
+                        self.bot.send_message(chat_id=chat_id, text=text),
+                        timeout=_TELEGRAM_TIMEOUT
+                    )
+                except TelegramRetryAfter as e:
+                    # Повтор того же сообщения после паузы - оно остается первым в очереди
+                    logger.warning(f"Лимит Telegram, пауза {e.retry_after} с перед отправкой в {chat_id}")
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except (TelegramAPIError, asyncio.TimeoutError) as e:
+                    # Пользователь может быть недоступен
+                    logger.warning(f"Не удалось отправить уведомление в {chat_id}: {e}")
+                break
+    
+    async def _is_duplicate_report(self, reporter_id: int, reported_user_id: int, chat_id: int) -> bool:
+        """Была ли такая же жалоба в окне дубликатов.
+        
+        С Redis - один SET NX EX: ключ ставится первой жалобой и живет все окно.
+        Без Redis (или при ошибке) - запрос недавних жалоб в БД.
+        """
+        minutes = self._duplicate_window_minutes
+        
+        if self.redis:
+            key = f"report:dup:{self.admin_system.config.bot_id}:{reporter_id}:{reported_user_id}:{chat_id}"
+            try:
+                return not await self.redis.set(key, b"1", nx=True, ex=minutes * 60)
+            except Exception as e:
+                logger.warning(f"Ошибка проверки дубликата жалобы в Redis: {e}")
+        
+        return bool(await self.get_recent_reports(
+            reporter_id=reporter_id,
+            reported_user_id=reported_user_id,
+            chat_id=chat_id,
+            minutes=minutes
+        ))
+    
     async def get_recent_reports(self, reporter_id: int, reported_user_id: int,
-                                chat_id: int, minutes: int = 5) -> List[Dict]:
+                                chat_id: int, minutes: int = 5) -> List[aiosqlite.Row]:
         """Получить недавние жалобы"""
-        from .database import DatabaseManager
-        
         db = DatabaseManager.get_instance()
         
         cutoff_time = datetime.now() - timedelta(minutes=minutes)
@@ -315,12 +517,9 @@ class ReportsManager:
             )
         )
         
-        reports = []
-        async for row in cursor:
-            reports.append(dict(row))
-        
+        rows = await cursor.fetchall()
         await cursor.close()
-        return reports
+        return rows
     
     async def notify_admins_about_report(self, report_id: int, report_data: Dict):
         """Уведомить админов о новой жалобе"""
@@ -330,102 +529,156 @@ class ReportsManager:
         chat_id = report_data["chat_id"]
         
         try:
-            # Получение информации о чате
-            chat = await self.bot.get_chat(chat_id)
-            chat_title = chat.title or "Чат"
-            
-            # Получение информации о пользователях
-            reporter = await self.bot.get_chat_member(chat_id, report_data["reporter_id"])
-            reported = await self.bot.get_chat_member(chat_id, report_data["reported_user_id"])
-            
-            reporter_name = reporter.user.full_name
-            reported_name = reported.user.full_name
+            # Информация о чате и пользователях - из кэша, промахи запрашиваются параллельно.
+            # Недоступный участник (вышел из чата и т.п.) не должен срывать уведомление
+            results = await asyncio.gather(
+                self._get_chat_title(chat_id),
+                self._get_member_name(chat_id, report_data["reporter_id"]),
+                self._get_member_name(chat_id, report_data["reported_user_id"]),
+                return_exceptions=True
+            )
+            fallbacks = ("Чат", "Неизвестно", "Неизвестно")
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning(f"Не удалось получить данные для жалобы #{report_id}: {result}")
+            chat_title, reporter_name, reported_name = (
+                fallback if isinstance(result, Exception) else result
+                for result, fallback in zip(results, fallbacks)
+            )
             
-            # Получение сообщения
-            message = None
+            # Источник копии сообщения для админов: один раз пересланное в служебный чат
+            # (переживет удаление оригинала по жалобе) или, без служебного чата, сам чат
+            source = None
+            log_chat_id = self.admin_system.config.reports_log_chat_id
             try:
-                message = await self.bot.copy_message(
-                    chat_id=self.bot.id,  # Отправляем боту
-                    from_chat_id=chat_id,
-                    message_id=report_data["reported_message_id"]
-                )
-            except:
-                pass
+                if log_chat_id:
+                    forwarded = await asyncio.wait_for(
+                        self.bot.forward_message(
+                            chat_id=log_chat_id,
+                            from_chat_id=chat_id,
+                            message_id=report_data["reported_message_id"]
+                        ),
+                        timeout=_TELEGRAM_TIMEOUT
+                    )
+                    source = (log_chat_id, forwarded.message_id)
+                else:
+                    source = (chat_id, report_data["reported_message_id"])
+            except (TelegramAPIError, asyncio.TimeoutError) as e:
+                logger.warning(f"Не удалось переслать сообщение из жалобы #{report_id}: {e}")
             
             # Формирование уведомления
-            text = f"🚨 Новая жалоба в чате: {chat_title}\n\n"
-            text += f"👤 От: {reporter_name}\n"
-            text += f"👥 На: {reported_name}\n"
-            text += f"📋 Тип: {self._get_report_type_text(report_data['report_type'])}\n"
-            text += f"💬 Причина: {report_data.get('reason', 'не указана')}\n\n"
-            text += f"🆔 ID жалобы: {report_id}\n"
-            text += f"💬 ID чата: {chat_id}\n"
-            text += f"📝 ID сообщения: {report_data['reported_message_id']}\n\n"
-            text += "Выберите действие:"
+            text = (
+                f"🚨 Новая жалоба в чате: {chat_title}\n\n"
+                f"👤 От: {reporter_name}\n"
+                f"👥 На: {reported_name}\n"
+                f"📋 Тип: {self._get_report_type_text(report_data['report_type'])}\n"
+                f"💬 Причина: {report_data.get('reason', 'не указана')}\n\n"
+                f"🆔 ID жалобы: {report_id}\n"
+                f"💬 ID чата: {chat_id}\n"
+                f"📝 ID сообщения: {report_data['reported_message_id']}\n\n"
+                "Выберите действие:"
+            )
             
             # Кнопки действий
-            buttons = [
-                [
-                    InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"report_action_delete:{report_id}"),
-                    InlineKeyboardButton(text="⚠️ Предупредить", callback_data=f"report_action_warn:{report_id}")
-                ],
-                [
-                    InlineKeyboardButton(text="🔇 Мут", callback_data=f"report_action_mute:{report_id}"),
-                    InlineKeyboardButton(text="🚫 Бан", callback_data=f"report_action_ban:{report_id}")
-                ],
-                [
-                    InlineKeyboardButton(text="✅ Решено", callback_data=f"report_action_resolved:{report_id}"),
-                    InlineKeyboardButton(text="❌ Игнорировать", callback_data=f"report_action_ignore:{report_id}")
-                ],
-                [
-                    InlineKeyboardButton(text="📋 Подробнее", callback_data=f"report_details:{report_id}")
-                ]
-            ]
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+            keyboard = self._make_action_keyboard(report_id)
             
             # Отправка уведомления всем админам бота
-            security = self.admin_system.security
-            admins = await security.get_all_bot_admins()
+            admins = await self._get_bot_admins()
             
-            for admin in admins:
-                try:
-                    # Отправляем текст
-                    await self.bot.send_message(
-                        chat_id=admin.user_id,
-                        text=text,
-                        reply_markup=keyboard
-                    )
-                    
-                    # Если есть сообщение, пересылаем его
-                    if message:
-                        await message.copy(chat_id=admin.user_id)
-                        
-                except Exception as e:
-                    logger.error(f"Ошибка при уведомлении админа {admin.user_id}: {e}")
-                    continue
+            # Всем админам параллельно: время - одна отправка, а не сумма по админам
+            await asyncio.gather(
+                *(self._notify_admin(admin, text, keyboard, source) for admin in admins),
+                return_exceptions=True
+            )
             
         except Exception as e:
             logger.error(f"Ошибка при уведомлении админов: {e}")
     
+    @staticmethod
+    def _make_action_keyboard(report_id: int) -> InlineKeyboardMarkup:
+        """Клавиатура действий с жалобой по шаблону _REPORT_ACTION_ROWS"""
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text=text, callback_data=data.format(rid=report_id))
+                for text, data in row
+            ]
+            for row in _REPORT_ACTION_ROWS
+        ])
+    
+    async def _notify_admin(self, admin, text: str, keyboard: InlineKeyboardMarkup,
+                            source: Optional[Tuple[int, int]]):
+        """Уведомление одного админа (не больше _notify_semaphore отправок одновременно).
+        
+        source - (chat_id, message_id) сообщения из жалобы, которое копируется админу.
+        """
+        async with self._notify_semaphore:
+            try:
+                # Отправляем текст
+                await self.bot.send_message(
+                    chat_id=admin.user_id,
+                    text=text,
+                    reply_markup=keyboard
+                )
+                
+                # Если есть сообщение, копируем его
+                if source:
+                    await self.bot.copy_message(
+                        chat_id=admin.user_id,
+                        from_chat_id=source[0],
+                        message_id=source[1]
+                    )
+                    
+            except Exception as e:
+                logger.error(f"Ошибка при уведомлении админа {admin.user_id}: {e}")
+    
+    async def _get_chat_title(self, chat_id: int) -> str:
+        """Название чата (кэшируется на _chat_cache_ttl секунд, запрос ограничен _TELEGRAM_TIMEOUT)"""
+        cached = self._chat_title_cache.get(chat_id)
+        if cached and time.monotonic() - cached[0] < self._chat_cache_ttl:
+            return cached[1]
+        
+        chat = await asyncio.wait_for(self.bot.get_chat(chat_id), timeout=_TELEGRAM_TIMEOUT)
+        title = chat.title or "Чат"
+        self._store_cached(self._chat_title_cache, chat_id, title, self._chat_cache_ttl)
+        return title
+    
+    async def _get_member_name(self, chat_id: int, user_id: int) -> str:
+        """Полное имя участника чата (кэшируется на _chat_cache_ttl секунд, запрос ограничен _TELEGRAM_TIMEOUT)"""
+        cached = self._member_name_cache.get((chat_id, user_id))
+        if cached and time.monotonic() - cached[0] < self._chat_cache_ttl:
+            return cached[1]
+        
+        member = await asyncio.wait_for(self.bot.get_chat_member(chat_id, user_id), timeout=_TELEGRAM_TIMEOUT)
+        name = member.user.full_name
+        self._store_cached(self._member_name_cache, (chat_id, user_id), name, self._chat_cache_ttl)
+        return name
+    
+    async def _get_bot_admins(self) -> List:
+        """Админы бота (кэшируются на _admins_cache_ttl секунд)"""
+        if self._admins_cache and time.monotonic() - self._admins_cache[0] < self._admins_cache_ttl:
+            return self._admins_cache[1]
+        
+        admins = await self.admin_system.security.get_all_bot_admins()
+        self._admins_cache = (time.monotonic(), admins)
+        return admins
+    
+    @staticmethod
+    def _store_cached(cache: Dict, key, value, ttl: int, max_size: int = 1024):
+        """Положить значение в TTL-кэш; при переполнении выбросить истекшие записи"""
+        now = time.monotonic()
+        if len(cache) >= max_size:
+            for stale_key in [k for k, (ts, _) in cache.items() if now - ts >= ttl]:
+                del cache[stale_key]
+        cache[key] = (now, value)
+    
     def _get_report_type_text(self, report_type: int) -> str:
         """Получить текстовое представление типа жалобы"""
-        types = {
-            ReportType.SPAM.value: "📨 Спам",
-            ReportType.ABUSE.value: "😠 Оскорбление",
-            ReportType.SCAM.value: "🎭 Мошенничество",
-            ReportType.PORNOGRAPHY.value: "🔞 Непристойный контент",
-            ReportType.VIOLENCE.value: "⚡ Насилие/угрозы",
-            ReportType.OTHER.value: "❓ Другое"
-        }
-        return types.get(report_type, "❓ Неизвестно")
+        return _REPORT_TYPE_TEXT.get(report_type, "❓ Неизвестно")
     
     async def handle_admin_report_response(self, message: Message, report_message: Message):
         """Обработка ответа админа на жалобу"""
         # Извлекаем ID жалобы из текста сообщения
-        import re
-        
-        report_id_match = re.search(r'ID жалобы:\s*(\d+)', report_message.text)
+        report_id_match = _REPORT_ID_RE.search(report_message.text)
         if not report_id_match:
             return
         
@@ -439,54 +692,69 @@ class ReportsManager:
             await message.answer("❌ У вас нет прав для обработки жалоб.")
             return
         
-        # Обновление статуса жалобы
-        await self.update_report_status(
+        # Обновление статуса жалобы (строка жалобы возвращается тем же запросом)
+        report = await self._update_and_fetch(
             report_id=report_id,
             status=ReportStatus.RESOLVED.value,
             handled_by=user_id,
             admin_comment=message.text
         )
+        if report is None:
+            await message.answer(f"❌ Жалоба #{report_id} не найдена.")
+            return
         
         # Ответ админу
         await message.answer(f"✅ Жалоба #{report_id} отмечена как решенная.")
         
         # Уведомление отправителя жалобы
-        await self.notify_reporter_about_resolution(report_id, user_id)
+        await self.notify_reporter_about_resolution(report, user_id)
     
     async def update_report_status(self, report_id: int, status: str, 
                                  handled_by: int, admin_comment: str = ""):
         """Обновление статуса жалобы"""
-        from .database import DatabaseManager
+        return await self._update_and_fetch(report_id, status, handled_by, admin_comment) is not None
+    
+    async def _update_and_fetch(self, report_id: int, status: str,
+                                handled_by: int, admin_comment: str = "") -> Optional[aiosqlite.Row]:
+        """Обновить статус жалобы и вернуть её строку одним запросом (UPDATE ... RETURNING).
         
+        None - жалоба не найдена или произошла ошибка.
+        """
         db = DatabaseManager.get_instance()
         
         try:
-            await db.connection.execute(
+            handled_at = datetime.now()
+            cursor = await db.connection.execute(
                 f"""
                 UPDATE {db.get_table_name('reports')}
                 SET status = ?, handled_by = ?, handled_at = ?, admin_comment = ?
                 WHERE id = ? AND bot_id = ?
+                RETURNING *
                 """,
                 (
-                    status, handled_by, datetime.now().isoformat(),
+                    status, handled_by, handled_at.isoformat(),
                     admin_comment[:500], report_id,
                     self.admin_system.config.bot_id
                 )
             )
+            rows = await cursor.fetchall()
+            await cursor.close()
             
             await db.connection.commit()
             
+            if not rows:
+                return None
+            
             # Обновление кэша
-            if report_id in self._reports_cache:
-                self._reports_cache[report_id]["status"] = status
-                self._reports_cache[report_id]["handled_by"] = handled_by
-                self._reports_cache[report_id]["handled_at"] = datetime.now()
+            cached = self._reports_cache.get(report_id)
+            if cached:
+                cached[1].update(status=status, handled_by=handled_by, handled_at=handled_at)
             
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=handled_by,
-                action_type=14,  # REPORT_HANDLED
+                action_type=ActionType(14),  # REPORT_HANDLED
                 action_data={
                     "report_id": report_id,
                     "status": status,
@@ -494,51 +762,45 @@ class ReportsManager:
                 }
             )
             
-            return True
+            return rows[0]
             
         except Exception as e:
             logger.error(f"Ошибка при обновлении статуса жалобы: {e}")
-            return False
+            return None
     
-    async def notify_reporter_about_resolution(self, report_id: int, admin_id: int):
+    async def notify_reporter_about_resolution(self, report: aiosqlite.Row, admin_id: int):
         """Уведомить отправителя о решении жалобы"""
-        from .database import DatabaseManager
-        
-        db = DatabaseManager.get_instance()
-        
-        # Получение информации о жалобе
-        cursor = await db.connection.execute(
-            f"SELECT * FROM {db.get_table_name('reports')} WHERE id = ? AND bot_id = ?",
-            (report_id, self.admin_system.config.bot_id)
-        )
-        
-        row = await cursor.fetchone()
-        await cursor.close()
-        
-        if not row:
-            return
-        
-        report = dict(row)
-        
         # Формирование уведомления
-        text = "📢 Ваша жалоба рассмотрена\n\n"
-        text += f"🆔 Жалоба: #{report_id}\n"
-        text += f"✅ Статус: Решена\n"
-        text += f"👮‍♂️ Рассмотрена: Администратором\n"
-        text += f"⏰ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
-        text += "Спасибо за помощь в поддержании порядка!"
+        text = (
+            "📢 Ваша жалоба рассмотрена\n\n"
+            f"🆔 Жалоба: #{report['id']}\n"
+            "✅ Статус: Решена\n"
+            "👮‍♂️ Рассмотрена: Администратором\n"
+            f"⏰ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
+            "Спасибо за помощь в поддержании порядка!"
+        )
         
         # Отправка уведомления
         try:
-            await self.bot.send_message(
-                chat_id=report["reporter_id"],
-                text=text
+            await asyncio.wait_for(
+                self.bot.send_message(
+                    chat_id=report["reporter_id"],
+                    text=text
+                ),
+                timeout=_TELEGRAM_TIMEOUT
             )
-        except:
-            pass  # Пользователь может быть недоступен
+        except (TelegramAPIError, asyncio.TimeoutError) as e:
+            # Пользователь может быть недоступен
+            logger.warning(f"Не удалось уведомить автора жалобы #{report['id']}: {e}")
     
-    async def show_reports_list(self, callback: CallbackQuery, status: str = "pending", page: int = 0):
-        """Показать список жалоб"""
+    async def show_reports_list(self, callback: CallbackQuery, status: str = "pending", page: int = 0,
+                                before_id: Optional[int] = None, after_id: Optional[int] = None):
+        """Показать список жалоб.
+        
+        Пагинация по ключу (id убывает вместе с created_at): before_id - следующая
+        страница (жалобы старше), after_id - предыдущая (жалобы новее). Стоимость
+        запроса не зависит от номера страницы, в отличие от OFFSET.
+        """
         user_id = callback.from_user.id
         
         security = self.admin_system.security
@@ -546,66 +808,80 @@ class ReportsManager:
             await callback.message.edit_text("❌ У вас нет прав для просмотра жалоб.")
             return
         
-        from .database import DatabaseManager
-        
         db = DatabaseManager.get_instance()
-        
-        # Получение жалоб
-        offset = page * 10
+        bot_id = self.admin_system.config.bot_id
+        
+        # Получение жалоб: на одну больше страницы, чтобы знать, есть ли продолжение
+        # Условие по ключу собирается без "? IS NULL OR": иначе SQLite не ищет по диапазону id в индексе
+        backwards = after_id is not None
+        params = [status, bot_id]
+        if backwards:
+            key_condition, order = "AND r.id > ?", "ASC"
+            params.append(after_id)
+        elif before_id is not None:
+            key_condition, order = "AND r.id < ?", "DESC"
+            params.append(before_id)
+        else:
+            key_condition, order = "", "DESC"
         
         cursor = await db.connection.execute(
             f"""
-            SELECT r.*, u1.first_name as reporter_name, u2.first_name as reported_name
+            SELECT r.id, r.report_type, r.chat_id, r.created_at, r.reporter_name, r.reported_name
             FROM {db.get_table_name('reports')} r
-            LEFT JOIN {db.get_table_name('users')} u1 ON r.reporter_id = u1.user_id
-            LEFT JOIN {db.get_table_name('users')} u2 ON r.reported_user_id = u2.user_id
-            WHERE r.status = ? AND r.bot_id = ?
-            ORDER BY r.created_at DESC
-            LIMIT ? OFFSET ?
+            WHERE r.status = ? AND r.bot_id = ? {key_condition}
+            ORDER BY r.id {order}
+            LIMIT 11
             """,
-            (status, self.admin_system.config.bot_id, 10, offset)
+            params
         )
         
-        reports = []
-        async for row in cursor:
-            reports.append(dict(row))
-        
+        # Не больше 11 строк: забираем одним вызовом, поля читаем прямо из Row
+        reports = await cursor.fetchall()
         await cursor.close()
         
-        # Получение общего количества
-        count_cursor = await db.connection.execute(
-            f"SELECT COUNT(*) FROM {db.get_table_name('reports')} WHERE status = ? AND bot_id = ?",
-            (status, self.admin_system.config.bot_id)
-        )
+        has_more = len(reports) > 10
+        reports = reports[:10]
+        if backwards:
+            reports.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = page > 0, has_more
         
-        total = (await count_cursor.fetchone())[0]
-        await count_cursor.close()
+        # Общее количество - из кэша, COUNT(*) не чаще раза в _count_cache_ttl секунд
+        cached = self._count_cache.get(status)
+        if cached and time.monotonic() - cached[0] < self._count_cache_ttl:
+            total = cached[1]
+        else:
+            row = await db.execute_fetchone(
+                f"SELECT COUNT(*) FROM {db.get_table_name('reports')} WHERE status = ? AND bot_id = ?",
+                (status, bot_id)
+            )
+            total = row[0]
+            self._count_cache[status] = (time.monotonic(), total)
+        total_pages = max((total + 9) // 10, page + 1)
         
         # Формирование текста
-        status_text = {
-            "pending": "⏳ Ожидающие",
-            "in_progress": "🔄 В работе",
-            "resolved": "✅ Решенные",
-            "rejected": "❌ Отклоненные",
-            "duplicate": "📋 Дубликаты"
-        }.get(status, status)
-        
-        text = f"📋 Список жалоб: {status_text}\n\n"
-        text += f"📊 Всего: {total:,}\n"
-        text += f"📄 Страница {page + 1}/{(total + 9) // 10}\n\n"
+        status_text = _STATUS_TEXT.get(status, status)
+        
+        parts = [
+            f"📋 Список жалоб: {status_text}\n\n"
+            f"📊 Всего: {total:,}\n"
+            f"📄 Страница {page + 1}/{total_pages}\n\n"
+        ]
         
         if not reports:
-            text += "Жалобы не найдены."
+            parts.append("Жалобы не найдены.")
         else:
-            for i, report in enumerate(reports, start=1):
-                report_type = self._get_report_type_text(report["report_type"])
-                created_at = datetime.fromisoformat(report["created_at"])
-                
-                text += f"{i}. #{report['id']} - {report_type}\n"
-                text += f"   👤 От: {report.get('reporter_name', 'Неизвестно')}\n"
-                text += f"   👥 На: {report.get('reported_name', 'Неизвестно')}\n"
-                text += f"   💬 Чат: {report['chat_id']}\n"
-                text += f"   📅: {created_at.strftime('%d.%m %H:%M')}\n\n"
+            parts.extend(
+                f"{i}. #{report['id']} - {self._get_report_type_text(report['report_type'])}\n"
+                f"   👤 От: {report['reporter_name'] or 'Неизвестно'}\n"
+                f"   👥 На: {report['reported_name'] or 'Неизвестно'}\n"
+                f"   💬 Чат: {report['chat_id']}\n"
+                f"   📅: {datetime.fromisoformat(report['created_at']).strftime('%d.%m %H:%M')}\n\n"
+                for i, report in enumerate(reports, start=1)
+            )
+        
+        text = "".join(parts)
         
         # Кнопки фильтрации
         status_buttons = [
@@ -630,21 +906,21 @@ class ReportsManager:
         # Кнопки навигации
         nav_buttons = []
         
-        if page > 0:
+        if has_prev and reports:
             nav_buttons.append(InlineKeyboardButton(
                 text="◀️ Назад", 
-                callback_data=f"reports_page_{status}_{page-1}"
+                callback_data=f"reports_page_{status}_{page-1}_a{reports[0]['id']}"
             ))
         
         nav_buttons.append(InlineKeyboardButton(
-            text=f"{page+1}/{(total+9)//10}", 
+            text=f"{page+1}/{total_pages}", 
             callback_data="reports_stats"
         ))
         
-        if page < (total + 9) // 10 - 1:
+        if has_next and reports:
             nav_buttons.append(InlineKeyboardButton(
                 text="Вперед ▶️", 
-                callback_data=f"reports_page_{status}_{page+1}"
+                callback_data=f"reports_page_{status}_{page+1}_b{reports[-1]['id']}"
             ))
         
         if nav_buttons:
@@ -668,100 +944,54 @@ class ReportsManager:
             await callback.answer("❌ У вас нет прав для обработки жалоб.")
             return
         
-        from .database import DatabaseManager
-        
-        db = DatabaseManager.get_instance()
-        
-        # Получение информации о жалобе
-        cursor = await db.connection.execute(
-            f"SELECT * FROM {db.get_table_name('reports')} WHERE id = ? AND bot_id = ?",
-            (report_id, self.admin_system.config.bot_id)
-        )
-        
-        row = await cursor.fetchone()
-        await cursor.close()
-        
-        if not row:
-            await callback.answer("❌ Жалоба не найдена.")
-            return
-        
-        report = dict(row)
+        # Действие -> (обработчик, новый статус, комментарий, ответ админу)
+        actions = {
+            "delete": (self._delete_reported_message, ReportStatus.RESOLVED,
+                       "Сообщение удалено", "✅ Сообщение удалено."),
+            "warn": (self._warn_reported_user, ReportStatus.RESOLVED,
+                     "Пользователь предупрежден", "✅ Пользователь предупрежден."),
+            "mute": (self._mute_reported_user, ReportStatus.RESOLVED,
+                     "Пользователь замучен", "✅ Пользователь замучен."),
+            "ban": (self._ban_reported_user, ReportStatus.RESOLVED,
+                    "Пользователь забанен", "✅ Пользователь забанен."),
+            "resolved": (None, ReportStatus.RESOLVED,
+                         "Отмечено как решенное", "✅ Жалоба отмечена как решенная."),
+            "ignore": (None, ReportStatus.REJECTED,
+                       "Игнорировано", "✅ Жалоба отклонена.")
+        }
         
-        # Выполнение действия
-        if action == "delete":
-            await self._delete_reported_message(report, user_id)
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.RESOLVED.value,
-                handled_by=user_id,
-                admin_comment="Сообщение удалено"
-            )
-            await callback.answer("✅ Сообщение удалено.")
-            
-        elif action == "warn":
-            await self._warn_reported_user(report, user_id)
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.RESOLVED.value,
-                handled_by=user_id,
-                admin_comment="Пользователь предупрежден"
-            )
-            await callback.answer("✅ Пользователь предупрежден.")
-            
-        elif action == "mute":
-            await self._mute_reported_user(report, user_id)
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.RESOLVED.value,
-                handled_by=user_id,
-                admin_comment="Пользователь замучен"
-            )
-            await callback.answer("✅ Пользователь замучен.")
-            
-        elif action == "ban":
-            await self._ban_reported_user(report, user_id)
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.RESOLVED.value,
-                handled_by=user_id,
-                admin_comment="Пользователь забанен"
-            )
-            await callback.answer("✅ Пользователь забанен.")
+        if action in actions:
+            handler, status, comment, answer = actions[action]
             
-        elif action == "resolved":
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.RESOLVED.value,
-                handled_by=user_id,
-                admin_comment="Отмечено как решенное"
-            )
-            await callback.answer("✅ Жалоба отмечена как решенная.")
+            # Смена статуса и получение жалобы - один запрос
+            report = await self._update_and_fetch(report_id, status.value, user_id, comment)
+            if report is None:
+                await callback.answer("❌ Жалоба не найдена.")
+                return
             
-        elif action == "ignore":
-            await self.update_report_status(
-                report_id=report_id,
-                status=ReportStatus.REJECTED.value,
-                handled_by=user_id,
-                admin_comment="Игнорировано"
-            )
-            await callback.answer("✅ Жалоба отклонена.")
+            if handler:
+                await handler(report, user_id)
+            await callback.answer(answer)
         
         # Обновление сообщения
         await self.show_reports_list(callback)
     
-    async def _delete_reported_message(self, report: Dict, admin_id: int):
+    async def _delete_reported_message(self, report: aiosqlite.Row, admin_id: int):
         """Удаление сообщения из жалобы"""
         try:
-            await self.bot.delete_message(
-                chat_id=report["chat_id"],
-                message_id=report["message_id"]
+            await asyncio.wait_for(
+                self.bot.delete_message(
+                    chat_id=report["chat_id"],
+                    message_id=report["message_id"]
+                ),
+                timeout=_TELEGRAM_TIMEOUT
             )
             
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=admin_id,
-                action_type=7,  # MESSAGE_DELETED
+                action_type=ActionType(7),  # MESSAGE_DELETED
                 action_data={
                     "chat_id": report["chat_id"],
                     "message_id": report["message_id"],
@@ -774,10 +1004,8 @@ class ReportsManager:
         except Exception as e:
             logger.error(f"Ошибка при удалении сообщения: {e}")
     
-    async def _warn_reported_user(self, report: Dict, admin_id: int):
+    async def _warn_reported_user(self, report: aiosqlite.Row, admin_id: int):
         """Выдать предупреждение пользователю из жалобы"""
-        from .database import DatabaseManager
-        
         db = DatabaseManager.get_instance()
         
         # Получение пользователя
@@ -789,26 +1017,20 @@ class ReportsManager:
         user.warnings += 1
         await db.update_user(user)
         
-        # Отправка уведомления пользователю
-        try:
-            warning_text = f"⚠️ Вы получили предупреждение!\n\n"
-            warning_text += f"Причина: Жалоба от пользователя\n"
-            warning_text += f"Тип нарушения: {self._get_report_type_text(report['report_type'])}\n"
-            warning_text += f"Всего предупреждений: {user.warnings}\n\n"
-            warning_text += "Пожалуйста, соблюдайте правила чата."
-            
-            await self.bot.send_message(
-                chat_id=report["reported_user_id"],
-                text=warning_text
-            )
-        except:
-            pass  # Пользователь может быть недоступен
+        # Уведомление пользователю (через очередь отправки)
+        warning_text = f"⚠️ Вы получили предупреждение!\n\n"
+        warning_text += f"Причина: Жалоба от пользователя\n"
+        warning_text += f"Тип нарушения: {self._get_report_type_text(report['report_type'])}\n"
+        warning_text += f"Всего предупреждений: {user.warnings}\n\n"
+        warning_text += "Пожалуйста, соблюдайте правила чата."
+        
+        self._queue_notification(report["reported_user_id"], warning_text)
         
         # Логирование
         security = self.admin_system.security
-        await security.log_action(
+        security.log_action_buffered(
             user_id=admin_id,
-            action_type=4,  # USER_WARNED
+            action_type=ActionType(4),  # USER_WARNED
             action_data={
                 "target_user_id": report["reported_user_id"],
                 "reason": "report",
@@ -818,7 +1040,7 @@ class ReportsManager:
             chat_id=report["chat_id"]
         )
     
-    async def _mute_reported_user(self, report: Dict, admin_id: int):
+    async def _mute_reported_user(self, report: aiosqlite.Row, admin_id: int):
         """Замутить пользователя из жалобы"""
         from aiogram.types import ChatPermissions
         
@@ -837,20 +1059,17 @@ class ReportsManager:
                 until_date=until_date
             )
             
-            # Уведомление в чат
+            # Уведомление в чат (через очередь отправки)
             notification = f"👤 Пользователь был замучен на 1 час.\n"
             notification += f"Причина: Жалоба от участника чата"
             
-            await self.bot.send_message(
-                chat_id=report["chat_id"],
-                text=notification
-            )
+            self._queue_notification(report["chat_id"], notification)
             
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=admin_id,
-                action_type=15,  # USER_MUTED
+                action_type=ActionType(15),  # USER_MUTED
                 action_data={
                     "target_user_id": report["reported_user_id"],
                     "duration": 3600,
@@ -863,7 +1082,7 @@ class ReportsManager:
         except Exception as e:
             logger.error(f"Ошибка при муте пользователя: {e}")
     
-    async def _ban_reported_user(self, report: Dict, admin_id: int):
+    async def _ban_reported_user(self, report: aiosqlite.Row, admin_id: int):
         """Забанить пользователя из жалобы"""
         try:
             await self.bot.ban_chat_member(
@@ -871,20 +1090,17 @@ class ReportsManager:
                 user_id=report["reported_user_id"]
             )
             
-            # Уведомление в чат
+            # Уведомление в чат (через очередь отправки)
             notification = f"🚫 Пользователь был забанен.\n"
             notification += f"Причина: Жалоба от участника чата"
             
-            await self.bot.send_message(
-                chat_id=report["chat_id"],
-                text=notification
-            )
+            self._queue_notification(report["chat_id"], notification)
             
             # Логирование
             security = self.admin_system.security
-            await security.log_action(
+            security.log_action_buffered(
                 user_id=admin_id,
-                action_type=2,  # USER_BLOCKED
+                action_type=ActionType(2),  # USER_BLOCKED
                 action_data={
                     "target_user_id": report["reported_user_id"],
                     "reason": "report",
@@ -898,94 +1114,73 @@ class ReportsManager:
     
     async def get_report_stats(self, days: int = 7) -> Dict[str, Any]:
         """Получить статистику по жалобам"""
-        from .database import DatabaseManager
-        
         db = DatabaseManager.get_instance()
         
         start_date = datetime.now() - timedelta(days=days)
         
-        # Общая статистика
+        # Вся статистика одним запросом: строки различаются по kind
+        # (overall - общие счетчики, type - по типам, user - топ нарушителей)
         cursor = await db.connection.execute(
             f"""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
-                SUM(CASE WHEN status = 'resolved' THEN 1 ELSE 0 END) as resolved,
-                SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END) as rejected,
-                SUM(CASE WHEN status = 'duplicate' THEN 1 ELSE 0 END) as duplicate
-            FROM {db.get_table_name('reports')}
-            WHERE created_at >= ? AND bot_id = ?
+            WITH period AS (
+                SELECT status, report_type, reported_user_id, created_at, handled_at
+                FROM {db.get_table_name('reports')}
+                WHERE created_at >= ? AND bot_id = ?
+            )
+            SELECT 'overall' AS kind, NULL AS key, COUNT(*) AS count,
+                SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) AS pending,
+                SUM(CASE WHEN status = 'resolved' THEN 1 ELSE 0 END) AS resolved,
+                SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END) AS rejected,
+                SUM(CASE WHEN status = 'duplicate' THEN 1 ELSE 0 END) AS duplicate,
+                AVG(CASE WHEN status = 'resolved' AND handled_at IS NOT NULL
+                    THEN julianday(handled_at) - julianday(created_at) END) * 24 * 60 AS avg_minutes
+            FROM period
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'type', report_type, COUNT(*) AS count, NULL, NULL, NULL, NULL, NULL
+                FROM period
+                GROUP BY report_type
+                ORDER BY count DESC
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'user', reported_user_id, COUNT(*) AS count, NULL, NULL, NULL, NULL, NULL
+                FROM period
+                GROUP BY reported_user_id
+                ORDER BY count DESC
+                LIMIT 10
+            )
             """,
             (start_date.isoformat(), self.admin_system.config.bot_id)
         )
         
-        row = await cursor.fetchone()
+        rows = await cursor.fetchall()
         await cursor.close()
         
-        stats = dict(row) if row else {}
-        
-        # Статистика по типам
-        type_cursor = await db.connection.execute(
-            f"""
-            SELECT report_type, COUNT(*) as count
-            FROM {db.get_table_name('reports')}
-            WHERE created_at >= ? AND bot_id = ?
-            GROUP BY report_type
-            ORDER BY count DESC
-            """,
-            (start_date.isoformat(), self.admin_system.config.bot_id)
-        )
-        
-        stats["by_type"] = {}
-        async for row in type_cursor:
-            stats["by_type"][row["report_type"]] = row["count"]
-        
-        await type_cursor.close()
-        
-        # Топ пользователей по жалобам
-        user_cursor = await db.connection.execute(
-            f"""
-            SELECT reported_user_id, COUNT(*) as report_count
-            FROM {db.get_table_name('reports')}
-            WHERE created_at >= ? AND bot_id = ?
-            GROUP BY reported_user_id
-            ORDER BY report_count DESC
-            LIMIT 10
-            """,
-            (start_date.isoformat(), self.admin_system.config.bot_id)
-        )
-        
-        stats["top_reported"] = []
-        async for row in user_cursor:
-            stats["top_reported"].append({
-                "user_id": row["reported_user_id"],
-                "count": row["report_count"]
-            })
-        
-        await user_cursor.close()
-        
-        # Среднее время обработки
-        time_cursor = await db.connection.execute(
-            f"""
-            SELECT 
-                AVG(julianday(handled_at) - julianday(created_at)) * 24 * 60 as avg_minutes
-            FROM {db.get_table_name('reports')}
-            WHERE status = 'resolved' AND handled_at IS NOT NULL 
-            AND created_at >= ? AND bot_id = ?
-            """,
-            (start_date.isoformat(), self.admin_system.config.bot_id)
-        )
-        
-        row = await time_cursor.fetchone()
-        await time_cursor.close()
-        
-        stats["avg_resolution_time"] = row["avg_minutes"] if row and row["avg_minutes"] else 0
+        stats = {"by_type": {}, "top_reported": [], "avg_resolution_time": 0}
+        for row in rows:
+            if row["kind"] == "overall":
+                stats.update(
+                    total=row["count"],
+                    pending=row["pending"],
+                    resolved=row["resolved"],
+                    rejected=row["rejected"],
+                    duplicate=row["duplicate"],
+                    avg_resolution_time=row["avg_minutes"] or 0
+                )
+            elif row["kind"] == "type":
+                stats["by_type"][row["key"]] = row["count"]
+            else:
+                stats["top_reported"].append({"user_id": row["key"], "count": row["count"]})
         
         return stats
     
     def _add_to_cache(self, report_id: int, report_data: Dict):
         """Добавить жалобу в кэш"""
-        self._reports_cache[report_id] = report_data
+        now = time.monotonic()
+        self._reports_cache[report_id] = (now, report_data)
+        self._reports_cache.move_to_end(report_id)
+        self._evict_reports_cache(now)
         
         # Добавление в кэш пользователя
         reporter_id = report_data.get("reporter_id")
@@ -1001,32 +1196,54 @@ class ReportsManager:
                 self._user_reports_cache[reported_user_id] = []
             self._user_reports_cache[reported_user_id].append(report_id)
     
+    def _evict_reports_cache(self, now: float):
+        """Выбросить из начала LRU истекшие записи и всё сверх _reports_cache_max_size"""
+        while self._reports_cache:
+            report_id, (cached_at, report_data) = next(iter(self._reports_cache.items()))
+            if (len(self._reports_cache) <= self._reports_cache_max_size
+                    and now - cached_at < self._reports_cache_ttl):
+                break
+            
+            self._reports_cache.popitem(last=False)
+            self._uncache_user_report(report_id, report_data.get("reporter_id"), report_data.get("reported_user_id"))
+    
+    def _uncache_user_report(self, report_id: int, *user_ids: Optional[int]):
+        """Убрать жалобу из кэша пользователей"""
+        for user_id in user_ids:
+            user_reports = self._user_reports_cache.get(user_id)
+            if user_reports and report_id in user_reports:
+                user_reports.remove(report_id)
+                if not user_reports:
+                    del self._user_reports_cache[user_id]
+    
     async def cleanup_old_reports(self, days_to_keep: int = 30):
         """Очистка старых жалоб"""
-        from .database import DatabaseManager
-        
         db = DatabaseManager.get_instance()
         
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
         
         try:
-            # Удаление старых жалоб
-            await db.connection.execute(
+            # Удаление старых жалоб; RETURNING отдает удаленные строки для точечной очистки кэша
+            cursor = await db.connection.execute(
                 f"""
                 DELETE FROM {db.get_table_name('reports')}
-                WHERE created_at < ? AND status IN ('resolved', 'rejected', 'duplicate')
-                AND bot_id = ?
+                WHERE bot_id = ? AND status IN ('resolved', 'rejected', 'duplicate')
+                AND created_at < ?
+                RETURNING id, reporter_id, reported_user_id
                 """,
-                (cutoff_date.isoformat(), self.admin_system.config.bot_id)
+                (self.admin_system.config.bot_id, cutoff_date.isoformat())
             )
+            deleted = await cursor.fetchall()
+            await cursor.close()
             
             await db.connection.commit()
             
-            # Очистка кэша
-            self._reports_cache = {}
-            self._user_reports_cache = {}
+            # Очистка кэша - только удаленные жалобы
+            for row in deleted:
+                self._reports_cache.pop(row["id"], None)
+                self._uncache_user_report(row["id"], row["reporter_id"], row["reported_user_id"])
             
-            logger.info(f"Очищены старые жалобы (старше {days_to_keep} дней)")
+            logger.info(f"Очищено {len(deleted)} старых жалоб (старше {days_to_keep} дней)")
             
         except Exception as e:
             logger.error(f"Ошибка при очистке старых жалоб: {e}")
\ No newline at end of file
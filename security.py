@@ -4,6 +4,7 @@ from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import asyncio
+import logging
 from functools import wraps
 
 from aiogram import Bot
@@ -12,6 +13,8 @@ from aiogram.types import User as TelegramUser
 from .config import AdminLevel, ChatAdminLevel, SecurityConfig
 from .models import BotAdmin, ChatAdmin, User, Chat, ActionLog, ActionType
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class Permission:
     """Разрешение системы"""
@@ -91,8 +94,13 @@ class SecurityManager:
         self.bot_id = bot_id
         
         # Кэш для проверки прав
-        self._admin_cache: Dict[int, BotAdmin] = {}
-        self._chat_admin_cache: Dict[Tuple[int, int], ChatAdmin] = {}
+        self._admin_cache: Dict[Tuple[int, int], BotAdmin] = {}
+        self._chat_admin_cache: Dict[Tuple[int, int, int], ChatAdmin] = {}
+        
+        # Индексы ключей кэша для clear_cache без перебора всего кэша
+        self._admin_keys_by_user: Dict[int, Set[Tuple[int, int]]] = {}
+        self._chat_admin_keys_by_chat: Dict[int, Set[Tuple[int, int, int]]] = {}
+        self._chat_admin_keys_by_user: Dict[int, Set[Tuple[int, int, int]]] = {}
         
         # Троттлинг
         self._throttle_data: Dict[int, List[float]] = {}
@@ -101,6 +109,11 @@ class SecurityManager:
         # Сессии
         self._sessions: Dict[int, Dict] = {}
         
+        # Буфер логов для горячих путей: пишется пачками (action_log_writer_task)
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=10000)
+        self._log_batch_size = 256
+        self._log_flush_interval = 0.5  # секунды
+        
     async def check_bot_admin(self, user_id: int, bot_id: Optional[int] = None) -> Optional[BotAdmin]:
         """Проверить, является ли пользователь админом бота"""
         from .database import DatabaseManager
@@ -118,6 +131,7 @@ class SecurityManager:
         
         if admin:
             self._admin_cache[cache_key] = admin
+            self._admin_keys_by_user.setdefault(user_id, set()).add(cache_key)
         
         return admin
     
@@ -135,6 +149,8 @@ class SecurityManager:
                 # Удалить просроченного админа
                 await db.remove_chat_admin(chat_id, user_id, bot_id)
                 del self._chat_admin_cache[cache_key]
+                self._chat_admin_keys_by_chat.get(chat_id, set()).discard(cache_key)
+                self._chat_admin_keys_by_user.get(user_id, set()).discard(cache_key)
                 return None
             return admin
         
@@ -144,6 +160,8 @@ class SecurityManager:
         
         if admin and not admin.is_expired:
             self._chat_admin_cache[cache_key] = admin
+            self._chat_admin_keys_by_chat.setdefault(chat_id, set()).add(cache_key)
+            self._chat_admin_keys_by_user.setdefault(user_id, set()).add(cache_key)
             return admin
         
         return None
@@ -265,6 +283,49 @@ class SecurityManager:
         db = DatabaseManager.get_instance()
         await db.add_action_log(log)
     
+    def log_action_buffered(
+        self,
+        user_id: int,
+        action_type: ActionType,
+        action_data: Dict,
+        chat_id: Optional[int] = None
+    ):
+        """Логирование действия без ожидания БД (запись уходит пачкой в фоне).
+        
+        Если запись в БД не успевает за потоком и буфер полон, лог отбрасывается.
+        """
+        try:
+            self._log_queue.put_nowait(ActionLog(
+                user_id=user_id,
+                chat_id=chat_id,
+                action_type=action_type,
+                action_data=action_data,
+                bot_id=self.bot_id
+            ))
+        except asyncio.QueueFull:
+            logger.warning(f"Буфер логов переполнен, лог действия {action_type} отброшен")
+    
+    async def flush_action_logs(self):
+        """Записать буфер логов пачками по _log_batch_size"""
+        from .database import DatabaseManager
+        
+        db = DatabaseManager.get_instance()
+        while not self._log_queue.empty():
+            batch = []
+            while len(batch) < self._log_batch_size and not self._log_queue.empty():
+                batch.append(self._log_queue.get_nowait())
+            await db.add_action_logs(batch)
+    
+    async def action_log_writer_task(self):
+        """Фоновая задача: сброс буфера логов каждые _log_flush_interval секунд"""
+        while True:
+            try:
+                await self.flush_action_logs()
+            except Exception as e:
+                logger.error(f"Ошибка при записи логов действий: {e}")
+            
+            await asyncio.sleep(self._log_flush_interval)
+    
     async def check_ip_ban(self, ip_address: str) -> bool:
         """Проверка IP на бан"""
         # Здесь можно интегрировать с внешними сервисами
@@ -275,23 +336,19 @@ class SecurityManager:
         """Очистка кэша"""
         if user_id:
             # Очистка кэша для конкретного пользователя
-            keys_to_remove = []
-            for key in self._admin_cache:
-                if key[0] == user_id:
-                    keys_to_remove.append(key)
+            for key in self._admin_keys_by_user.pop(user_id, ()):
+                self._admin_cache.pop(key, None)
             
-            for key in keys_to_remove:
-                del self._admin_cache[key]
+            # Права админа в чатах тоже принадлежат пользователю
+            for key in self._chat_admin_keys_by_user.pop(user_id, ()):
+                self._chat_admin_cache.pop(key, None)
+                self._chat_admin_keys_by_chat.get(key[1], set()).discard(key)
         
         if chat_id:
             # Очистка кэша для конкретного чата
-            keys_to_remove = []
-            for key in self._chat_admin_cache:
-                if key[1] == chat_id:
-                    keys_to_remove.append(key)
-            
-            for key in keys_to_remove:
-                del self._chat_admin_cache[key]
+            for key in self._chat_admin_keys_by_chat.pop(chat_id, ()):
+                self._chat_admin_cache.pop(key, None)
+                self._chat_admin_keys_by_user.get(key[0], set()).discard(key)
     
     def get_all_permissions(self) -> Dict[str, Permission]:
         """Получить все разрешения системы"""